@@ -0,0 +1,58 @@
+"""
+Benchmark of the import time of the wrapper modules.
+
+Every module is imported in a fresh interpreter, so the numbers include all transitive imports. Additionally, it is
+checked that none of the Windows automation modules are pulled in by the import.
+
+Usage: python benchmarks/bench_import.py [repetitions]
+"""
+
+import os
+import os.path
+import subprocess
+import sys
+
+
+MODULES = ['nanowrite_log', 'nanowrite_gwl', 'nanowrite_estimator', 'nanowrite_jobs', 'nanowrite_progress',
+           'nanowrite_staging', 'nanowrite_trace', 'nanowrite_client', 'nanowrite', 'nanowrite_server']
+
+BACKEND_MODULES = ['pywinauto', 'win32clipboard', 'win32con', 'winpaths']
+
+_SNIPPET = """
+import sys, time
+start = time.time()
+import %s
+duration = time.time() - start
+loaded = [name for name in %r if name in sys.modules]
+sys.stdout.write('%%f %%s' %% (duration, ','.join(loaded)))
+"""
+
+
+def measure(module, repetitions):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    durations = []
+    loaded = ''
+    for _ in range(repetitions):
+        output = subprocess.check_output([sys.executable, '-c', _SNIPPET % (module, BACKEND_MODULES)], cwd=root)
+        duration, _, loaded = output.decode('ascii').partition(' ')
+        durations.append(float(duration))
+    return min(durations), loaded
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+    for module in MODULES:
+        try:
+            duration, loaded = measure(module, repetitions)
+        except subprocess.CalledProcessError:
+            print('%-22s import failed' % module)
+            failed = True
+            continue
+        print('%-22s %8.2f ms  %s' % (module, duration * 1000, 'backend loaded: ' + loaded if loaded else ''))
+        failed = failed or bool(loaded)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark of a recorded trace of the interaction with NanoWrite.
+
+The recorded actions are run by a wrapper, whose user interface and log are replayed from the trace. The wrapper
+records the replay into a new trace again, so the replay includes the cost of tracing, e.g. hashing and compressing
+the screenshots. The report compares the time spent per action during the recording and the replay, and the size of
+the re-recorded trace.
+
+The benchmark fails if an action fails differently than during the recording, or if the wrapper calls the backend
+differently than recorded.
+
+Usage: python benchmarks/bench_replay.py trace.jsonl.gz [--fast]
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_trace
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        sys.exit(2)
+
+    realtime = '--fast' not in sys.argv[2:]
+    trace = nanowrite_trace.Trace(sys.argv[1])
+
+    # The glyph set learned during the replay must not end up in the data directory of the user
+    work_dir = tempfile.mkdtemp()
+    path = os.path.join(work_dir, 'replay.jsonl.gz')
+    try:
+        report = nanowrite_trace.replay(trace, realtime=realtime, record=path, data_dir=work_dir)
+        size = os.path.getsize(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print('%-30s %6s %12s %12s' % ('action', 'calls', 'recorded', 'replayed'))
+    for method, stats in sorted(report['actions'].items()):
+        print('%-30s %6d %9.2f ms %9.2f ms' % (method, stats['count'], stats['recorded_time'] * 1000,
+                                                stats['time'] * 1000))
+    print('%-30s %6s %10.2f s %10.2f s' % ('total', '', report['recorded_duration'], report['duration']))
+    print('re-recorded trace: %d bytes (original %d bytes)' % (size, os.path.getsize(sys.argv[1])))
+    print('backend calls: %d, unmatched: %d' % (sum(report['backend_calls'].values()), report['unmatched_calls']))
+    print('mismatched actions: %d' % report['mismatches'])
+
+    if report['mismatches'] > 0 or report['unmatched_calls'] > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,27 @@
 Simple wrapper class around the NanoWrite software.
 
 This class was intentionally implemented to be as simple as possible to allow easy distribution.
-Currently, the only dependency not included in standard python is pywinauto.
+Currently, the only dependency not included in standard python is pywinauto. It is only imported by the backend
+(see nanowrite_backend), once a NanoWrite instance is created.
 """
 
-import tempfile
-import shutil
+import contextlib
+import functools
+import hashlib
+import threading
 import time
-import datetime
 import os
 import os.path
 import re
 
-import pywinauto
-import pywinauto.clipboard
-import winpaths
+import nanowrite_artifacts
+import nanowrite_estimator
+import nanowrite_gwl
+import nanowrite_jobs
+import nanowrite_log
+import nanowrite_progress
+import nanowrite_staging
+import nanowrite_trace
 
 
 PATH = r"C:\Program Files\Nanoscribe\NanoWrite\NanoWrite.exe"
@@ -53,6 +60,15 @@ SETTINGS = {
             # Some pixel definitions
             'finished_pixel': (641, 608),
             'inverted_z_axis_pixel': (960, 408)
+        },
+        'ocr': {
+            # Region of the text fields relative to their positions as (left, top, right, bottom)
+            'field_box': (-45, -8, 45, 8),
+            # Glyph set of the field font in the data directory. It is learned while reading the fields.
+            'glyph_file': 'glyphs-1.7.1.npz',
+            'min_confidence': 0.9,
+            # Minimal lead of the best over the second best glyph of every character
+            'min_margin': 0.05
         }
     },
     '1.7.5': {
@@ -87,11 +103,87 @@ SETTINGS = {
             # Some pixel definitions
             'finished_pixel': (641, 608),
             'inverted_z_axis_pixel': (960, 408)
+        },
+        'ocr': {
+            # Region of the text fields relative to their positions as (left, top, right, bottom)
+            'field_box': (-45, -8, 45, 8),
+            # Glyph set of the field font in the data directory. It is learned while reading the fields.
+            'glyph_file': 'glyphs-1.7.5.npz',
+            'min_confidence': 0.9,
+            # Minimal lead of the best over the second best glyph of every character
+            'min_margin': 0.05
         }
     }
 }
 
 
+def get_data_dir():
+    """
+    Get the default directory for data learned at runtime, e.g. the glyph set of the text fields.
+
+    @return: Path of the directory 'nanowrite_wrapper' in the local application data directory, or of
+        ~/.nanowrite_wrapper if that is not available, e.g. when replaying a trace on another system.
+    @rtype: str
+    """
+    try:
+        import winpaths
+        return os.path.join(winpaths.get_local_appdata(), 'nanowrite_wrapper')
+    except Exception:
+        return os.path.join(os.path.expanduser('~'), '.nanowrite_wrapper')
+
+
+def _ui_action(method):
+    """
+    Decorator for methods which interact with the user interface. They must not be interleaved with each other.
+
+    While a trace is recorded, the outermost of these calls are recorded as the actions, which the replay repeats.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **nargs):
+        with self._ui_lock:
+            trace = self._trace if self._ui_depth == 0 else None
+            self._ui_depth += 1
+            start = time.time()
+            error = None
+            try:
+                return method(self, *args, **nargs)
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+                raise
+            finally:
+                self._ui_depth -= 1
+                if trace is not None:
+                    trace.record_action(start, time.time() - start, method.__name__, args, nargs, error)
+    return wrapper
+
+
+def _parse_duration(text):
+    """
+    Convert a duration like '1:02:03' into seconds.
+
+    @raise ValueError: Raised if the text is no duration.
+    """
+    hours, minutes, seconds = [float(x) for x in text.split(':')]
+    return hours * 60 * 60 + minutes * 60 + seconds
+
+
+TABS = ('advanced_settings', 'camera', 'graph')
+
+# Time in seconds LabView may take to redraw the tab headers after a click
+TAB_REDRAW_TIMEOUT = 0.5
+
+# Characters of the numeric text fields, which must all be known before the fields are read from the screen
+NUMBER_CHARACTERS = '0123456789.-'
+DURATION_CHARACTERS = '0123456789:'
+
+# Scripts up to this size in bytes are pasted into the mini GWL window by submit_gwl
+PASTE_LIMIT = 4 * 1024
+
+# Scripts up to this size in bytes are included from a file in the mini GWL window by submit_gwl, larger ones and
+# bundles of several files are loaded as structure
+INCLUDE_LIMIT = 16 * 1024 * 1024
+
+
 class NanoWrite(object):
     class NotReady(Exception):
         pass
@@ -99,55 +191,117 @@ class NanoWrite(object):
     class ExecutionError(Exception):
         pass
 
-    def __init__(self, nanowrite_path=PATH, cache_piezo_position=True):
+    class ValidationError(Exception):
+        pass
+
+    class NotStaged(Exception):
+        pass
+
+    def __init__(self, nanowrite_path=PATH, cache_piezo_position=True, job_history=None, backend=None,
+                 artifact_root=None, artifact_quota=2 * 1024 ** 3, artifact_retention=3600.0, trace=None,
+                 log_reader=None, read_fields_from_screen=True, data_dir=None):
         """
         Constructor of the NanoWrite class.
 
         @param nanowrite_path: The path to the NanoWrite executabe.
             The path is used to find the running instance of NanoWrite.
         @type nanowrite_path: str
+
+        @param job_history: Path of the SQLite database to record all jobs in. No jobs are recorded if None.
+        @type job_history: str
+
+        @param backend: Backend for the interaction with the user interface. Defaults to a
+            nanowrite_backend.PyWinAutoBackend connected to @p nanowrite_path.
+
+        @param artifact_root: Directory for the per-job working directories. A temporary directory if None.
+        @type artifact_root: str
+
+        @param artifact_quota: Disk quota of the finished jobs' working directories in bytes.
+        @type artifact_quota: int
+
+        @param artifact_retention: Time in seconds the working directory of a finished job is kept.
+        @type artifact_retention: float
+
+        @param trace: Path of a trace file to record all interaction with the user interface in, see L{start_trace}.
+        @type trace: str
+
+        @param log_reader: Reader of the messages log. Defaults to a nanowrite_log.LogReader of the latest log file,
+            pass a nanowrite_trace.ReplayLogReader to replay a trace.
+
+        @param read_fields_from_screen: Read text fields like the piezo position from a screenshot instead of via
+            the clipboard, see L{_read_fields}. This requires numpy.
+        @type read_fields_from_screen: bool
+
+        @param data_dir: Directory for data learned at runtime, like the glyph set of the text fields. Defaults to
+            L{get_data_dir}.
+        @type data_dir: str
         """
-        self._tmpfolder = None
+        self._artifacts = None
+        self._trace = None
+        self._ui_lock = threading.RLock()
+        self._ui_depth = 0
 
-        self._pwa_app = pywinauto.application.Application()
-        self._pwa_app.connect_(path=nanowrite_path)
+        if backend is None:
+            import nanowrite_backend
+            backend = nanowrite_backend.PyWinAutoBackend(nanowrite_path)
+        self._backend = backend
 
-        self._main_dlg = self._pwa_app.window_(title_re='.*NanoWrite .+')
+        self._log_reader = log_reader if log_reader is not None else nanowrite_log.LogReader()
 
-        self._version = self._main_dlg.WindowText().split(' ')[-1]
+        self._window_title = self._backend.window_text()
+        self._version = self._window_title.split(' ')[-1]
         assert self._version in SETTINGS, 'Program version not known'
 
         self._settings = SETTINGS[self._version]
 
-        self._tmpfolder = tempfile.mkdtemp(suffix='nanowriteserver')
+        if trace is not None:
+            self.start_trace(trace)
+
+        self._artifacts = nanowrite_artifacts.ArtifactStore(artifact_root, quota=artifact_quota,
+                                                            retention=artifact_retention)
+        self._running_artifact_job = None
         self._job_running = False
+        self._last_job_error = None
+
+        # Name of the staged job -> dictionary of its 'start_path', 'digest' and 'estimate'
+        self._staged_jobs = dict()
+        self._staging_lock = threading.Lock()
+        self._staging_pipeline = None
+
+        # The tab which is currently shown and, per tab, the colors of all tab headers while it is shown
+        self._current_tab = None
+        self._tab_signatures = dict()
+        self._stay_on_advanced_settings = False
+        self._progress_sampler = None
+
+        self._job_history = nanowrite_jobs.JobHistory(job_history) if job_history is not None else None
+        self._current_job = None
+        self._current_job_phase = None
+        self._job_estimate = None
+
+        self._estimator = nanowrite_estimator.WriteTimeEstimator()
+        self._estimator_calibrated = False
 
         self._piezo_range = (300, 300, 300)
 
+        self._read_fields_from_screen = read_fields_from_screen
+        self._field_reader = None
+        self._data_dir = data_dir
+
         self._cache_piezo_position = cache_piezo_position
         self._cached_piezo_position = None
 
     def __del__(self):
-        if self._tmpfolder is not None:
-            shutil.rmtree(self._tmpfolder)
-
-    def set_dialog_foreground(self, dlg=None):
-        self._close_teamviewer_window()
-        dlg = dlg if dlg is not None else self._main_dlg
-        dlg.Restore()
-        dlg.SetFocus()
+        self.stop_progress_sampler()
+        self.stop_staging_pipeline()
+        self.stop_trace()
+        if getattr(self, '_backend', None) is not None and hasattr(self._backend, 'close'):
+            self._backend.close()
+        if self._artifacts is not None:
+            self._artifacts.close()
 
-    @staticmethod
-    def _close_teamviewer_window():
-        try:
-            pwa_app = pywinauto.application.Application()
-            pwa_app.connect_(path='teamviewer.exe')
-            sponsored_session_window = pwa_app.window_(title_re='Sponsored session')
-
-            if sponsored_session_window.Exists(timeout=0, retry_interval=0):
-                sponsored_session_window['OK'].Click()
-        except Exception:
-            pass
+    def set_dialog_foreground(self):
+        self._backend.set_foreground()
 
     def get_piezo_range(self):
         return self._piezo_range
@@ -162,42 +316,15 @@ class NanoWrite(object):
         """
         Returns the current log since the start of the NanoWrite program.
 
-        @note:
-            This script assumes that the latest log file in %localappdata%\Nanoscribe\Messages
-            contains all the recent logs since the program started.
-
+        @see: L{nanowrite_log.get_current_log}
 
         @return: List of two elements lists, containing a datetime object and the log message.
             The latest log message is the last element of the list.
         @rtype: list
         """
-        msgs_dir_path = os.path.join(winpaths.get_local_appdata(), 'Nanoscribe\Messages')
-        assert os.path.exists(msgs_dir_path), 'NanoWrite messages log path does not exist'
-
-        # Get the most recent log file name
-        # FIXME: This fails if there are other file names than '2013-07-08_16-17-00_Messages.log'
-        log_file_name = os.listdir(msgs_dir_path)[-1]
-
-        f = open(os.path.join(msgs_dir_path, log_file_name), 'r')
-
-        results = list()
-        for line in f.readlines():
-            if len(line) <= 30:
-                continue
-            line = line.decode('latin-1')
-            timestamp_txt = line[:28]
-            msg_txt = line[29:]
-
-            if len(timestamp_txt.strip()) == 0:
-                assert len(results) > 0, 'No previous timestamp available in log file'
-                results[-1][1] += msg_txt
-            else:
-                # FIXME: Don't ignore time zone offset here
-                timestamp_struct = time.strptime(timestamp_txt[:19], '%Y-%m-%dT%H:%M:%S')
-                timestamp = datetime.datetime.fromtimestamp(time.mktime(timestamp_struct))
-                results.append([timestamp, msg_txt])
-        return results
+        return nanowrite_log.get_current_log()
 
+    @_ui_action
     def execute_mini_gwl(self, commands, execute=True, append_safeguard=True, invalidate_piezo=True):
         """
         Execute gwl commands by inserting them into the mini gwl window.
@@ -215,40 +342,46 @@ class NanoWrite(object):
         if not self.has_finished():
             raise NanoWrite.NotReady()
 
+        digest = None
+        if self._job_history is not None:
+            data = commands.encode('utf-8') if isinstance(commands, nanowrite_gwl.text_type) else commands
+            digest = hashlib.sha1(data).hexdigest()
+        job_estimate = self._analyze_job(digest, 'mini', nanowrite_gwl.chain_resolvers(
+            nanowrite_gwl.dict_resolver({'mini': commands}), nanowrite_gwl.file_resolver()))
+
         # Append a safeguard, this way the "done." of the last command does not bother us.
         # Also insert a wait command to force a progress bar.
-        commands = 'MessageOut ***Separator***\n' + commands + '\nwait 0.01'
+        commands = nanowrite_gwl.add_safeguard(commands)
 
         # Make sure that the correct dialog has the focus
         self.set_dialog_foreground()
 
         # Go to advanced settings tab and click into text field
-        self._main_dlg.ClickInput(coords=self._settings['positions']['advanced_settings'])
-        self._main_dlg.ClickInput(coords=self._settings['positions']['advanced_settings_textfield'])
+        self._show_tab('advanced_settings')
+        self._backend.click(self._settings['positions']['advanced_settings_textfield'])
 
         # Select all and delete existing text
         # We do this be going to the end of existing input by CTRL+END
         # Select all existing text upwards via SHIFT+CTRL+HOME
         # Delete the text via DEL
-        self._main_dlg.TypeKeys('^{END}')
-        self._main_dlg.TypeKeys('+^{HOME}')
-        self._main_dlg.TypeKeys('{DEL}')
+        self._backend.type_keys('^{END}')
+        self._backend.type_keys('+^{HOME}')
+        self._backend.type_keys('{DEL}')
 
-        import win32clipboard
-        import win32con
-        win32clipboard.OpenClipboard()
-        win32clipboard.SetClipboardData(win32con.CF_TEXT, commands)
-        win32clipboard.CloseClipboard()
-        self._main_dlg.TypeKeys('^v')
+        self._backend.set_clipboard_text(commands)
+        self._backend.type_keys('^v')
 
         # And execute command if asked for
         if execute:
-            self._main_dlg.ClickInput(coords=self._settings['positions']['advanced_settings_submit'])
+            self._backend.click(self._settings['positions']['advanced_settings_submit'])
 
             self._job_running = True
+            self._job_estimate = job_estimate
+            self._begin_job('mini', digest, phase='running')
 
             # Switch to camera view, since there might be something of interest there and it does not hurt us
-            self.show_camera()
+            if not self._stay_on_advanced_settings:
+                self.show_camera()
 
             # Wait for the log to refresh
             time.sleep(1.0)
@@ -259,63 +392,218 @@ class NanoWrite(object):
     def get_command_log(self):
         # Get log of the last command command
         # This assumes the use of the separator.
-        cmd_log = list()
-        for timestamp, msg in reversed(self.get_current_log()):
-            cmd_log.append((timestamp, msg))
-            if '***Separator***' in msg:
-                break
+        return [(timestamp, msg) for timestamp, msg in self._log_reader.get_entries_from_last(nanowrite_gwl.SEPARATOR)]
+
+    def get_log_since(self, cursor='', max_entries=1000):
+        """
+        Get only the log entries which are new since the last call.
 
-        return reversed(cmd_log)
+        This is much cheaper than L{get_current_log} for polling clients. The last entry of the log is always
+        returned again, since it might still grow by continuation lines.
 
-    def load_gwl_file(self, file_path, abort_calculating_time=False):
+        @param cursor: The cursor returned by the last call, '' to start at the beginning of the log.
+        @type cursor: str
+
+        @param max_entries: Maximal number of returned entries.
+        @type max_entries: int
+
+        @return: Dictionary with the keys 'log_id', 'start' (index of the first returned entry), 'entries',
+            'cursor' (cursor for the next call), 'total' (number of entries) and 'reset' (True if the entries of
+            previous calls belong to another log file and must be dropped).
+        @rtype: dict
+        """
+        return self._log_reader.get_since(cursor, max_entries)
+
+    def get_log_page(self, offset=0, limit=100):
+        """
+        Get a page of the log history.
+
+        @param offset: Index of the first entry, negative values count from the end of the log.
+        @type offset: int
+
+        @param limit: Maximal number of returned entries.
+        @type limit: int
+
+        @return: Dictionary with the keys 'log_id', 'offset' (index of the first returned entry), 'entries' and
+            'total' (number of entries).
+        @rtype: dict
+        """
+        total = self._log_reader.update()
+        if offset < 0:
+            offset = max(0, total + offset)
+        entries = self._log_reader.get_entries(offset, offset + limit, update=False)
+        return {'log_id': self._log_reader.get_log_id(), 'offset': offset, 'entries': entries, 'total': total}
+
+    @_ui_action
+    def load_gwl_file(self, file_path, abort_calculating_time=False, digest=None):
         """
         Load a GWL file from a given path. The file is not automatically executed. Use @p start_dlw for this.
 
         @param file_path: Path to GWL file.
         @type file_path: str
 
+        @param digest: Content hash of the GWL bundle for the job history. Computed from the file if not given.
+        @type digest: str
+
         @rtype: None
         """
         if not self.has_finished():
             raise NanoWrite.NotReady()
 
+        if digest is None and self._job_history is not None:
+            hasher = hashlib.sha1()
+            with open(file_path, 'rb') as f:
+                for chunk in nanowrite_gwl.iter_chunks(f):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+
         # Make sure that the correct dialog has the focus
         self.set_dialog_foreground()
 
         # Go to advanced settings tab and click into text field
-        self._main_dlg.ClickInput(coords=self._settings['positions']['load_structure'])
+        self._backend.click(self._settings['positions']['load_structure'])
 
-        while True:
-            try:
-                time.sleep(0.5)
-                open_dlg = self._pwa_app['Open file']
-                time.sleep(0.5)
-                open_dlg['Edit'].SetEditText(file_path)
-                if open_dlg['Edit'].TextBlock() != file_path:
-                    continue
-
-                #open_dlg['Open'].Click()
-                time.sleep(0.5)
-                open_dlg.TypeKeys('{ENTER}')
-                break
-            except Exception:
-                continue
+        while not self._backend.enter_file_in_open_dialog(file_path):
+            pass
 
         # Sleep some time, to allow the progress bar to update
         time.sleep(1.0)
         self._job_running = True
+        self._begin_job('file', digest, name=os.path.basename(file_path), phase='loading')
         self.wait_until_finished(abort_calculating_time=abort_calculating_time)
 
-    def show_camera(self):
+    def _get_tab_signature(self):
+        """
+        @return: The colors of all tab headers or None if the pixels can not be probed.
+        @rtype: tuple
+        """
+        try:
+            return tuple(self._backend.get_pixel(self._settings['positions'][tab]) for tab in TABS)
+        except Exception:
+            return None
+
+    @_ui_action
+    def _show_tab(self, tab):
         """
-        Switch to the camera view.
+        Switch to a tab, unless it is already shown.
+
+        The tracked tab is verified by comparing the colors of the tab headers with the ones probed right after the
+        tab was clicked, see L{_learn_tab_signature}. If the user switched the tab in the meantime, the headers differ
+        and the tab is clicked again. Without known colors the tab is always clicked.
+
+        @param tab: One of L{TABS}.
+        @type tab: str
         """
+        if self._current_tab == tab:
+            known_signature = self._tab_signatures.get(tab)
+            if known_signature is not None and self._get_tab_signature() == known_signature:
+                return
+
         # Make sure that the correct dialog has the focus
         self.set_dialog_foreground()
+        previous_signature = self._get_tab_signature()
+        self._backend.click(self._settings['positions'][tab])
 
-        # Go to advanced settings tab and click into text field
-        self._main_dlg.ClickInput(coords=self._settings['positions']['camera'])
+        self._current_tab = tab
+        self._tab_signatures.pop(tab, None)
+        self._learn_tab_signature(tab, previous_signature)
+
+    def _learn_tab_signature(self, tab, previous_signature):
+        """
+        Probe the colors of the tab headers after a tab has been clicked.
+
+        The colors are only learned once they are stable and differ from the ones of all other tabs. While they still
+        equal the colors before the click, LabView might not have redrawn the tab yet, so they are only accepted after
+        L{TAB_REDRAW_TIMEOUT}. If nothing is learned, the tab is clicked again the next time.
 
+        @param previous_signature: The colors of the tab headers before the click.
+        @type previous_signature: tuple
+        """
+        other_signatures = [signature for other, signature in self._tab_signatures.items() if other != tab]
+        deadline = time.time() + TAB_REDRAW_TIMEOUT
+        last_signature = None
+        while True:
+            signature = self._get_tab_signature()
+            if signature is None:
+                return
+            timeout = time.time() >= deadline
+            if (signature == last_signature and signature not in other_signatures and
+                    (signature != previous_signature or timeout)):
+                self._tab_signatures[tab] = signature
+                return
+            if timeout:
+                return
+            last_signature = signature
+            time.sleep(0.05)
+
+    def invalidate_view_state(self):
+        """
+        Forget which tab is shown, the next tab switch will click in any case.
+        """
+        self._current_tab = None
+
+    def start_trace(self, path):
+        """
+        Record every interaction with the user interface and all read log data into a trace file.
+
+        The trace can be replayed without NanoWrite with nanowrite_trace.replay, e.g. to profile the wrapper.
+
+        @param path: Path of the trace file, usually ending with .jsonl.gz
+        @type path: str
+        """
+        self.stop_trace()
+        with self._ui_lock:
+            self._trace = nanowrite_trace.TraceWriter(path)
+            self._backend = nanowrite_trace.RecordingBackend(self._backend, self._trace)
+            self._log_reader.trace = self._trace
+            # The replay starts with a new wrapper, which reads the window title first
+            self._trace.record_call(time.time(), 0.0, 'window_text', (), self._window_title)
+
+    def stop_trace(self):
+        """
+        Stop recording the trace started with L{start_trace}.
+        """
+        if getattr(self, '_trace', None) is None:
+            return
+        with self._ui_lock:
+            self._log_reader.trace = None
+            self._backend = self._backend.backend
+            self._trace.close()
+            self._trace = None
+
+    def set_stay_on_advanced_settings(self, state):
+        """
+        Stay on the advanced settings tab after executing mini GWL commands instead of switching to the camera.
+
+        This saves a click and a redraw per command during command-heavy bursts.
+
+        @param state: True to stay on the advanced settings tab.
+        @type state: bool
+        """
+        self._stay_on_advanced_settings = state
+
+    @contextlib.contextmanager
+    def stay_on_advanced_settings(self):
+        """
+        Context manager which stays on the advanced settings tab for all mini GWL commands executed within.
+
+        @see: L{set_stay_on_advanced_settings}
+        """
+        previous = self._stay_on_advanced_settings
+        self._stay_on_advanced_settings = True
+        try:
+            yield
+        finally:
+            self._stay_on_advanced_settings = previous
+
+    @_ui_action
+    def show_camera(self):
+        """
+        Switch to the camera view, unless it is already shown.
+        """
+        self._show_tab('camera')
+
+    @_ui_action
     def start_dlw(self, invalidate_piezo=True):
         """
         Start writing the loaded DLW file.
@@ -329,17 +617,100 @@ class NanoWrite(object):
         self.set_dialog_foreground()
 
         # Go to advanced settings tab and click into text field
-        self._main_dlg.ClickInput(coords=self._settings['positions']['start_dlw'])
+        self._backend.click(self._settings['positions']['start_dlw'])
 
         # Show camera for progress
         self.show_camera()
 
         self._job_running = True
+        self._job_estimate = None
+        if self._current_job is not None and self._current_job_phase == 'loaded':
+            self._current_job_phase = 'running'
+            self._job_history.mark_started(self._current_job)
+        else:
+            self._begin_job('dlw', phase='running')
+
         if invalidate_piezo:
             self.invalidate_piezo_position()
 
+    def submit_gwl(self, gwl, start_name='job.gwl', readback_files=None, invalidate_piezo=True, wait=False,
+                   paste_limit=PASTE_LIMIT, include_limit=INCLUDE_LIMIT):
+        """
+        Submit GWL commands the fastest way depending on their size.
+
+        - Small scripts are pasted into the mini GWL window.
+        - Medium scripts are written to a file, which is included by a command pasted into the mini GWL window.
+        - Large scripts and bundles of several files are loaded as structure, see L{execute_complex_gwl_files}.
+
+        @param gwl: Either the GWL script as string, iterable of lines or file-like object, or a dictionary of several
+            GWL files as for L{execute_complex_gwl_files}.
+        @type gwl: str, dict
+
+        @param start_name: Name of the executed file, if @p gwl is a dictionary.
+        @type start_name: str
+
+        @param readback_files: List of generated files to read back. Scripts with files to read back are always
+            loaded as structure.
+        @type readback_files: list, tuple
+
+        @param wait: Wait until the job has finished.
+        @type wait: bool
+
+        @return: Dictionary with the chosen 'path' ('paste', 'include' or 'load'), the 'size' of the script in
+            bytes, the 'duration' of the call in seconds and the read back 'results'.
+        @rtype: dict
+        """
+        start_time = time.time()
+        results = {}
+
+        if isinstance(gwl, nanowrite_gwl.string_types) and len(gwl) <= paste_limit and readback_files is None:
+            path, size = 'paste', len(gwl)
+            self.execute_mini_gwl(gwl, invalidate_piezo=invalidate_piezo)
+        elif not isinstance(gwl, dict):
+            # Stream the script into a file first, this way its size is known
+            artifact_job, job_folder = self._artifacts.create_job('include')
+            file_name = os.path.basename(start_name)
+            file_path = os.path.join(job_folder, file_name)
+            hasher = hashlib.sha1()
+            try:
+                size = nanowrite_gwl.write_gwl_file(file_path, gwl, hasher=hasher)
+            except Exception:
+                self._artifacts.release(artifact_job)
+                raise
+
+            if size <= include_limit and readback_files is None:
+                path = 'include'
+                try:
+                    self.execute_mini_gwl('include %s' % file_path, invalidate_piezo=invalidate_piezo)
+                except Exception:
+                    self._artifacts.release(artifact_job)
+                    raise
+                self._set_running_artifact_job(artifact_job)
+            else:
+                # Load the written file as it is via a small start file, instead of writing it into a second folder
+                path = 'load'
+                load_name = 'load_%s' % file_name
+                try:
+                    start_path = os.path.join(job_folder, load_name)
+                    nanowrite_gwl.write_gwl_file(start_path, 'include %s' % file_name, safeguard=True, hasher=hasher)
+                    self._register_staged_job(artifact_job, job_folder, load_name, start_path, hasher.hexdigest())
+                except Exception:
+                    self._artifacts.release(artifact_job)
+                    raise
+                results = self._execute_staged_job(artifact_job, readback_files, invalidate_piezo=invalidate_piezo)
+        else:
+            path, size = 'load', None
+            # Not execute_complex_gwl_files, which NanoWriteRPC overwrites to encode the results
+            stage_id = self.stage_gwl_files(start_name, gwl)
+            results = self._execute_staged_job(stage_id, readback_files, invalidate_piezo=invalidate_piezo)
+
+        if wait:
+            self.wait_until_finished()
+
+        return {'path': path, 'size': size, 'duration': time.time() - start_time, 'results': results}
+
     def execute_complex_gwl_files(self, start_name, gwl_files, readback_files=None, invalidate_piezo=True,
-                                  abort_calculating_time=False):
+                                  abort_calculating_time=False, validate=True):
         """
         Execute a set of possibly several GLW files and read back generated output files.
 
@@ -350,67 +721,319 @@ class NanoWrite(object):
         @type start_name: str
 
         @param gwl_files: Dictionary containing the GLW files. Where the key is the filename and the value is the
-         content of the file.
+         content of the file. The content may be a string, an iterable of lines (e.g. a generator) or a file-like
+         object. Iterables and file-like objects are streamed into the job folder in chunks.
         @type gwl_files: dict
 
         @param readback_files: List of generated files to read back. In most cases these will be pictures.
         @type readback_files: list, tuple
 
+        @param validate: Validate the files before they are loaded, see L{validate_gwl_files}.
+        @type validate: bool
+
         @return: Dictionary containing the files to read back in @p readback_files.
         @rtype: dict
+
+        @raise NanoWrite.ValidationError: Raised if the files are invalid or exceed the piezo range.
+        """
+        stage_id = self.stage_gwl_files(start_name, gwl_files, validate=validate)
+        return self._execute_staged_job(stage_id, readback_files, invalidate_piezo=invalidate_piezo,
+                                        abort_calculating_time=abort_calculating_time)
+
+    def stage_gwl_files(self, start_name, gwl_files, validate=True):
+        """
+        Write a set of GWL files into a new job folder and validate them, without touching the user interface.
+
+        Staging works while another job is running, so the next job is ready to be loaded as soon as the current one
+        has finished, see L{execute_staged_job} and L{queue_staged_job}.
+
+        @param start_name: Name of the executed GLW file.
+        @type start_name: str
+
+        @param gwl_files: Dictionary containing the GLW files, see L{execute_complex_gwl_files}.
+        @type gwl_files: dict
+
+        @param validate: Validate the files, see L{validate_gwl_files}.
+        @type validate: bool
+
+        @return: Name of the staged job, which is also the name of its working directory in the artifact store.
+        @rtype: str
+
+        @raise NanoWrite.ValidationError: Raised if the files are invalid or exceed the piezo range.
         """
         assert start_name in gwl_files, 'Invalid start name given'
 
-        # Append a safeguard, this way the "done." of the last command does not bother us.
-        # Also insert a wait command to force a progress bar.
-        gwl_files[start_name] = 'MessageOut ***Separator***\n' + gwl_files[start_name] + '\nwait 0.01'
+        # Every job gets its own working directory, so files of different jobs do not collide
+        artifact_job, job_folder = self._artifacts.create_job('gwl')
+        try:
+            # The separator and wait safeguard is streamed around the start file, gwl_files is not modified.
+            hasher = hashlib.sha1()
+            start_path = nanowrite_gwl.write_gwl_bundle(job_folder, start_name, gwl_files, hasher=hasher)
+            self._register_staged_job(artifact_job, job_folder, start_name, start_path, hasher.hexdigest(), validate)
+        except Exception:
+            self._artifacts.release(artifact_job)
+            raise
+        return artifact_job
+
+    def _register_staged_job(self, stage_id, job_folder, start_name, start_path, digest, validate=True):
+        """
+        Analyze and validate the GWL files written into a job folder and mark the job as staged.
 
-        for filename, content in gwl_files.items():
-            # Make sure that an attacker might not access stuff outside of out temporary folder
-            file_path = os.path.join(self._tmpfolder, os.path.basename(filename))
-            with open(file_path, 'w') as f:
-                f.write(content)
+        @raise NanoWrite.ValidationError: Raised if the files are invalid or exceed the piezo range.
+        """
+        validator = nanowrite_gwl.GWLValidator() if validate else None
+        job_estimate = self._analyze_job(digest, start_name, nanowrite_gwl.folder_resolver(job_folder),
+                                         validator=validator)
+        if validator is not None:
+            self._check_validation(validator)
 
-        self.load_gwl_file(os.path.join(self._tmpfolder, os.path.basename(start_name)),
-                           abort_calculating_time=abort_calculating_time)
-        self.wait_until_finished()
-        self.start_dlw(invalidate_piezo=invalidate_piezo)
+        with self._staging_lock:
+            self._staged_jobs[stage_id] = {'start_path': start_path, 'digest': digest, 'estimate': job_estimate}
+
+    def get_staged_jobs(self):
+        """
+        @return: Names of the staged jobs, which have not been executed yet.
+        @rtype: list
+        """
+        with self._staging_lock:
+            return sorted(self._staged_jobs)
+
+    def discard_staged_job(self, stage_id):
+        """
+        Drop a staged job without executing it.
+
+        @param stage_id: Name of the staged job as returned by L{stage_gwl_files}.
+        @type stage_id: str
+
+        @raise NanoWrite.NotStaged: Raised if the job is not staged (anymore).
+        """
+        if self._staging_pipeline is not None:
+            self._staging_pipeline.remove(stage_id)
+        with self._staging_lock:
+            staged = self._staged_jobs.pop(stage_id, None)
+        if staged is None:
+            raise NanoWrite.NotStaged('Job %s is not staged' % stage_id)
+        self._artifacts.release(stage_id)
+
+    def execute_staged_job(self, stage_id, readback_files=None, invalidate_piezo=True, abort_calculating_time=False):
+        """
+        Load and start a staged job and read back generated output files.
+
+        @note: The NanoWriteRPC class overwrites this method and encodes the binary return values with BASE64 to
+            allow marshaling in XML.
+
+        @param stage_id: Name of the staged job as returned by L{stage_gwl_files}.
+        @type stage_id: str
+
+        @param readback_files: List of generated files to read back. In most cases these will be pictures.
+        @type readback_files: list, tuple
+
+        @return: Dictionary containing the files to read back in @p readback_files.
+        @rtype: dict
+
+        @raise NanoWrite.NotStaged: Raised if the job is not staged (anymore).
+        @raise NanoWrite.NotReady: Raised if the previous job has not finished yet. The job stays staged.
+        """
+        return self._execute_staged_job(stage_id, readback_files, invalidate_piezo=invalidate_piezo,
+                                        abort_calculating_time=abort_calculating_time)
+
+    def _execute_staged_job(self, stage_id, readback_files=None, invalidate_piezo=True, abort_calculating_time=False):
+        with self._staging_lock:
+            staged = self._staged_jobs.pop(stage_id, None)
+        if staged is None:
+            raise NanoWrite.NotStaged('Job %s is not staged' % stage_id)
+
+        try:
+            self.load_gwl_file(staged['start_path'], abort_calculating_time=abort_calculating_time,
+                               digest=staged['digest'])
+        except NanoWrite.NotReady:
+            # The job stays staged
+            with self._staging_lock:
+                self._staged_jobs[stage_id] = staged
+            raise
+        except Exception:
+            self._artifacts.release(stage_id)
+            raise
+
+        try:
+            self.wait_until_finished()
+            self.start_dlw(invalidate_piezo=invalidate_piezo)
+            self._job_estimate = staged['estimate']
+            job_id = self._current_job
+
+            if readback_files is None:
+                # The working directory is released as soon as the job has finished
+                self._set_running_artifact_job(stage_id)
+                return {}
 
-        if readback_files is not None:
             time.sleep(5)
             self.wait_until_finished()
             results = dict()
+            file_paths = list()
             for filename in readback_files:
-                file_path = os.path.join(self._tmpfolder, os.path.basename(filename))
+                file_path = self._artifacts.get_path(stage_id, filename)
                 #print 'Read back:', file_path
                 with open(file_path, 'rb') as f:
                     results[filename] = f.read()
-            return results
-        return {}
+                file_paths.append(file_path)
+
+            if self._job_history is not None and job_id is not None:
+                self._job_history.add_artifacts(job_id, file_paths)
+        except Exception:
+            self._artifacts.release(stage_id)
+            raise
+
+        self._artifacts.release(stage_id)
+        return results
+
+    def queue_staged_job(self, stage_id, invalidate_piezo=True):
+        """
+        Start a staged job in the background as soon as the current job has finished.
+
+        Generated files of the job can be fetched with L{get_artifact}, its name being @p stage_id. If any job fails,
+        the queue is halted until L{resume_staging_pipeline} is called, see L{get_staging_status}.
 
-    def _get_value_from_selectable_field(self, dlg, pos, sleeps=0.2):
+        @param stage_id: Name of the staged job as returned by L{stage_gwl_files}.
+        @type stage_id: str
+
+        @return: The number of queued jobs.
+        @rtype: int
+
+        @raise NanoWrite.NotStaged: Raised if the job is not staged (anymore).
+        """
+        with self._staging_lock:
+            if stage_id not in self._staged_jobs:
+                raise NanoWrite.NotStaged('Job %s is not staged' % stage_id)
+            if self._staging_pipeline is None:
+                self._staging_pipeline = nanowrite_staging.StagingPipeline(self)
+                self._staging_pipeline.start()
+        return self._staging_pipeline.enqueue(stage_id, invalidate_piezo=invalidate_piezo)
+
+    def resume_staging_pipeline(self):
+        """
+        Continue starting queued jobs after the pipeline has halted because of a failed job.
+        """
+        if self._staging_pipeline is not None:
+            self._staging_pipeline.resume()
+
+    def stop_staging_pipeline(self):
+        """
+        Stop starting queued jobs in the background. The jobs stay staged.
+        """
+        if getattr(self, '_staging_pipeline', None) is not None:
+            self._staging_pipeline.stop()
+            self._staging_pipeline = None
+
+    def get_staging_status(self):
+        """
+        @return: Dictionary with the keys 'staged' (see L{get_staged_jobs}), 'queued', 'started', 'errors' and
+            'halted' (see nanowrite_staging.StagingPipeline.get_status).
+        @rtype: dict
+        """
+        status = {'queued': [], 'started': [], 'errors': [], 'halted': None}
+        if self._staging_pipeline is not None:
+            status = self._staging_pipeline.get_status()
+        status['staged'] = self.get_staged_jobs()
+        return status
+
+    @_ui_action
+    def _get_value_from_selectable_field(self, pos, sleeps=0.2):
         """
         Get the content of a selectable text field.
 
         @note: This uses evil hacks which include sending keys and using the clipboard.
 
-        @param dlg: Dialog handle.
         @param pos: Pixel position of the field.
         @return: The value of the text field.
         @rtype: str
         """
 
         # Make sure that the dialog has the focus
-        self.set_dialog_foreground(dlg)
-        #dlg.ClickInput(coords=pos)
-        #dlg.TypeKeys('^{END}')
-        #dlg.TypeKeys('+^{HOME}')
-        dlg.DoubleClickInput(coords=pos)
+        self.set_dialog_foreground()
+        #self._backend.click(pos)
+        #self._backend.type_keys('^{END}')
+        #self._backend.type_keys('+^{HOME}')
+        self._backend.double_click(pos)
         time.sleep(sleeps)
-        dlg.TypeKeys('^c')
+        self._backend.type_keys('^c')
         time.sleep(sleeps)
-        return pywinauto.clipboard.GetData(format=13)
+        return self._backend.get_clipboard_text()
+
+    def _get_field_reader(self):
+        """
+        @return: The reader for text fields on the screen or None if it is disabled or numpy is not available.
+        """
+        if self._field_reader is None and self._read_fields_from_screen:
+            try:
+                import nanowrite_ocr
+            except ImportError:
+                print('numpy is not available, text fields are read via the clipboard')
+                self._read_fields_from_screen = False
+                return None
+
+            ocr_settings = self._settings['ocr']
+            data_dir = self._data_dir if self._data_dir is not None else get_data_dir()
+            glyph_file = os.path.join(data_dir, ocr_settings['glyph_file'])
+            self._field_reader = nanowrite_ocr.FieldReader(ocr_settings['field_box'], glyph_file,
+                                                           min_confidence=ocr_settings['min_confidence'],
+                                                           min_margin=ocr_settings['min_margin'])
+        return self._field_reader
+
+    @_ui_action
+    def _read_fields(self, names, parse=float, characters=NUMBER_CHARACTERS):
+        """
+        Read several text fields from a single screenshot.
+
+        Fields which can not be read with enough confidence are read via the clipboard, see
+        L{_get_value_from_selectable_field}. Their text is used to complete the glyph set of the reader. All fields
+        are read via the clipboard until the glyph set contains all @p characters.
+
+        @param names: Names of the fields in the positions of the settings.
+        @type names: list
 
+        @param parse: Function which converts the text of a field. A ValueError rejects the text read from screen.
+
+        @param characters: The characters which can occur in the fields.
+        @type characters: str
+
+        @return: List of the converted values in the order of @p names.
+        @rtype: list
+        """
+        positions = self._settings['positions']
+        reader = self._get_field_reader()
+
+        values = dict()
+        gray = None
+        if reader is not None:
+            self.set_dialog_foreground()
+            gray = reader.to_gray(self._backend.capture_image())
+            fields = dict()
+            if reader.knows(characters):
+                fields = reader.read_fields(gray, {name: positions[name] for name in names})
+            for name, (text, confidence, margin) in fields.items():
+                if reader.is_confident(confidence, margin):
+                    try:
+                        values[name] = parse(text)
+                    except ValueError:
+                        pass
+
+        learned = False
+        for name in names:
+            if name not in values:
+                text = self._get_value_from_selectable_field(positions[name])
+                values[name] = parse(text)
+                if gray is not None:
+                    learned = reader.learn(gray, positions[name], text) or learned
+
+        if learned:
+            try:
+                reader.save()
+            except IOError as e:
+                print('Saving the glyph set failed: %s' % e)
+
+        return [values[name] for name in names]
+
+    @_ui_action
     def get_progress_time(self):
         """
         Read the progress time field.
@@ -420,12 +1043,9 @@ class NanoWrite(object):
         @return: The progress time in seconds.
         @rtype: int
         """
-        val = self._get_value_from_selectable_field(self._main_dlg,
-                                                    self._settings['positions']['progress_txt']).split(':')
-        val = [float(x) for x in val]
-        seconds = val[0] * 60 * 60 + val[1] * 60 + val[2]
-        return seconds
+        return self._read_fields(['progress_txt'], _parse_duration, DURATION_CHARACTERS)[0]
 
+    @_ui_action
     def get_progress_estimate(self):
         """
         Read the progress estimate field.
@@ -433,19 +1053,60 @@ class NanoWrite(object):
         @return: The projected time to complete the job in seconds.
         @rtype: int
         """
-        # Make sure that the correct dialog has the focus
-        self.set_dialog_foreground()
-
         # Switch to graph view
-        self._main_dlg.ClickInput(coords=self._settings['positions']['graph'])
+        self._show_tab('graph')
+
+        return self._read_fields(['progress_estimate_txt'], _parse_duration, DURATION_CHARACTERS)[0]
+
+    def start_progress_sampler(self, interval=5.0, ui_interval=60.0):
+        """
+        Start sampling the progress of running jobs in the background.
 
-        val = self._get_value_from_selectable_field(self._main_dlg,
-                                self._settings['positions']['progress_estimate_txt']).split(':')
+        The elapsed time is taken from the log. The user interface is only read if the log does not suffice and at
+        most once every @p ui_interval seconds.
 
-        val = [float(x) for x in val]
-        seconds = val[0] * 60 * 60 + val[1] * 60 + val[2]
-        return seconds
+        @param interval: Sampling interval in seconds.
+        @type interval: float
+
+        @param ui_interval: Minimal interval in seconds between reads from the user interface.
+        @type ui_interval: float
+        """
+        self.stop_progress_sampler()
+        self._progress_sampler = nanowrite_progress.ProgressSampler(self, interval=interval, ui_interval=ui_interval)
+        self._progress_sampler.start()
+
+    def stop_progress_sampler(self):
+        """
+        Stop the background progress sampler, if it is running.
+        """
+        if getattr(self, '_progress_sampler', None) is not None:
+            self._progress_sampler.stop()
+            self._progress_sampler = None
+
+    def get_progress(self):
+        """
+        Get the latest progress sample of the background sampler. This does not interact with the user interface.
+
+        @see: L{start_progress_sampler}
+
+        @return: Dictionary with the keys 'running', 'timestamp', 'elapsed', 'estimate', 'eta', 'fraction' and
+            'source'. Times are given in seconds, the fraction between 0 and 1. Unknown values are None.
+        @rtype: dict
+        """
+        assert self._progress_sampler is not None, 'Progress sampler not started'
+        return self._progress_sampler.get_progress()
 
+    def is_job_running(self):
+        """
+        Check if a job submitted by this instance has not finished yet, as far as it is known.
+
+        @note: This does not interact with the user interface. Use L{has_finished} to update the state.
+
+        @rtype: bool
+        """
+        return self._job_running
+
+    @_ui_action
     def _get_pixel(self, coord):
         """
         Get the (R, G, B) value of the pixel at the given position.
@@ -455,9 +1116,10 @@ class NanoWrite(object):
         """
         self.set_dialog_foreground()
 
-        img = self._main_dlg.CaptureAsImage()
+        img = self._backend.capture_image()
         return img.convert('RGB').getpixel(coord)
 
+    @_ui_action
     def has_finished(self, abort_calculating_time=False):
         """
         Check if the instrument has finished with all of its tasks.
@@ -469,22 +1131,32 @@ class NanoWrite(object):
         In case of no running job we need to fall back on the progress bar:
         - If the last pixel of the progress bar is not blue, it has not finished, except it has a
           'done.' at the end.
+
+        @note: A failed job is raised only to the first caller, which notices it. It is kept for all others, see
+            L{get_last_job_error}.
+
+        @raise NanoWrite.ExecutionError: Raised if the running job has failed.
         """
 
-        print 'Checking finish state:'
-        print 'Job running:', self._job_running
         if self._job_running:
 
-            cmd_log = [txt for _, txt in self.get_command_log()]
+            cmd_log_entries = list(self.get_command_log())
+            cmd_log = [txt for _, txt in cmd_log_entries]
             for submsg in cmd_log:
                 if '!!!' in submsg:
                     self._job_running = False
+                    self._last_job_error = {'count': self._last_job_error['count'] + 1 if self._last_job_error else 1,
+                                            'timestamp': time.time(), 'message': submsg}
+                    self._end_job_phase('error', cmd_log_entries, message=submsg)
+                    self._release_running_artifact_job()
                     raise NanoWrite.ExecutionError(submsg)
 
             last_msg = cmd_log[-1]
             #print 'Last message:', last_msg
             if 'done.' in last_msg or 'aborted.' in last_msg:
                 self._job_running = False
+                self._end_job_phase('done' if 'done.' in last_msg else 'aborted', cmd_log_entries)
+                self._release_running_artifact_job()
                 return True
 
             if abort_calculating_time and 'Calculating times...' in last_msg:
@@ -502,13 +1174,212 @@ class NanoWrite(object):
         if bar_full:
             return True
         else:
-            last_msg = self.get_current_log()[-1][1]
+            last_msg = self._log_reader.get_last_entry()[1]
 
             if re.match(r'.*done\.', last_msg):
                 return True
 
         return False
 
+    def get_last_job_error(self):
+        """
+        Get the last failed job, no matter who called L{has_finished} when it failed.
+
+        @return: Dictionary with the number of failed jobs so far as 'count', the 'timestamp' when the failure was
+            noticed and the error 'message'. None if no job has failed yet.
+        @rtype: dict
+        """
+        return dict(self._last_job_error) if self._last_job_error is not None else None
+
+    def _begin_job(self, kind, digest=None, name=None, phase='running'):
+        """
+        Record a submitted job in the job history.
+
+        @param phase: 'loading' if the job is loaded and waits for start_dlw, 'running' otherwise.
+        """
+        if self._job_history is None:
+            return
+
+        self._current_job = self._job_history.begin(kind, digest, name=name)
+        self._current_job_phase = phase
+        if phase == 'running':
+            self._job_history.mark_started(self._current_job)
+
+    def _end_job_phase(self, result, cmd_log_entries, message=None):
+        """
+        Record the end of the current job phase in the job history.
+
+        Loading a file ends with the time calculation, the job itself only ends after writing.
+        The start and finish times are taken from the log if it contains the separator.
+        """
+        if self._current_job is None:
+            return
+
+        if self._current_job_phase == 'loading' and result != 'error':
+            self._current_job_phase = 'loaded'
+            return
+
+        started = None
+        finished = None
+        if len(cmd_log_entries) > 0 and nanowrite_gwl.SEPARATOR in cmd_log_entries[0][1]:
+            started = time.mktime(cmd_log_entries[0][0].timetuple())
+            finished = time.mktime(cmd_log_entries[-1][0].timetuple())
+
+        self._job_history.finish(self._current_job, result, message=message, started=started, finished=finished)
+        self._current_job = None
+        self._current_job_phase = None
+        self._estimator_calibrated = False
+
+    def _set_running_artifact_job(self, artifact_job):
+        """
+        Keep the working directory of the started job until it has finished. The directory of a previous job, which
+        has not been seen finishing, is released.
+        """
+        self._release_running_artifact_job()
+        self._running_artifact_job = artifact_job
+
+    def _release_running_artifact_job(self):
+        if self._running_artifact_job is not None:
+            self._artifacts.release(self._running_artifact_job)
+            self._running_artifact_job = None
+
+    def _analyze_job(self, digest, start_name, resolver, validator=None):
+        """
+        Extract the features of a GWL bundle, store them in the job history and estimate its write time.
+
+        @param validator: Optional validator, which checks the statements in the same pass.
+        @type validator: nanowrite_gwl.GWLValidator
+
+        @return: The estimated write time in seconds or None if the bundle could not be parsed or nobody uses the
+            estimate, i.e. there is neither a validator, a job history nor a progress sampler.
+        @rtype: float
+        """
+        if validator is None and self._job_history is None and self._progress_sampler is None:
+            return None
+
+        statements = nanowrite_gwl.iter_statements(start_name, resolver)
+        if validator is not None:
+            statements = validator.check(statements)
+
+        try:
+            features = nanowrite_estimator.extract_features(statements)
+        except nanowrite_gwl.GWLSyntaxError as e:
+            if validator is not None:
+                validator.errors.append(str(e))
+            print('Could not estimate write time: %s' % e)
+            return None
+
+        if self._job_history is not None:
+            self._job_history.set_features(digest, features)
+        return self._calibrated_estimator().estimate_features(features)
+
+    def _calibrated_estimator(self):
+        if not self._estimator_calibrated and self._job_history is not None:
+            self._estimator.calibrate(self._job_history.calibration_samples())
+        self._estimator_calibrated = True
+        return self._estimator
+
+    def estimate_write_time(self, start_name, gwl_files):
+        """
+        Estimate the write time of a set of GLW files without NanoWrite's own time calculation.
+
+        The estimate is based on the point count, path length, scan speed, settling time and stage moves. It is
+        calibrated against the durations of past jobs in the job history. With this estimate available, the
+        'Calculating times...' step can be skipped with @p abort_calculating_time.
+
+        @param start_name: Name of the executed GLW file.
+        @type start_name: str
+
+        @param gwl_files: Dictionary containing the GLW files as strings, see L{execute_complex_gwl_files}.
+        @type gwl_files: dict
+
+        @return: The estimated write time in seconds.
+        @rtype: float
+        """
+        return self._calibrated_estimator().estimate(start_name, nanowrite_gwl.dict_resolver(gwl_files))
+
+    def _check_validation(self, validator):
+        """
+        Raise if the validator found errors or the bounding box exceeds the piezo range.
+
+        @raise NanoWrite.ValidationError: Raised if the GWL bundle is invalid.
+        """
+        if len(validator.errors) > 0:
+            raise NanoWrite.ValidationError('\n'.join(validator.errors))
+
+        if validator.bounds is None:
+            return
+
+        # The z-axis inversion mirrors the piezo range onto itself, so the bounds are checked without asking the user
+        # interface for it. This way staging does not disturb a running job.
+        for corner in validator.bounds:
+            if not self.is_within_piezo_range(*corner):
+                raise NanoWrite.ValidationError('Structure bounds %s - %s exceed the piezo range %s' %
+                                                (validator.bounds[0], validator.bounds[1], self._piezo_range))
+
+    def validate_gwl_files(self, start_name, gwl_files):
+        """
+        Validate a set of GLW files locally without submitting them.
+
+        The files are parsed including all includes. The arguments of common commands are checked and the bounding
+        box of the structure is checked against the piezo range.
+
+        @param start_name: Name of the executed GLW file.
+        @type start_name: str
+
+        @param gwl_files: Dictionary containing the GLW files as strings, see L{execute_complex_gwl_files}.
+        @type gwl_files: dict
+
+        @return: Dictionary with the bounding box as 'bounds' (pair of lower and upper corner, None without points)
+            and a list of 'warnings'.
+        @rtype: dict
+
+        @raise NanoWrite.ValidationError: Raised if the files are invalid or exceed the piezo range.
+        """
+        validator = nanowrite_gwl.validate(start_name, nanowrite_gwl.dict_resolver(gwl_files))
+        self._check_validation(validator)
+        return {'bounds': validator.bounds, 'warnings': validator.warnings}
+
+    def get_job_estimate(self):
+        """
+        Get the estimated write time of the current job, if it could be estimated. Jobs are only estimated with a
+        job history or a running progress sampler, see L{start_progress_sampler}.
+
+        @return: The estimated write time in seconds or None.
+        @rtype: float
+        """
+        return self._job_estimate
+
+    def get_job_history(self, digest=None, kind=None, result=None, since=None, until=None, limit=100):
+        """
+        Query the recorded jobs, the most recently submitted first.
+
+        @param digest: Only jobs with this content hash of the GWL bundle.
+        @param kind: Only jobs of this kind, one of 'mini', 'file' or 'dlw'.
+        @param result: Only jobs with this result, one of 'done', 'aborted' or 'error'.
+        @param since: Only jobs submitted at or after this time in seconds since the epoch.
+        @param until: Only jobs submitted before this time in seconds since the epoch.
+        @param limit: Maximal number of returned jobs.
+
+        @return: List of dictionaries with the keys 'id', 'kind', 'digest', 'name', 'submitted', 'started',
+            'finished', 'duration', 'result', 'message' and 'artifacts'.
+        @rtype: list
+        """
+        assert self._job_history is not None, 'No job history configured'
+        return self._job_history.query(digest=digest, kind=kind, result=result, since=since, until=until,
+                                       limit=limit)
+
+    def get_job(self, job_id):
+        """
+        Get a single recorded job.
+
+        @see: L{get_job_history}
+
+        @rtype: dict
+        """
+        assert self._job_history is not None, 'No job history configured'
+        return self._job_history.get(job_id)
+
     def wait_until_finished(self, poll_interval=0.5, abort_calculating_time=False):
         """
         Stall execution until the current job has finished.
@@ -519,6 +1390,7 @@ class NanoWrite(object):
         while not self.has_finished(abort_calculating_time=abort_calculating_time):
             time.sleep(poll_interval)
 
+    @_ui_action
     def abort(self):
         """
         Try to abort the currently running task.
@@ -529,7 +1401,7 @@ class NanoWrite(object):
         self.set_dialog_foreground()
 
         # Go to advanced settings tab and click into text field
-        self._main_dlg.ClickInput(coords=self._settings['positions']['abort'])
+        self._backend.click(self._settings['positions']['abort'])
 
         self.wait_until_finished()
         self.invalidate_piezo_position()
@@ -545,19 +1417,121 @@ class NanoWrite(object):
         @return: The binary tif file.
         @rtype: str
         """
-        img_path = os.path.join(self._tmpfolder, 'captured.tif')
-        img_meta_path = img_path + '_meta.txt'
-        self.execute_mini_gwl("CapturePhoto %s" % img_path, invalidate_piezo=False)
-        self.wait_until_finished()
+        artifact_job, job_folder = self._artifacts.create_job('capture')
+        try:
+            img_path = os.path.join(job_folder, 'captured.tif')
+            img_meta_path = img_path + '_meta.txt'
+            self.execute_mini_gwl("CapturePhoto %s" % img_path, invalidate_piezo=False)
+            self.wait_until_finished()
 
-        with open(img_path, 'rb') as f:
-            img_data = f.read()
+            with open(img_path, 'rb') as f:
+                img_data = f.read()
 
-        with open(img_meta_path, 'rb') as f:
-            meta_data = f.read()
+            with open(img_meta_path, 'rb') as f:
+                meta_data = f.read()
+        finally:
+            self._artifacts.release(artifact_job)
 
         return meta_data, img_data
 
+    def capture_mosaic(self, positions, pixel_size, axes=(1, 1), tile_size=256, path=None):
+        """
+        Capture camera pictures at several stage positions and stitch them into an overview of the sample.
+
+        The overview is stored as pyramid of tiles, see nanowrite_mosaic.TilePyramid. By default, it is stored in the
+        working directory of a new job, so the tiles can be fetched with L{get_artifact}.
+
+        @note: This requires numpy and PIL.
+
+        @param positions: List of stage x and y positions in micrometers, e.g. a grid with overlapping pictures.
+        @type positions: list
+
+        @param pixel_size: Size of a camera pixel on the sample in micrometers.
+        @type pixel_size: float
+
+        @param axes: Direction of the image x and y axes relative to the stage x and y axes, each 1 or -1.
+        @type axes: tuple
+
+        @param tile_size: Size of the tiles in pixels.
+        @type tile_size: int
+
+        @param path: Directory to store the pyramid in instead of a job directory.
+        @type path: str
+
+        @return: The metadata of the pyramid, see nanowrite_mosaic.TilePyramid.write, with the additional keys 'job'
+            (name of the job directory or None) and 'used_offsets' (number of frame offsets used for the alignment).
+        @rtype: dict
+
+        @raise ValueError: Raised if no positions are given.
+        """
+        import io
+        import nanowrite_mosaic
+        from PIL import Image
+
+        positions = list(positions)
+        if len(positions) == 0:
+            raise ValueError('No positions given for the mosaic')
+
+        mosaic = nanowrite_mosaic.Mosaic(pixel_size, axes)
+        for x, y in positions:
+            self.move_stage(x, y)
+            _, img_data = NanoWrite.get_camera_picture(self)
+            mosaic.add_frame(Image.open(io.BytesIO(img_data)), (x, y))
+        used_offsets = mosaic.refine()
+
+        artifact_job = None
+        if path is None:
+            artifact_job, path = self._artifacts.create_job('mosaic')
+        try:
+            meta = mosaic.save_pyramid(path, tile_size=tile_size)
+        finally:
+            if artifact_job is not None:
+                self._artifacts.release(artifact_job)
+
+        meta.update(job=artifact_job, used_offsets=used_offsets)
+        return meta
+
+    def list_artifacts(self):
+        """
+        List the working directories of recent jobs and the files therein.
+
+        Captured pictures and read back files stay available for the artifact retention time after the job.
+
+        @return: List of dictionaries with the keys 'name', 'created', 'accessed', 'released' and 'files', least
+            recently used first.
+        @rtype: list
+        """
+        return self._artifacts.list_jobs()
+
+    def get_artifact(self, job_name, filename):
+        """
+        Read a file from the working directory of a recent job without re-running it.
+
+        @note: The NanoWriteRPC class overwrites this method and encodes the binary return value with BASE64.
+
+        @param job_name: Name of the job as returned by L{list_artifacts}.
+        @type job_name: str
+
+        @param filename: Name of the file.
+        @type filename: str
+
+        @return: The content of the file.
+        @rtype: str
+
+        @raise nanowrite_artifacts.ArtifactStore.UnknownArtifact: Raised if the job or file is no longer available.
+        """
+        return self._artifacts.read(job_name, filename)
+
+    def get_artifact_stats(self):
+        """
+        Get storage statistics of the job working directories.
+
+        @see: L{nanowrite_artifacts.ArtifactStore.get_stats}
+
+        @rtype: dict
+        """
+        return self._artifacts.get_stats()
+
     def invalidate_piezo_position(self):
         """
         Invalidate the chached piezo position.
@@ -580,20 +1554,41 @@ class NanoWrite(object):
         if self._cached_piezo_position is not None and self._cache_piezo_position:
             return self._cached_piezo_position
 
-        val_x = float(self._get_value_from_selectable_field(self._main_dlg,
-                                self._settings['positions']['piezo_x_txt']))
-        val_y = float(self._get_value_from_selectable_field(self._main_dlg,
-                        self._settings['positions']['piezo_y_txt']))
-        val_z = float(self._get_value_from_selectable_field(self._main_dlg,
-                        self._settings['positions']['piezo_z_txt']))
+        values = self._read_fields(['piezo_x_txt', 'piezo_y_txt', 'piezo_z_txt'])
+        return self._get_positions_from_display(values, None, self.is_z_inverted())[0]
+
+    def _get_frames(self, stage_position=(0, 0, 0), z_inverted=None):
+        """
+        Get the coordinate frames of the instrument, see nanowrite_transforms.Frames.
+
+        @param stage_position: The stage position as returned by L{get_stage_position}, i.e. as displayed.
+        @type stage_position: tuple
+
+        @param z_inverted: State of the z-axis inversion, it is read from the user interface if None.
+        @type z_inverted: bool
+        """
+        import nanowrite_transforms
+        if z_inverted is None:
+            z_inverted = self.is_z_inverted()
+        stage_position = nanowrite_transforms.stage_inversion(z_inverted).apply_point(stage_position)
+        return nanowrite_transforms.Frames(self._piezo_range, z_inverted, stage_position)
 
-        if self.is_z_inverted():
-            val_x = self._piezo_range[0] - val_x
-            val_z = self._piezo_range[2] - val_z
+    def _get_positions_from_display(self, piezo_values, stage_values, z_inverted):
+        """
+        Convert the displayed piezo coordinates into the frame of the GWL commands. The piezo position is cached,
+        the stage position stays as displayed, see L{get_stage_position}.
 
-        piezo_position = val_x, val_y, val_z
-        self._cached_piezo_position = piezo_position
-        return piezo_position
+        @return: Tuple of the piezo and the stage position, each None if no values are given.
+        @rtype: tuple
+        """
+        piezo_position = stage_position = None
+        if piezo_values is not None:
+            frames = self._get_frames(z_inverted=z_inverted)
+            piezo_position = frames.convert_point(piezo_values, 'inverted_piezo', 'piezo')
+            self._cached_piezo_position = piezo_position
+        if stage_values is not None:
+            stage_position = tuple(stage_values)
+        return piezo_position, stage_position
 
     def is_z_inverted(self):
         """
@@ -604,6 +1599,7 @@ class NanoWrite(object):
         """
         return self._get_pixel(self._settings['positions']['inverted_z_axis_pixel'])[1] > 100
 
+    @_ui_action
     def set_z_inverted(self, state):
         """
         Set the z-axis inversion to the given state.
@@ -618,27 +1614,37 @@ class NanoWrite(object):
             self.set_dialog_foreground()
 
             # Go to advanced settings tab and click into text field
-            self._main_dlg.ClickInput(coords=self._settings['positions']['inverted_z_axis_pixel'])
+            self._backend.click(self._settings['positions']['inverted_z_axis_pixel'])
 
         assert self.is_z_inverted() == state, "Invert z-state does not match"
 
     def get_stage_position(self):
         """
-        Get the current stage position.
+        Get the current stage position as displayed by NanoWrite.
+
+        With the z-axis inversion enabled, the displayed z is negated with respect to the stage commands of
+        L{move_stage_relative}. L{move_stage} takes its target in the displayed frame and accounts for this.
 
         @return: Tuple of x, y, z coordinates
         @rtype: tuple
         """
-        #FIXME: This might also need a z-inversion correction.
+        return tuple(self._read_fields(['stage_x_txt', 'stage_y_txt', 'stage_z_txt']))
+
+    def get_positions(self):
+        """
+        Get the piezo and the stage position from a single screenshot.
 
-        val_x = float(self._get_value_from_selectable_field(self._main_dlg,
-                                self._settings['positions']['stage_x_txt']))
-        val_y = float(self._get_value_from_selectable_field(self._main_dlg,
-                        self._settings['positions']['stage_y_txt']))
-        val_z = float(self._get_value_from_selectable_field(self._main_dlg,
-                        self._settings['positions']['stage_z_txt']))
-        return val_x, val_y, val_z
+        @return: Dictionary with the keys 'piezo' (see L{get_piezo_position}) and 'stage' (see L{get_stage_position}),
+            each a tuple of x, y, z coordinates.
+        @rtype: dict
+        """
+        values = self._read_fields(['piezo_x_txt', 'piezo_y_txt', 'piezo_z_txt',
+                                    'stage_x_txt', 'stage_y_txt', 'stage_z_txt'])
+        piezo_position, stage_position = self._get_positions_from_display(values[:3], values[3:],
+                                                                          self.is_z_inverted())
+        return {'piezo': piezo_position, 'stage': stage_position}
 
+    @_ui_action
     def _get_screenshot(self):
         """
         Get a screenshot of the main window.
@@ -646,7 +1652,7 @@ class NanoWrite(object):
         @return: A PIL image object.
         """
         self.set_dialog_foreground()
-        return self._main_dlg.CaptureAsImage()
+        return self._backend.capture_image()
 
     def find_interface(self, at=50):
         gwl = 'findInterfaceAt %f' % at
@@ -672,18 +1678,17 @@ class NanoWrite(object):
         self.move_piezo(piezo_position[0] + dx, piezo_position[1] + dy, piezo_position[2] + dz)
 
     def move_stage(self, x, y, z=None):
+        """
+        Move the stage to the given position, as displayed and returned by L{get_stage_position}.
+        """
+        import nanowrite_transforms
+
         current_stage_pos = self.get_stage_position()
         if z is None:
             z = current_stage_pos[2]
 
-        delta_z = z-current_stage_pos[2]
-
-        if self.is_z_inverted():
-            delta_z *= -1
-
-        self.move_stage_relative(x-current_stage_pos[0],
-                                 y-current_stage_pos[1],
-                                 delta_z)
+        delta = (x - current_stage_pos[0], y - current_stage_pos[1], z - current_stage_pos[2])
+        self.move_stage_relative(*nanowrite_transforms.stage_inversion(self.is_z_inverted()).apply_vector(delta))
 
     def move_stage_relative(self, dx=0, dy=0, dz=0):
         gwl = 'MoveStageX %f\nMoveStageY %f\nAddZDrivePosition %f\nwrite' % (dx, dy, dz)
@@ -700,9 +1705,11 @@ class NanoWrite(object):
         In the end, the microscope should be at the same location.
         """
         piezo_position = self.get_piezo_position()
-        piezo_correction = (x - piezo_position[0], y - piezo_position[1])
+
+        # The piezo frame is the stage frame shifted by the stage position, see nanowrite_transforms.Frames. The stage
+        # position cancels out, the stage moves opposite to the piezo.
         self.move_piezo(x, y, piezo_position[2])
-        self.move_stage_relative(-piezo_correction[0], -piezo_correction[1])
+        self.move_stage_relative(piezo_position[0] - x, piezo_position[1] - y)
 
 
 def main():
@@ -0,0 +1,207 @@
+"""
+Per-job working directories with a disk quota.
+
+Every job gets its own directory, so GWL files, captured images and other read back files of different jobs do not
+overwrite each other. After the results have been read back, a job directory is kept for a retention time, so
+artifacts can be fetched again without re-running the job. If the store exceeds its quota, the least recently used
+released jobs are evicted first.
+"""
+
+import collections
+import itertools
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+import time
+
+
+def _directory_size(path):
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return size
+
+
+class ArtifactStore(object):
+    """
+    Managed directory holding one subdirectory per job.
+    """
+
+    class UnknownArtifact(Exception):
+        pass
+
+    def __init__(self, root=None, quota=2 * 1024 ** 3, retention=3600.0):
+        """
+        @param root: Directory of the store. A temporary directory is created and removed on close if None.
+        @type root: str
+
+        @param quota: Maximal size of all released jobs in bytes.
+        @type quota: int
+
+        @param retention: Time in seconds a job is kept after it has been released.
+        @type retention: float
+        """
+        self._owns_root = root is None
+        self._root = tempfile.mkdtemp(suffix='nanowriteserver') if root is None else root
+        if not os.path.exists(self._root):
+            os.makedirs(self._root)
+
+        self._quota = quota
+        self._retention = retention
+
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+        # Job name -> dictionary of 'path', 'created', 'accessed', 'released' and 'size', least recently used first
+        self._jobs = collections.OrderedDict()
+
+        self._evicted_jobs = 0
+        self._evicted_bytes = 0
+
+    def close(self):
+        """
+        Remove all jobs and the store itself, if it was created as temporary directory.
+        """
+        with self._lock:
+            self._jobs.clear()
+        if self._owns_root:
+            shutil.rmtree(self._root, ignore_errors=True)
+
+    def create_job(self, prefix='job'):
+        """
+        Create the directory of a new job.
+
+        @param prefix: Prefix of the job name.
+        @type prefix: str
+
+        @return: Tuple of the job name and the path of its directory.
+        @rtype: tuple
+        """
+        self.evict()
+
+        now = time.time()
+        name = '%s-%s-%04d' % (prefix, time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), next(self._counter))
+        path = os.path.join(self._root, name)
+        os.mkdir(path)
+
+        with self._lock:
+            self._jobs[name] = {'path': path, 'created': now, 'accessed': now, 'released': None, 'size': None}
+        return name, path
+
+    def _get_job(self, name):
+        job = self._jobs.get(name)
+        if job is None:
+            raise ArtifactStore.UnknownArtifact('Unknown job %s' % name)
+        return job
+
+    def release(self, name):
+        """
+        Mark a job as finished. Its directory is kept for the retention time or until the quota forces its eviction.
+        """
+        with self._lock:
+            job = self._get_job(name)
+            job['released'] = time.time()
+            job['size'] = _directory_size(job['path'])
+        self.evict()
+
+    def get_path(self, name, filename=None):
+        """
+        Get the path of a job directory or of a file therein. This counts as an access of the job.
+
+        @param filename: Name of a file in the job directory. Only its base name is used.
+        @type filename: str
+
+        @raise ArtifactStore.UnknownArtifact: Raised if the job is not (or no longer) known.
+        """
+        with self._lock:
+            job = self._get_job(name)
+            job['accessed'] = time.time()
+            self._jobs.pop(name)
+            self._jobs[name] = job
+            path = job['path']
+
+        if filename is None:
+            return path
+        # Make sure that an attacker might not access stuff outside of the job directory
+        return os.path.join(path, os.path.basename(filename))
+
+    def read(self, name, filename):
+        """
+        Read a file of a job.
+
+        @return: The content of the file.
+        @rtype: str
+
+        @raise ArtifactStore.UnknownArtifact: Raised if the job or the file is not known.
+        """
+        file_path = self.get_path(name, filename)
+        if not os.path.isfile(file_path):
+            raise ArtifactStore.UnknownArtifact('Unknown file %s in job %s' % (filename, name))
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+    def list_jobs(self):
+        """
+        @return: List of dictionaries with the keys 'name', 'created', 'accessed', 'released' and 'files', least
+            recently used first.
+        @rtype: list
+        """
+        with self._lock:
+            jobs = [(name, dict(job)) for name, job in self._jobs.items()]
+
+        results = list()
+        for name, job in jobs:
+            files = sorted(os.listdir(job['path'])) if os.path.isdir(job['path']) else []
+            results.append({'name': name, 'created': job['created'], 'accessed': job['accessed'],
+                            'released': job['released'], 'files': files})
+        return results
+
+    def _remove(self, name):
+        job = self._jobs.pop(name)
+        size = job['size'] if job['size'] is not None else _directory_size(job['path'])
+        shutil.rmtree(job['path'], ignore_errors=True)
+        self._evicted_jobs += 1
+        self._evicted_bytes += size
+
+    def evict(self):
+        """
+        Remove released jobs whose retention time has passed, then the least recently used released jobs until the
+        store fits into its quota. Jobs which have not been released yet are never evicted.
+        """
+        now = time.time()
+        with self._lock:
+            for name, job in list(self._jobs.items()):
+                if job['released'] is not None and job['released'] + self._retention < now:
+                    self._remove(name)
+
+            total = sum(job['size'] for job in self._jobs.values() if job['size'] is not None)
+            for name, job in list(self._jobs.items()):
+                if total <= self._quota:
+                    break
+                if job['released'] is not None:
+                    total -= job['size']
+                    self._remove(name)
+
+    def get_stats(self):
+        """
+        @return: Dictionary with the keys 'root', 'jobs', 'active_jobs', 'bytes' (size of the released jobs),
+            'quota', 'retention', 'evicted_jobs' and 'evicted_bytes'. Sizes are floats, since XML-RPC integers are
+            limited to 32 bits.
+        @rtype: dict
+        """
+        with self._lock:
+            sizes = [job['size'] for job in self._jobs.values() if job['size'] is not None]
+            return {'root': self._root,
+                    'jobs': len(self._jobs),
+                    'active_jobs': len(self._jobs) - len(sizes),
+                    'bytes': float(sum(sizes)),
+                    'quota': float(self._quota),
+                    'retention': self._retention,
+                    'evicted_jobs': self._evicted_jobs,
+                    'evicted_bytes': float(self._evicted_bytes)}
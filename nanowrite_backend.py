@@ -0,0 +1,225 @@
+"""
+Windows automation backend of the NanoWrite wrapper.
+
+All interaction with the user interface of NanoWrite goes through a backend. This keeps pywinauto and the win32
+modules out of the import of the rest of the wrapper. They are only imported once a backend is actually created,
+so log parsing, GWL helpers and the clients can be used on any platform.
+"""
+
+import threading
+import time
+
+
+class FocusManager(object):
+    """
+    Keeps the main window in the foreground with as little work as possible.
+
+    Restoring and focusing the window is skipped if it already is the unobstructed foreground window. This is checked
+    with a few cheap win32 calls.
+    """
+
+    def __init__(self, dlg, on_obstructed=None):
+        """
+        @param dlg: The pywinauto window to keep in the foreground.
+
+        @param on_obstructed: Called before the focus is restored, e.g. to close popups covering the window.
+        """
+        import win32gui
+
+        self._win32gui = win32gui
+        self._dlg = dlg
+        self._handle = dlg.handle
+        self._on_obstructed = on_obstructed
+
+        self.skipped = 0
+        self.restored = 0
+
+    def is_foreground(self):
+        """
+        Check if the window is the foreground window, not minimized and not covered at its center.
+
+        @rtype: bool
+        """
+        win32gui = self._win32gui
+        if win32gui.GetForegroundWindow() != self._handle or win32gui.IsIconic(self._handle):
+            return False
+
+        left, top, right, bottom = win32gui.GetWindowRect(self._handle)
+        hwnd = win32gui.WindowFromPoint(((left + right) // 2, (top + bottom) // 2))
+        while hwnd and hwnd != self._handle:
+            hwnd = win32gui.GetParent(hwnd)
+        return hwnd == self._handle
+
+    def set_foreground(self):
+        """
+        Bring the window to the foreground and give it the focus, unless it already has it.
+        """
+        try:
+            if self.is_foreground():
+                self.skipped += 1
+                return
+        except Exception:
+            pass
+
+        if self._on_obstructed is not None:
+            self._on_obstructed()
+        self._dlg.Restore()
+        self._dlg.SetFocus()
+        self.restored += 1
+
+
+class TeamViewerWatcher(threading.Thread):
+    """
+    Closes TeamViewer's 'Sponsored session' popup in the background at a low rate.
+    """
+
+    def __init__(self, backend, interval=5.0):
+        threading.Thread.__init__(self, name='TeamViewerWatcher')
+        self.daemon = True
+        self._backend = backend
+        self._interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._backend.close_teamviewer_window()
+            self._stop_event.wait(self._interval)
+
+
+class PyWinAutoBackend(object):
+    """
+    Simulates mouse and keyboard input for the main window of a running NanoWrite instance via pywinauto.
+    """
+
+    def __init__(self, nanowrite_path, teamviewer_interval=5.0):
+        """
+        @param nanowrite_path: The path to the NanoWrite executabe.
+            The path is used to find the running instance of NanoWrite.
+        @type nanowrite_path: str
+
+        @param teamviewer_interval: Interval in seconds to check for TeamViewer popups in the background.
+            None disables the background check.
+        @type teamviewer_interval: float
+        """
+        import pywinauto
+
+        self._pywinauto = pywinauto
+
+        self._pwa_app = pywinauto.application.Application()
+        self._pwa_app.connect_(path=nanowrite_path)
+
+        self._main_dlg = self._pwa_app.window_(title_re='.*NanoWrite .+')
+
+        # Popups are closed right away if they cover the window, otherwise only by the background watcher
+        self._focus = FocusManager(self._main_dlg.WrapperObject(), on_obstructed=self.close_teamviewer_window)
+
+        self._teamviewer_watcher = None
+        if teamviewer_interval is not None:
+            self._teamviewer_watcher = TeamViewerWatcher(self, teamviewer_interval)
+            self._teamviewer_watcher.start()
+
+    def close(self):
+        """
+        Stop the background threads of the backend.
+        """
+        if self._teamviewer_watcher is not None:
+            self._teamviewer_watcher.stop()
+            self._teamviewer_watcher = None
+
+    def window_text(self):
+        """
+        @return: The title of the main window.
+        @rtype: str
+        """
+        return self._main_dlg.WindowText()
+
+    def set_foreground(self):
+        """
+        Bring the main window to the foreground and give it the focus, unless it already has it.
+        """
+        self._focus.set_foreground()
+
+    def close_teamviewer_window(self):
+        """
+        Close the 'Sponsored session' popup of TeamViewer, which would otherwise catch our input.
+        """
+        try:
+            pwa_app = self._pywinauto.application.Application()
+            pwa_app.connect_(path='teamviewer.exe')
+            sponsored_session_window = pwa_app.window_(title_re='Sponsored session')
+
+            if sponsored_session_window.Exists(timeout=0, retry_interval=0):
+                sponsored_session_window['OK'].Click()
+        except Exception:
+            pass
+
+    def click(self, coords):
+        self._main_dlg.ClickInput(coords=coords)
+
+    def double_click(self, coords):
+        self._main_dlg.DoubleClickInput(coords=coords)
+
+    def type_keys(self, keys):
+        self._main_dlg.TypeKeys(keys)
+
+    @staticmethod
+    def set_clipboard_text(text):
+        import win32clipboard
+        import win32con
+        win32clipboard.OpenClipboard()
+        win32clipboard.SetClipboardData(win32con.CF_TEXT, text)
+        win32clipboard.CloseClipboard()
+
+    @staticmethod
+    def get_clipboard_text():
+        import pywinauto.clipboard
+        return pywinauto.clipboard.GetData(format=13)
+
+    def get_pixel(self, coords):
+        """
+        Get the color of a single pixel of the main window without capturing the whole window.
+
+        @param coords: Pixel position in client coordinates, like for L{click}.
+        @return: Tuple with the (R, G, B) value
+        @rtype: tuple
+        """
+        import win32gui
+
+        handle = self._main_dlg.handle
+        hdc = win32gui.GetDC(handle)
+        try:
+            color = win32gui.GetPixel(hdc, coords[0], coords[1])
+        finally:
+            win32gui.ReleaseDC(handle, hdc)
+        return color & 0xff, (color >> 8) & 0xff, (color >> 16) & 0xff
+
+    def capture_image(self):
+        """
+        @return: A PIL image object of the main window.
+        """
+        return self._main_dlg.CaptureAsImage()
+
+    def enter_file_in_open_dialog(self, file_path):
+        """
+        Enter a path into the 'Open file' dialog and confirm it.
+
+        @return: True if the path was entered, False if the dialog is not ready yet.
+        @rtype: bool
+        """
+        try:
+            time.sleep(0.5)
+            open_dlg = self._pwa_app['Open file']
+            time.sleep(0.5)
+            open_dlg['Edit'].SetEditText(file_path)
+            if open_dlg['Edit'].TextBlock() != file_path:
+                return False
+
+            #open_dlg['Open'].Click()
+            time.sleep(0.5)
+            open_dlg.TypeKeys('{ENTER}')
+            return True
+        except Exception:
+            return False
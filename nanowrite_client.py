@@ -1,15 +1,21 @@
 import time
 import xmlrpclib
 
+import nanowrite_gwl
+
 class NanoWriteRPCClient(object):
     """
     This class mimics the same behaviour as the NanoWrite class but connects over network to the XML-RPC server.
 
     You can easily substitute instances of and NanoWriteRPCClient without any loss in functionality.
+
+    The log is mirrored locally and only new entries are fetched from the server.
     """
 
     def __init__(self, uri, *args, **nargs):
         self._proxy = xmlrpclib.ServerProxy(uri, *args, allow_none=True, **nargs)
+        self._log_mirror = list()
+        self._log_cursor = ''
 
     def __getattr__(self, item):
         if item not in self.__dict__:
@@ -22,9 +28,52 @@ class NanoWriteRPCClient(object):
         return meta, img.data
 
     def execute_complex_gwl_files(self, start_name, gwl_files, readback_files=None):
+        # XML-RPC needs the whole request in memory, so streamed contents are joined here
+        gwl_files = {key: nanowrite_gwl.join_chunks(value) for key, value in gwl_files.items()}
         results = self._proxy.execute_complex_gwl_files(start_name, gwl_files, readback_files)
         return {key: value.data for key, value in results.items()}
 
+    def stage_gwl_files(self, start_name, gwl_files, *args):
+        gwl_files = {key: nanowrite_gwl.join_chunks(value) for key, value in gwl_files.items()}
+        return self._proxy.stage_gwl_files(start_name, gwl_files, *args)
+
+    def execute_staged_job(self, stage_id, readback_files=None, *args):
+        results = self._proxy.execute_staged_job(stage_id, readback_files, *args)
+        return {key: value.data for key, value in results.items()}
+
+    def submit_gwl(self, gwl, start_name='job.gwl', readback_files=None, *args):
+        if isinstance(gwl, dict):
+            gwl = {key: nanowrite_gwl.join_chunks(value) for key, value in gwl.items()}
+        else:
+            gwl = nanowrite_gwl.join_chunks(gwl)
+        submission = self._proxy.submit_gwl(gwl, start_name, readback_files, *args)
+        submission['results'] = {key: value.data for key, value in submission['results'].items()}
+        return submission
+
+    def update_log_mirror(self, max_entries=1000):
+        """
+        Fetch the log entries which are new since the last update into the local mirror.
+
+        @return: The number of log entries.
+        @rtype: int
+        """
+        while True:
+            delta = self._proxy.get_log_since(self._log_cursor, max_entries)
+            if delta['reset']:
+                del self._log_mirror[:]
+            # The entries starting at 'start' replace the local ones, the last entry might have grown
+            self._log_mirror[delta['start']:] = delta['entries']
+            self._log_cursor = delta['cursor']
+            if delta['start'] + len(delta['entries']) >= delta['total']:
+                return len(self._log_mirror)
+
+    def get_current_log(self):
+        self.update_log_mirror()
+        return [list(entry) for entry in self._log_mirror]
+
+    def get_artifact(self, job_name, filename):
+        return self._proxy.get_artifact(job_name, filename).data
+
     def wait_until_finished(self, poll_interval=0.5):
         # Wait on the client side to avoid timeouts.
         while not self._proxy.has_finished():
@@ -0,0 +1,174 @@
+"""
+Fast estimation of the write time of GWL jobs.
+
+NanoWrite's own time calculation takes minutes for big structures. This estimator parses the GWL bundle instead and
+predicts the write time from a few features with a linear model, which is calibrated against the actual durations of
+past jobs.
+"""
+
+import math
+
+import nanowrite_gwl
+
+
+# Name and default coefficient (in seconds per unit) of every feature.
+FEATURES = (
+    ('points', 0.0),          # Number of written points
+    ('line_time', 1.0),       # Path length divided by the scan speed in seconds
+    ('settling_time', 1.0),   # Piezo settling time before every write in seconds
+    ('stage_moves', 1.0),     # Number of stage moves
+    ('wait_time', 1.0),       # Time of explicit wait commands in seconds
+    ('constant', 0.0),        # Overhead of every job
+)
+
+FEATURE_NAMES = tuple(name for name, _ in FEATURES)
+
+DEFAULT_SCAN_SPEED = 200.0           # um/s
+DEFAULT_PIEZO_SETTLING_TIME = 10.0   # ms
+
+_STAGE_MOVE_COMMANDS = ('movestagex', 'movestagey', 'addzdriveposition', 'stagegotox', 'stagegotoy',
+                        'zdrivegoto', 'stagegoto')
+
+
+def extract_features(statements):
+    """
+    Extract the features of a GWL job.
+
+    @param statements: Statements as returned by L{nanowrite_gwl.iter_statements}.
+
+    @return: Dictionary of the feature names in L{FEATURE_NAMES} and their values.
+    @rtype: dict
+    """
+    features = dict.fromkeys(FEATURE_NAMES, 0.0)
+    features['constant'] = 1.0
+
+    scan_speed = DEFAULT_SCAN_SPEED
+    settling_time = DEFAULT_PIEZO_SETTLING_TIME
+    points = []
+
+    for filename, lineno, command, args in statements:
+        if command is None:
+            points.append(args)
+            continue
+
+        command = command.lower()
+        try:
+            if command == 'write':
+                features['points'] += len(points)
+                length = 0.0
+                for p0, p1 in zip(points, points[1:]):
+                    length += math.sqrt((p1[0] - p0[0]) ** 2 + (p1[1] - p0[1]) ** 2 + (p1[2] - p0[2]) ** 2)
+                features['line_time'] += length / scan_speed
+                features['settling_time'] += settling_time / 1000.0
+                points = []
+            elif command == 'scanspeed':
+                speed = float(args[0])
+                # Non-positive speeds can not be estimated, the previous speed is kept
+                if speed > 0:
+                    scan_speed = speed
+            elif command == 'piezosettlingtime':
+                settling_time = float(args[0])
+            elif command == 'wait':
+                features['wait_time'] += float(args[0])
+            elif command in _STAGE_MOVE_COMMANDS:
+                features['stage_moves'] += 1
+        except (IndexError, ValueError):
+            # Arguments given by variables can not be evaluated, these commands are ignored
+            continue
+
+    return features
+
+
+def _solve(matrix, vector):
+    """
+    Solve a small linear system by Gaussian elimination with partial pivoting.
+    """
+    n = len(vector)
+    a = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(a[row][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for row in range(col + 1, n):
+            factor = a[row][col] / a[col][col]
+            for k in range(col, n + 1):
+                a[row][k] -= factor * a[col][k]
+    x = [0.0] * n
+    for row in reversed(range(n)):
+        x[row] = (a[row][n] - sum(a[row][k] * x[k] for k in range(row + 1, n))) / a[row][row]
+    return x
+
+
+class WriteTimeEstimator(object):
+    """
+    Linear model of the write time of GWL jobs.
+    """
+
+    def __init__(self, coefficients=None, regularization=1.0):
+        """
+        @param coefficients: Dictionary of coefficients for the features, missing ones use the defaults.
+        @type coefficients: dict
+
+        @param regularization: Weight which pulls the calibrated coefficients towards the defaults. This keeps the
+            model sane as long as only a few past jobs are known.
+        @type regularization: float
+        """
+        self._coefficients = dict(FEATURES)
+        if coefficients is not None:
+            self._coefficients.update(coefficients)
+        self._regularization = regularization
+
+    def get_coefficients(self):
+        return dict(self._coefficients)
+
+    def estimate_features(self, features):
+        """
+        Predict the write time from extracted features.
+
+        @return: The write time in seconds.
+        @rtype: float
+        """
+        return max(0.0, sum(self._coefficients[name] * features.get(name, 0.0) for name in FEATURE_NAMES))
+
+    def estimate(self, start_name, resolver):
+        """
+        Predict the write time of a GWL bundle.
+
+        @see: L{nanowrite_gwl.iter_statements}
+
+        @return: The write time in seconds.
+        @rtype: float
+        """
+        return self.estimate_features(extract_features(nanowrite_gwl.iter_statements(start_name, resolver)))
+
+    def calibrate(self, samples):
+        """
+        Fit the coefficients to past jobs with ridge regression towards the default coefficients.
+
+        @param samples: Iterable of (features, duration) tuples, the duration in seconds.
+
+        @return: The number of samples used.
+        @rtype: int
+        """
+        n = len(FEATURE_NAMES)
+        defaults = dict(FEATURES)
+        xtx = [[0.0] * n for _ in range(n)]
+        xty = [0.0] * n
+
+        count = 0
+        for features, duration in samples:
+            row = [features.get(name, 0.0) for name in FEATURE_NAMES]
+            for i in range(n):
+                xty[i] += row[i] * duration
+                for j in range(n):
+                    xtx[i][j] += row[i] * row[j]
+            count += 1
+
+        if count == 0:
+            return 0
+
+        for i, name in enumerate(FEATURE_NAMES):
+            xtx[i][i] += self._regularization
+            xty[i] += self._regularization * defaults[name]
+
+        self._coefficients = dict(zip(FEATURE_NAMES, _solve(xtx, xty)))
+        return count
@@ -0,0 +1,400 @@
+"""
+Helpers for handling GWL scripts without keeping them in memory.
+
+GWL files may be given as plain strings, as iterables of lines (e.g. generators) or as file-like objects.
+All of them are streamed in chunks, so even structure files of hundreds of MB never have to be assembled in memory.
+"""
+
+import io
+import os
+import os.path
+
+try:
+    string_types = basestring
+    text_type = unicode
+except NameError:
+    # The async client uses these helpers on Python 3
+    string_types = (str, bytes)
+    text_type = str
+    xrange = range
+
+
+# Prepended to every submitted job. This way the "done." of the last command does not bother us.
+SEPARATOR = '***Separator***'
+SAFEGUARD_PREFIX = 'MessageOut %s\n' % SEPARATOR
+
+# Appended to every submitted job to force a progress bar.
+SAFEGUARD_SUFFIX = '\nwait 0.01'
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_chunks(content, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the content of a GWL file in chunks.
+
+    @param content: The GWL content. Either a string, a file-like object with a read method or an iterable of lines.
+        Lines without a trailing newline get one appended.
+    @param chunk_size: Maximal number of bytes read at once from file-like objects.
+    @type chunk_size: int
+
+    @return: Generator of strings.
+    """
+    if isinstance(content, string_types):
+        for start in xrange(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+    elif hasattr(content, 'read'):
+        while True:
+            chunk = content.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for line in content:
+            newline = b'\n' if isinstance(line, bytes) else u'\n'
+            if not line.endswith(newline):
+                line += newline
+            yield line
+
+
+def join_chunks(content):
+    """
+    Read GWL content completely into a single string, e.g. to send it over XML-RPC.
+
+    @param content: The GWL content, see L{iter_chunks}. Binary content, e.g. from files opened in binary mode, stays
+        binary.
+
+    @rtype: str
+    """
+    chunks = list(iter_chunks(content))
+    return chunks[0][:0].join(chunks) if len(chunks) > 0 else ''
+
+
+def iter_with_safeguard(content, chunk_size=CHUNK_SIZE):
+    """
+    Iterate over the content of a GWL file, wrapped into the separator and wait safeguard.
+
+    @see: L{iter_chunks}
+    """
+    yield SAFEGUARD_PREFIX
+    for chunk in iter_chunks(content, chunk_size):
+        yield chunk
+    yield SAFEGUARD_SUFFIX
+
+
+def add_safeguard(commands):
+    """
+    Wrap a short command string into the separator and wait safeguard.
+
+    @param commands: GWL commands.
+    @type commands: str
+
+    @rtype: str
+    """
+    return SAFEGUARD_PREFIX + commands + SAFEGUARD_SUFFIX
+
+
+def write_gwl_file(file_path, content, safeguard=False, hasher=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream GWL content into a file.
+
+    @param file_path: Path of the file to write.
+    @type file_path: str
+
+    @param content: The GWL content, see L{iter_chunks}.
+
+    @param safeguard: Wrap the content into the separator and wait safeguard.
+    @type safeguard: bool
+
+    @param hasher: Optional hashlib object which is updated with everything written.
+
+    @return: The number of bytes written.
+    @rtype: int
+    """
+    chunks = iter_with_safeguard(content, chunk_size) if safeguard else iter_chunks(content, chunk_size)
+
+    size = 0
+    with io.open(file_path, 'w', encoding='latin-1') as f:
+        for chunk in chunks:
+            if isinstance(chunk, text_type):
+                data = chunk.encode('latin-1')
+            else:
+                data = chunk
+                chunk = chunk.decode('latin-1')
+            f.write(chunk)
+            size += len(data)
+            if hasher is not None:
+                hasher.update(data)
+    return size
+
+
+def write_gwl_bundle(folder, start_name, gwl_files, hasher=None):
+    """
+    Write a set of GWL files into a folder. Only the start file gets the safeguard.
+
+    @param folder: Destination folder.
+    @type folder: str
+
+    @param start_name: Name of the file which will be executed.
+    @type start_name: str
+
+    @param gwl_files: Dictionary of file names and their content, see L{iter_chunks}.
+    @type gwl_files: dict
+
+    @param hasher: Optional hashlib object which is updated with the names and contents of all files.
+
+    @return: The path of the start file.
+    @rtype: str
+    """
+    assert start_name in gwl_files, 'Invalid start name given'
+
+    for filename in sorted(gwl_files):
+        # Make sure that an attacker might not access stuff outside of out temporary folder
+        file_path = os.path.join(folder, os.path.basename(filename))
+        if hasher is not None:
+            hasher.update(os.path.basename(filename) + '\0')
+        write_gwl_file(file_path, gwl_files[filename], safeguard=(filename == start_name), hasher=hasher)
+
+    return os.path.join(folder, os.path.basename(start_name))
+
+
+class GWLSyntaxError(Exception):
+    """
+    Raised if a GWL file can not be parsed.
+    """
+    def __init__(self, filename, lineno, message):
+        Exception.__init__(self, '%s:%d: %s' % (filename, lineno, message))
+        self.filename = filename
+        self.lineno = lineno
+
+
+def folder_resolver(folder):
+    """
+    Resolve names of GWL files to files within a folder.
+
+    @return: Function which returns an iterable of lines for a file name.
+    """
+    def resolve(filename):
+        file_path = os.path.join(folder, os.path.basename(filename))
+        if not os.path.isfile(file_path):
+            return None
+        return open(file_path, 'r')
+    return resolve
+
+
+def dict_resolver(gwl_files):
+    """
+    Resolve names of GWL files to the string contents of a dictionary as given to execute_complex_gwl_files.
+
+    @return: Function which returns an iterable of lines for a file name.
+    """
+    def resolve(filename):
+        content = gwl_files.get(os.path.basename(filename), gwl_files.get(filename))
+        if content is None:
+            return None
+        assert isinstance(content, string_types), 'Only string contents can be parsed before writing'
+        return content.splitlines()
+    return resolve
+
+
+def file_resolver():
+    """
+    Resolve absolute paths of GWL files, as used by includes in the mini GWL window.
+
+    @return: Function which returns an iterable of lines for a file name.
+    """
+    def resolve(filename):
+        if not os.path.isabs(filename) or not os.path.isfile(filename):
+            return None
+        return open(filename, 'r')
+    return resolve
+
+
+def chain_resolvers(*resolvers):
+    """
+    Resolve names of GWL files with the first of several resolvers which knows them.
+
+    @return: Function which returns an iterable of lines for a file name.
+    """
+    def resolve(filename):
+        for resolver in resolvers:
+            lines = resolver(filename)
+            if lines is not None:
+                return lines
+        return None
+    return resolve
+
+
+def iter_statements(start_name, resolver, _include_stack=()):
+    """
+    Iterate over the statements of a GWL file, following includes.
+
+    Comments (starting with '%') and empty lines are skipped. Lines starting with a number are point definitions,
+    all other lines are commands with their arguments.
+
+    @param start_name: Name of the file to parse.
+    @type start_name: str
+
+    @param resolver: Function which returns an iterable of lines for a file name, see L{folder_resolver} and
+        L{dict_resolver}.
+
+    @return: Generator of (filename, line number, command, arguments) tuples. The command is None for points,
+        the arguments are then a tuple of floats. Otherwise the arguments are a list of strings.
+
+    @raise GWLSyntaxError: Raised for malformed points and missing or recursive includes.
+    """
+    lines = resolver(start_name)
+    if lines is None:
+        raise GWLSyntaxError(_include_stack[-1][0] if _include_stack else start_name,
+                             _include_stack[-1][1] if _include_stack else 0,
+                             'File %s not found' % start_name)
+
+    try:
+        for lineno, line in enumerate(lines, 1):
+            line = line.split('%', 1)[0].strip()
+            if len(line) == 0:
+                continue
+
+            tokens = line.split()
+            try:
+                float(tokens[0])
+            except ValueError:
+                pass
+            else:
+                try:
+                    point = tuple(float(token) for token in tokens)
+                except ValueError:
+                    raise GWLSyntaxError(start_name, lineno, 'Malformed point: %s' % line)
+                yield start_name, lineno, None, point
+                continue
+
+            command = tokens[0]
+            if command.lower() == 'include':
+                if len(tokens) != 2:
+                    raise GWLSyntaxError(start_name, lineno, 'include expects exactly one file name')
+                include_name = tokens[1]
+                if include_name in [name for name, _ in _include_stack] or include_name == start_name:
+                    raise GWLSyntaxError(start_name, lineno, 'Recursive include of %s' % include_name)
+                for statement in iter_statements(include_name, resolver,
+                                                 _include_stack + ((start_name, lineno),)):
+                    yield statement
+                continue
+
+            yield start_name, lineno, command, tokens[1:]
+    finally:
+        if hasattr(lines, 'close'):
+            lines.close()
+
+
+# Number of numeric arguments of commands, which are checked by the validator
+_NUMERIC_COMMANDS = {
+    'write': 0,
+    'scanspeed': 1,
+    'piezosettlingtime': 1,
+    'laserpower': 1,
+    'wait': 1,
+    'movestagex': 1,
+    'movestagey': 1,
+    'addzdriveposition': 1,
+    'findinterfaceat': 1,
+    'xoffset': 1,
+    'yoffset': 1,
+    'zoffset': 1,
+}
+
+# Commands which make coordinates depend on the run time, the bounding box is then incomplete
+_DYNAMIC_COMMANDS = ('var', 'local', 'set', 'for', 'end', 'if', 'else', 'while', 'repeat')
+
+_OFFSET_COMMANDS = ('xoffset', 'yoffset', 'zoffset')
+
+
+class GWLValidator(object):
+    """
+    Checks GWL statements and computes the bounding box of the written structure.
+
+    The validator is passed through by L{check}, so validation can be combined with other consumers of the
+    statements in a single pass.
+    """
+
+    def __init__(self):
+        self.errors = list()
+        self.warnings = list()
+        self.dynamic = False
+
+        # Minimal and maximal coordinates of all points, None if there are no points
+        self.bounds = None
+
+    def check(self, statements):
+        """
+        Validate statements while passing them through.
+
+        @param statements: Statements as returned by L{iter_statements}.
+        @return: Generator of the same statements.
+        """
+        offset = [0.0, 0.0, 0.0]
+        unwritten = None
+        lower = [float('inf')] * 3
+        upper = [float('-inf')] * 3
+
+        for statement in statements:
+            filename, lineno, command, args = statement
+            location = '%s:%d' % (filename, lineno)
+
+            if command is None:
+                if len(args) not in (3, 4):
+                    self.errors.append('%s: Point needs 3 or 4 values, got %d' % (location, len(args)))
+                else:
+                    for i in range(3):
+                        value = args[i] + offset[i]
+                        lower[i] = min(lower[i], value)
+                        upper[i] = max(upper[i], value)
+                    unwritten = unwritten or location
+                yield statement
+                continue
+
+            name = command.lower()
+            if name.startswith('$') or name in _DYNAMIC_COMMANDS or any('$' in arg for arg in args):
+                self.dynamic = True
+            elif name in _NUMERIC_COMMANDS:
+                if len(args) != _NUMERIC_COMMANDS[name]:
+                    self.errors.append('%s: %s expects %d argument(s), got %d' %
+                                       (location, command, _NUMERIC_COMMANDS[name], len(args)))
+                else:
+                    try:
+                        values = [float(arg) for arg in args]
+                    except ValueError:
+                        self.errors.append('%s: %s expects numeric arguments' % (location, command))
+                    else:
+                        if name in _OFFSET_COMMANDS:
+                            offset[_OFFSET_COMMANDS.index(name)] = values[0]
+                        elif name == 'write':
+                            unwritten = None
+
+            yield statement
+
+        if unwritten is not None:
+            self.warnings.append('%s: Points are never written' % unwritten)
+
+        if self.dynamic:
+            self.warnings.append('Variables or control flow are used, the bounding box might be incomplete')
+
+        if lower[0] <= upper[0]:
+            self.bounds = (tuple(lower), tuple(upper))
+
+
+def validate(start_name, resolver):
+    """
+    Parse and validate a GWL bundle.
+
+    @see: L{iter_statements}
+
+    @return: The validator holding errors, warnings and the bounding box.
+    @rtype: GWLValidator
+    """
+    validator = GWLValidator()
+    try:
+        for _ in validator.check(iter_statements(start_name, resolver)):
+            pass
+    except GWLSyntaxError as e:
+        validator.errors.append(str(e))
+    return validator
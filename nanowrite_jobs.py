@@ -0,0 +1,229 @@
+"""
+Persistent history of the jobs executed by NanoWrite.
+
+Every job is stored in a local SQLite database together with the content hash of its GWL bundle, the submit, start
+and finish times and its result. This allows to answer questions like "how long did this structure take last week"
+after server restarts.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    digest TEXT,
+    name TEXT,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    message TEXT,
+    artifacts TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_digest ON jobs (digest, finished);
+CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted);
+CREATE INDEX IF NOT EXISTS jobs_result ON jobs (result, submitted);
+CREATE TABLE IF NOT EXISTS features (
+    digest TEXT PRIMARY KEY,
+    features TEXT NOT NULL
+);
+"""
+
+_COLUMNS = ('id', 'kind', 'digest', 'name', 'submitted', 'started', 'finished', 'result', 'message', 'artifacts')
+
+
+class JobHistory(object):
+    """
+    SQLite store of executed jobs.
+
+    All times are given in seconds since the epoch. Results are 'done', 'aborted' or 'error'. Jobs which have not
+    finished yet have no result.
+    """
+
+    def __init__(self, path):
+        """
+        @param path: Path of the SQLite database. It is created if it does not exist.
+        @type path: str
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def begin(self, kind, digest=None, name=None, submitted=None):
+        """
+        Record a newly submitted job.
+
+        @param kind: Kind of the job, e.g. 'mini', 'file' or 'dlw'.
+        @type kind: str
+
+        @param digest: Content hash of the GWL bundle.
+        @type digest: str
+
+        @param name: Human readable name, e.g. the name of the start file.
+        @type name: str
+
+        @param submitted: Submit time, defaults to now.
+        @type submitted: float
+
+        @return: The id of the job.
+        @rtype: int
+        """
+        submitted = submitted if submitted is not None else time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute('INSERT INTO jobs (kind, digest, name, submitted) VALUES (?, ?, ?, ?)',
+                                      (kind, digest, name, submitted))
+            return cursor.lastrowid
+
+    def mark_started(self, job_id, started=None):
+        """
+        Record the start of the execution of a job.
+        """
+        started = started if started is not None else time.time()
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET started = ? WHERE id = ?', (started, job_id))
+
+    def finish(self, job_id, result, message=None, started=None, finished=None):
+        """
+        Record the end of a job.
+
+        @param result: 'done', 'aborted' or 'error'.
+        @type result: str
+
+        @param message: The error message in case of an error.
+        @type message: str
+
+        @param started: Start time, overrides a previously recorded start time if given.
+        @type started: float
+
+        @param finished: Finish time, defaults to now.
+        @type finished: float
+        """
+        finished = finished if finished is not None else time.time()
+        with self._lock, self._db:
+            self._db.execute('UPDATE jobs SET started = COALESCE(?, started), finished = ?, result = ?, message = ? '
+                             'WHERE id = ?', (started, finished, result, message, job_id))
+
+    def add_artifacts(self, job_id, paths):
+        """
+        Record the paths of files read back after a job.
+
+        @type paths: list
+        """
+        with self._lock, self._db:
+            row = self._db.execute('SELECT artifacts FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            artifacts = json.loads(row[0]) if row is not None and row[0] else []
+            artifacts.extend(paths)
+            self._db.execute('UPDATE jobs SET artifacts = ? WHERE id = ?', (json.dumps(artifacts), job_id))
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(zip(_COLUMNS, row))
+        job['artifacts'] = json.loads(job['artifacts']) if job['artifacts'] else []
+        job['duration'] = None
+        if job['started'] is not None and job['finished'] is not None:
+            job['duration'] = job['finished'] - job['started']
+        return job
+
+    def get(self, job_id):
+        """
+        Get a single job.
+
+        @return: Dictionary with the recorded values and the 'duration' in seconds, or None if the job is unknown.
+        @rtype: dict
+        """
+        with self._lock:
+            row = self._db.execute('SELECT %s FROM jobs WHERE id = ?' % ', '.join(_COLUMNS), (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def query(self, digest=None, kind=None, result=None, since=None, until=None, limit=100):
+        """
+        Query recorded jobs, the most recently submitted first.
+
+        @param digest: Only jobs with this content hash.
+        @param kind: Only jobs of this kind.
+        @param result: Only jobs with this result.
+        @param since: Only jobs submitted at or after this time.
+        @param until: Only jobs submitted before this time.
+        @param limit: Maximal number of returned jobs.
+
+        @return: List of dictionaries, see L{get}.
+        @rtype: list
+        """
+        conditions = []
+        params = []
+        for column, value in (('digest', digest), ('kind', kind), ('result', result)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                params.append(value)
+        if since is not None:
+            conditions.append('submitted >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('submitted < ?')
+            params.append(until)
+
+        sql = 'SELECT %s FROM jobs' % ', '.join(_COLUMNS)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY submitted DESC, id DESC LIMIT ?'
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def durations(self, digest, limit=100):
+        """
+        Get the durations of the most recent successfully finished jobs with the given content hash.
+
+        @return: List of durations in seconds.
+        @rtype: list
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT finished - started FROM jobs '
+                                    'WHERE digest = ? AND result = ? AND started IS NOT NULL '
+                                    'ORDER BY finished DESC LIMIT ?', (digest, 'done', limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def set_features(self, digest, features):
+        """
+        Store the features of a GWL bundle used for write time estimation.
+
+        @param features: Dictionary of feature names and values.
+        @type features: dict
+        """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO features (digest, features) VALUES (?, ?)',
+                             (digest, json.dumps(features)))
+
+    def get_features(self, digest):
+        """
+        @return: The stored features of a GWL bundle or None.
+        @rtype: dict
+        """
+        with self._lock:
+            row = self._db.execute('SELECT features FROM features WHERE digest = ?', (digest,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def calibration_samples(self, limit=1000):
+        """
+        Get the features and actual durations of the most recent successfully finished jobs.
+
+        @return: List of (features, duration) tuples.
+        @rtype: list
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT features.features, jobs.finished - jobs.started FROM jobs '
+                                    'JOIN features ON features.digest = jobs.digest '
+                                    'WHERE jobs.result = ? AND jobs.started IS NOT NULL '
+                                    'ORDER BY jobs.finished DESC LIMIT ?', ('done', limit)).fetchall()
+        return [(json.loads(features), duration) for features, duration in rows]
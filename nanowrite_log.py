@@ -0,0 +1,251 @@
+"""
+Parsing of the NanoWrite messages log.
+
+This module does not depend on the Windows automation layer. Only the default location of the log directory needs
+the winpaths module, which is imported when it is actually used.
+"""
+
+import datetime
+import os
+import os.path
+import threading
+import time
+
+
+def get_messages_dir():
+    """
+    Get the default directory of the NanoWrite messages logs.
+
+    @return: Path of %localappdata%\Nanoscribe\Messages
+    @rtype: str
+    """
+    import winpaths
+    return os.path.join(winpaths.get_local_appdata(), 'Nanoscribe\Messages')
+
+
+def get_latest_log_path(msgs_dir_path=None):
+    """
+    Get the path of the most recent log file.
+
+    @param msgs_dir_path: Directory of the log files, defaults to L{get_messages_dir}.
+    @type msgs_dir_path: str
+
+    @rtype: str
+    """
+    if msgs_dir_path is None:
+        msgs_dir_path = get_messages_dir()
+    assert os.path.exists(msgs_dir_path), 'NanoWrite messages log path does not exist'
+
+    # Get the most recent log file name
+    # FIXME: This fails if there are other file names than '2013-07-08_16-17-00_Messages.log'
+    log_file_name = os.listdir(msgs_dir_path)[-1]
+    return os.path.join(msgs_dir_path, log_file_name)
+
+
+def parse_log_lines(lines, results=None):
+    """
+    Parse lines of a log file. Lines without a timestamp are appended to the previous message.
+
+    @param lines: Iterable of lines as read from the log file.
+
+    @param results: Already parsed entries, which the new lines are appended to.
+    @type results: list
+
+    @return: List of two elements lists, containing a datetime object and the log message.
+    @rtype: list
+    """
+    results = results if results is not None else list()
+    for line in lines:
+        if len(line) <= 30:
+            continue
+        line = line.decode('latin-1')
+        timestamp_txt = line[:28]
+        msg_txt = line[29:]
+
+        if len(timestamp_txt.strip()) == 0:
+            assert len(results) > 0, 'No previous timestamp available in log file'
+            results[-1][1] += msg_txt
+        else:
+            # FIXME: Don't ignore time zone offset here
+            timestamp_struct = time.strptime(timestamp_txt[:19], '%Y-%m-%dT%H:%M:%S')
+            timestamp = datetime.datetime.fromtimestamp(time.mktime(timestamp_struct))
+            results.append([timestamp, msg_txt])
+    return results
+
+
+def get_current_log(msgs_dir_path=None):
+    """
+    Returns the current log since the start of the NanoWrite program.
+
+    @note:
+        This assumes that the latest log file in %localappdata%\Nanoscribe\Messages
+        contains all the recent logs since the program started.
+
+    @param msgs_dir_path: Directory of the log files, defaults to L{get_messages_dir}.
+    @type msgs_dir_path: str
+
+    @return: List of two elements lists, containing a datetime object and the log message.
+        The latest log message is the last element of the list.
+    @rtype: list
+    """
+    with open(get_latest_log_path(msgs_dir_path), 'r') as f:
+        return parse_log_lines(f)
+
+
+class LogReader(object):
+    """
+    Incremental reader of the latest log file.
+
+    Only lines appended since the last update are read and parsed. If NanoWrite starts a new log file, the reader
+    starts over with it.
+    """
+
+    def __init__(self, msgs_dir_path=None):
+        """
+        @param msgs_dir_path: Directory of the log files, defaults to L{get_messages_dir}.
+        @type msgs_dir_path: str
+        """
+        self._msgs_dir_path = msgs_dir_path
+        self._lock = threading.Lock()
+        self._log_path = None
+        self._offset = 0
+        self._entries = list()
+
+        # Recorder of the read data, see nanowrite_trace.TraceWriter
+        self.trace = None
+
+    def _latest_log_path(self):
+        return get_latest_log_path(self._msgs_dir_path)
+
+    def _read(self, log_path, offset):
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            return f.read()
+
+    def _update(self):
+        log_path = self._latest_log_path()
+        if log_path != self._log_path:
+            self._log_path = log_path
+            self._offset = 0
+            self._entries = list()
+
+        data = self._read(log_path, self._offset)
+        trace = self.trace
+        if trace is not None and len(data) > 0:
+            trace.record_log(os.path.basename(log_path), self._offset, data)
+
+        # Only parse complete lines, the rest is read again on the next update
+        end = data.rfind('\n') + 1
+        if end == 0:
+            return
+        self._offset += end
+        # The file is read in binary mode to get byte offsets, so convert line endings like in text mode
+        parse_log_lines(data[:end].replace('\r\n', '\n').splitlines(True), self._entries)
+
+    def update(self):
+        """
+        Read the lines appended to the log since the last update.
+
+        @return: The number of log entries.
+        @rtype: int
+        """
+        with self._lock:
+            self._update()
+            return len(self._entries)
+
+    def get_log_id(self):
+        """
+        @return: Identifier of the current log file. It changes whenever NanoWrite starts a new log file.
+        @rtype: str
+        """
+        with self._lock:
+            return os.path.basename(self._log_path) if self._log_path is not None else ''
+
+    def get_entries(self, start=0, stop=None, update=True):
+        """
+        Get a range of log entries.
+
+        @param start: Index of the first entry.
+        @type start: int
+
+        @param stop: Index after the last entry, None for all entries.
+        @type stop: int
+
+        @param update: Read new lines from the log file first.
+        @type update: bool
+
+        @return: List of two elements lists, containing a datetime object and the log message.
+        @rtype: list
+        """
+        with self._lock:
+            if update:
+                self._update()
+            return [list(entry) for entry in self._entries[start:stop]]
+
+    def get_last_entry(self, update=True):
+        """
+        @return: The latest log entry as list of a datetime object and the log message or None if the log is empty.
+        @rtype: list
+        """
+        with self._lock:
+            if update:
+                self._update()
+            return list(self._entries[-1]) if len(self._entries) > 0 else None
+
+    def get_entries_from_last(self, marker, update=True):
+        """
+        Get all entries starting with the last one which contains a marker.
+
+        @param marker: Substring to search for in the messages.
+        @type marker: str
+
+        @return: List of log entries, all entries if no message contains the marker.
+        @rtype: list
+        """
+        with self._lock:
+            if update:
+                self._update()
+            start = 0
+            for index in xrange(len(self._entries) - 1, -1, -1):
+                if marker in self._entries[index][1]:
+                    start = index
+                    break
+            return [list(entry) for entry in self._entries[start:]]
+
+    def get_since(self, cursor=None, max_entries=1000):
+        """
+        Get the log entries after a cursor.
+
+        The last entry of the log might still grow by continuation lines. It is therefore always returned again by
+        the next call, replacing the old copy at index 'start'.
+
+        @param cursor: Cursor returned by the previous call, None or '' to start at the beginning of the log.
+        @type cursor: str
+
+        @param max_entries: Maximal number of returned entries.
+        @type max_entries: int
+
+        @return: Dictionary with the keys 'log_id', 'start' (index of the first returned entry), 'entries',
+            'cursor' (cursor for the next call), 'total' (number of entries) and 'reset' (True if the previous
+            cursor belongs to another log file and the client has to drop its entries).
+        @rtype: dict
+        """
+        with self._lock:
+            self._update()
+            log_id = os.path.basename(self._log_path)
+            total = len(self._entries)
+
+            start = 0
+            reset = True
+            if cursor:
+                cursor_log_id, _, cursor_index = cursor.rpartition(':')
+                if cursor_log_id == log_id and int(cursor_index) <= total:
+                    start = int(cursor_index)
+                    reset = False
+
+            entries = [list(entry) for entry in self._entries[start:start + max_entries]]
+
+        end = start + len(entries)
+        next_index = end - 1 if end == total and end > start else end
+        return {'log_id': log_id, 'start': start, 'entries': entries, 'cursor': '%s:%d' % (log_id, next_index),
+                'total': total, 'reset': reset}
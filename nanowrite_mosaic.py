@@ -0,0 +1,407 @@
+"""
+Stitching of camera frames into an overview of the sample.
+
+Frames are placed by their stage positions first, each stage position being the center of its frame. The offsets of
+overlapping frames are then measured by phase correlation, with the FFTs of the pairs computed in batches, and the
+frame positions are fitted to all measured offsets at once. The blended overview is stored as a pyramid of tiles,
+from which marker searches and repeated views read only the tiles they need.
+
+A pyramid is a directory with a 'pyramid.json' file and PNG tiles named '<level>-<row>-<column>.png'. Level 0 has the
+full resolution, every further level halves it.
+
+@note: This module requires numpy and PIL.
+"""
+
+import collections
+import json
+import os.path
+import threading
+
+import numpy as np
+
+
+PYRAMID_META = 'pyramid.json'
+
+# Number of frame pairs whose FFTs are computed at once, which bounds the memory of the offset measurement
+PAIR_CHUNK_SIZE = 16
+
+
+def _to_array(image):
+    """
+    Convert a PIL image or an array into a two dimensional float array.
+    """
+    if hasattr(image, 'convert'):
+        image = image.convert('L')
+    return np.asarray(image, dtype=np.float32)
+
+
+class Mosaic(object):
+    """
+    Collects positioned frames and stitches them into an overview.
+    """
+
+    def __init__(self, pixel_size, axes=(1, 1)):
+        """
+        @param pixel_size: Size of a camera pixel on the sample in micrometers.
+        @type pixel_size: float
+
+        @param axes: Direction of the image x and y axes relative to the stage x and y axes, each 1 or -1.
+        @type axes: tuple
+        """
+        self.pixel_size = float(pixel_size)
+        self.axes = np.array(axes, dtype=np.float64)
+
+        self._frames = list()
+        # Nominal and refined positions of the frames' upper left corners in pixels
+        self._nominal = list()
+        self.positions = None
+
+    def add_frame(self, image, stage_position):
+        """
+        Add a frame captured at a stage position.
+
+        @param image: PIL image or two dimensional array. All frames must have the same size.
+
+        @param stage_position: Stage x and y position of the center of the frame in micrometers.
+        @type stage_position: tuple
+
+        @return: Index of the frame.
+        @rtype: int
+        """
+        frame = _to_array(image)
+        assert len(self._frames) == 0 or frame.shape == self._frames[0].shape, 'All frames must have the same size'
+        self._frames.append(frame)
+        center = self.axes * np.array(stage_position[:2], dtype=np.float64) / self.pixel_size
+        self._nominal.append(center - np.array(frame.shape[::-1], dtype=np.float64) / 2)
+        self.positions = None
+        return len(self._frames) - 1
+
+    def _get_frame_size(self):
+        """
+        @return: Tuple of the height and width of the frames.
+        @rtype: tuple
+
+        @raise ValueError: Raised if no frames have been added.
+        """
+        if len(self._frames) == 0:
+            raise ValueError('The mosaic has no frames')
+        return self._frames[0].shape
+
+    def _get_positions(self):
+        return np.array(self.positions if self.positions is not None else self._nominal)
+
+    def find_pairs(self, min_overlap=0.1):
+        """
+        Find the pairs of frames which overlap at their nominal positions.
+
+        @param min_overlap: Minimal overlap as fraction of the frame size in x and y.
+        @type min_overlap: float
+
+        @return: Array of shape (pairs, 2) with the frame indices.
+        @rtype: numpy.ndarray
+        """
+        height, width = self._get_frame_size()
+        nominal = np.array(self._nominal)
+        offsets = np.abs(nominal[np.newaxis, :, :] - nominal[:, np.newaxis, :])
+        overlapping = ((offsets[..., 0] <= width * (1 - min_overlap)) &
+                       (offsets[..., 1] <= height * (1 - min_overlap)))
+        first, second = np.nonzero(np.triu(overlapping, 1))
+        return np.column_stack((first, second))
+
+    def measure_offsets(self, pairs, max_error=50.0, chunk_size=PAIR_CHUNK_SIZE):
+        """
+        Measure the offsets of pairs of frames by phase correlation.
+
+        @param pairs: Array of shape (pairs, 2) with frame indices, see L{find_pairs}.
+
+        @param max_error: Maximal deviation of a measured offset from the nominal one in pixels.
+        @type max_error: float
+
+        @param chunk_size: Number of pairs whose FFTs are computed at once.
+        @type chunk_size: int
+
+        @return: Tuple of the measured offsets (second minus first frame position) of shape (pairs, 2) and the
+            correlation peaks of shape (pairs,). The peak is 0 if no offset has been found within @p max_error.
+        @rtype: tuple
+        """
+        height, width = self._get_frame_size()
+        pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+        nominal = np.array(self._nominal)
+
+        expected = np.round(nominal[pairs[:, 1]] - nominal[pairs[:, 0]]).astype(np.int64)
+        flat_peaks = np.zeros(len(pairs), dtype=np.int64)
+        peaks = np.zeros(len(pairs), dtype=np.float64)
+        for start in range(0, len(pairs), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            flat_peaks[chunk], peaks[chunk] = self._correlate(pairs[chunk], expected[chunk])
+
+        # The correlation is periodic, the residual to the nominal offset is the shortest shift
+        size = np.array([width, height])
+        residuals = np.column_stack((flat_peaks % width, flat_peaks // width))
+        residuals = (residuals + size // 2) % size - size // 2
+        offsets = (expected + residuals).astype(np.float64)
+
+        peaks = np.where(np.abs(residuals).max(axis=1) <= max_error, peaks, 0.0)
+        return offsets, peaks
+
+    def _correlate(self, pairs, expected):
+        """
+        Phase correlate a chunk of pairs of frames.
+
+        @return: Tuple of the flat indices of the correlation peaks and their heights.
+        @rtype: tuple
+        """
+        height, width = self._frames[0].shape
+
+        # Cut the nominal overlap out of both frames and window it, so the borders do not dominate the correlation
+        first_crops = np.zeros((len(pairs), height, width), dtype=np.float32)
+        second_crops = np.zeros_like(first_crops)
+        for index, ((first, second), (dx, dy)) in enumerate(zip(pairs, expected)):
+            x0, x1 = max(0, dx), min(width, width + dx)
+            y0, y1 = max(0, dy), min(height, height + dy)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            window = np.outer(np.hanning(y1 - y0), np.hanning(x1 - x0)).astype(np.float32)
+            for crops, frame, x, y in ((first_crops, self._frames[first], x0, y0),
+                                       (second_crops, self._frames[second], x0 - dx, y0 - dy)):
+                crop = frame[y:y + y1 - y0, x:x + x1 - x0]
+                crops[index, :y1 - y0, :x1 - x0] = (crop - crop.mean()) * window
+
+        cross_power = (np.fft.rfft2(first_crops) * np.conj(np.fft.rfft2(second_crops))).astype(np.complex64)
+        cross_power /= np.maximum(np.abs(cross_power), 1e-12)
+        correlation = np.fft.irfft2(cross_power, s=(height, width)).astype(np.float32).reshape(len(pairs), -1)
+
+        flat_peaks = correlation.argmax(axis=1)
+        return flat_peaks, correlation[np.arange(len(pairs)), flat_peaks]
+
+    def refine(self, min_overlap=0.1, max_error=50.0, min_peak=0.05, prior_weight=0.01):
+        """
+        Refine the frame positions with the measured offsets of all overlapping frames.
+
+        The positions are the least squares solution of all measured offsets, weighted by their correlation peaks,
+        and of the nominal positions with a small weight.
+
+        @param min_peak: Minimal correlation peak for a measured offset to be used.
+        @type min_peak: float
+
+        @param prior_weight: Weight of the nominal positions relative to a perfect correlation.
+        @type prior_weight: float
+
+        @return: Number of used offsets.
+        @rtype: int
+        """
+        nominal = np.array(self._nominal)
+        count = len(nominal)
+        pairs = self.find_pairs(min_overlap)
+        if len(pairs) > 0:
+            offsets, peaks = self.measure_offsets(pairs, max_error)
+            used = peaks >= min_peak
+            pairs, offsets, peaks = pairs[used], offsets[used], peaks[used]
+        else:
+            offsets, peaks = np.zeros((0, 2)), np.zeros(0)
+
+        matrix = np.zeros((len(pairs) + count, count))
+        rows = np.arange(len(pairs))
+        matrix[rows, pairs[:, 1]] = peaks
+        matrix[rows, pairs[:, 0]] = -peaks
+        matrix[len(pairs) + np.arange(count), np.arange(count)] = prior_weight
+        targets = np.vstack((offsets * peaks[:, np.newaxis], nominal * prior_weight))
+
+        self.positions = np.linalg.lstsq(matrix, targets, rcond=None)[0]
+        return len(pairs)
+
+    def blend(self):
+        """
+        Blend the frames into the overview. Overlapping frames are weighted by their distance to the frame border.
+
+        @return: Tuple of the overview as float array and the position of its upper left corner in pixels.
+        @rtype: tuple
+        """
+        height, width = self._get_frame_size()
+        positions = np.round(self._get_positions()).astype(np.int64)
+        origin = positions.min(axis=0)
+        positions -= origin
+        extent = positions.max(axis=0) + (width, height)
+
+        ramp_x = np.minimum(np.arange(1, width + 1), np.arange(width, 0, -1)).astype(np.float32)
+        ramp_y = np.minimum(np.arange(1, height + 1), np.arange(height, 0, -1)).astype(np.float32)
+        weight = np.outer(ramp_y, ramp_x)
+
+        overview = np.zeros((extent[1], extent[0]), dtype=np.float32)
+        weights = np.zeros_like(overview)
+        for frame, (x, y) in zip(self._frames, positions):
+            overview[y:y + height, x:x + width] += frame * weight
+            weights[y:y + height, x:x + width] += weight
+
+        overview /= np.maximum(weights, 1e-12)
+        return overview, tuple(origin.tolist())
+
+    def save_pyramid(self, path, tile_size=256):
+        """
+        Blend the frames and store the overview as pyramid of tiles.
+
+        @param path: Directory of the pyramid.
+        @type path: str
+
+        @return: The metadata of the pyramid, see L{TilePyramid.write}.
+        @rtype: dict
+        """
+        overview, origin = self.blend()
+        height, width = self._get_frame_size()
+        return TilePyramid.write(path, overview, origin=origin, pixel_size=self.pixel_size,
+                                 axes=tuple(self.axes.tolist()), frame_size=(width, height), tile_size=tile_size)
+
+
+class TilePyramid(object):
+    """
+    Reads regions of a stored pyramid. Recently used tiles are kept in memory.
+    """
+
+    def __init__(self, path, max_tiles=256):
+        """
+        @param path: Directory of the pyramid.
+        @type path: str
+
+        @param max_tiles: Number of tiles kept in memory.
+        @type max_tiles: int
+        """
+        self._path = path
+        with open(os.path.join(path, PYRAMID_META), 'r') as f:
+            self.meta = json.load(f)
+
+        self._max_tiles = max_tiles
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tile_name(level, row, column):
+        return '%d-%d-%d.png' % (level, row, column)
+
+    @staticmethod
+    def write(path, overview, origin=(0, 0), pixel_size=1.0, axes=(1, 1), frame_size=None, tile_size=256):
+        """
+        Store an image as pyramid of tiles.
+
+        @param overview: The image as two dimensional array with values from 0 to 255.
+        @type overview: numpy.ndarray
+
+        @param origin: Position of the upper left corner of the image in mosaic pixels, in which a stage position is
+            the position divided by the pixel size and multiplied with the axes.
+        @param pixel_size: Size of a pixel of level 0 in micrometers.
+        @param axes: Direction of the image axes relative to the stage axes.
+        @param frame_size: Width and height of the stitched frames in pixels, whose centers are at their stage
+            positions.
+
+        @return: The metadata with the keys 'width', 'height' (of level 0), 'levels', 'tile_size', 'origin',
+            'pixel_size', 'axes' and 'frame_size'.
+        @rtype: dict
+        """
+        from PIL import Image
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        image = np.clip(np.round(overview), 0, 255).astype(np.uint8)
+        meta = {'width': image.shape[1], 'height': image.shape[0], 'levels': 0, 'tile_size': tile_size,
+                'origin': list(origin), 'pixel_size': pixel_size, 'axes': list(axes),
+                'frame_size': list(frame_size) if frame_size is not None else None}
+
+        level = 0
+        while True:
+            for row in range(0, (image.shape[0] + tile_size - 1) // tile_size):
+                for column in range(0, (image.shape[1] + tile_size - 1) // tile_size):
+                    tile = image[row * tile_size:(row + 1) * tile_size, column * tile_size:(column + 1) * tile_size]
+                    Image.fromarray(tile).save(os.path.join(path, TilePyramid.tile_name(level, row, column)))
+            level += 1
+            if max(image.shape) <= tile_size:
+                break
+
+            # Halve the resolution by averaging 2x2 blocks, odd sizes are padded with the border
+            padded = np.pad(image, ((0, image.shape[0] % 2), (0, image.shape[1] % 2)), mode='edge')
+            image = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).mean(axis=(1, 3))
+            image = np.round(image).astype(np.uint8)
+
+        meta['levels'] = level
+        with open(os.path.join(path, PYRAMID_META), 'w') as f:
+            json.dump(meta, f)
+        return meta
+
+    def get_tile(self, level, row, column):
+        """
+        @return: The tile as two dimensional uint8 array.
+        @rtype: numpy.ndarray
+        """
+        key = (level, row, column)
+        with self._lock:
+            tile = self._tiles.pop(key, None)
+            if tile is not None:
+                self._tiles[key] = tile
+                return tile
+
+        from PIL import Image
+        tile = np.asarray(Image.open(os.path.join(self._path, self.tile_name(level, row, column))))
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self._max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def read_region(self, x, y, width, height, level=0):
+        """
+        Read a region of the overview. Areas outside of the overview are 0.
+
+        @param x: Left border of the region in pixels of the level.
+        @param y: Upper border of the region in pixels of the level.
+
+        @return: The region as two dimensional uint8 array.
+        @rtype: numpy.ndarray
+        """
+        assert 0 <= level < self.meta['levels'], 'Invalid level'
+        tile_size = self.meta['tile_size']
+        level_width = -(-self.meta['width'] // 2 ** level)
+        level_height = -(-self.meta['height'] // 2 ** level)
+
+        region = np.zeros((height, width), dtype=np.uint8)
+        for row in range(max(0, y // tile_size), min(y + height, level_height) // tile_size + 1):
+            for column in range(max(0, x // tile_size), min(x + width, level_width) // tile_size + 1):
+                if row * tile_size >= level_height or column * tile_size >= level_width:
+                    continue
+                tile = self.get_tile(level, row, column)
+                top, left = row * tile_size, column * tile_size
+                # Intersection of the tile and the region in level coordinates
+                y0, y1 = max(y, top), min(y + height, top + tile.shape[0])
+                x0, x1 = max(x, left), min(x + width, left + tile.shape[1])
+                if y0 < y1 and x0 < x1:
+                    region[y0 - y:y1 - y, x0 - x:x1 - x] = tile[y0 - top:y1 - top, x0 - left:x1 - left]
+        return region
+
+    def stage_to_pixel(self, stage_x, stage_y, level=0):
+        """
+        Convert a stage position into pixel coordinates of a level. A frame captured at a stage position is centered
+        on it.
+
+        @return: Tuple of the x and y pixel coordinates.
+        @rtype: tuple
+        """
+        axes = self.meta['axes']
+        pixel_x = (axes[0] * stage_x / self.meta['pixel_size'] - self.meta['origin'][0]) / 2 ** level
+        pixel_y = (axes[1] * stage_y / self.meta['pixel_size'] - self.meta['origin'][1]) / 2 ** level
+        return pixel_x, pixel_y
+
+    def read_stage_region(self, stage_x, stage_y, width, height, level=0):
+        """
+        Read a region of the overview around a stage position.
+
+        @param stage_x: Stage x position of the center of the region in micrometers.
+        @param stage_y: Stage y position of the center of the region in micrometers.
+
+        @param width: Width of the region in pixels of the level.
+        @param height: Height of the region in pixels of the level.
+
+        @return: The region as two dimensional uint8 array.
+        @rtype: numpy.ndarray
+        """
+        pixel_x, pixel_y = self.stage_to_pixel(stage_x, stage_y, level)
+        return self.read_region(int(round(pixel_x - width / 2.0)), int(round(pixel_y - height / 2.0)), width, height,
+                                level)
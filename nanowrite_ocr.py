@@ -0,0 +1,269 @@
+"""
+Reading of numeric text fields from a screenshot of NanoWrite.
+
+LabView draws the fields with a fixed font, so every character always looks the same. The reader cuts the characters
+out of the field regions of a single screenshot and matches all of them at once against a set of glyph templates.
+There is no need to click into the fields or to use the clipboard.
+
+The glyph set is learned from fields whose text is known, e.g. from a value which has been read via the clipboard
+because the reader was not confident enough. Until every character of a field type has been learned, a missing
+character would silently be read as the most similar known one, see L{FieldReader.knows}.
+
+@note: This module requires numpy.
+"""
+
+import os.path
+import threading
+
+import numpy as np
+
+
+# Characters which can occur in the numeric fields
+CHARACTERS = '0123456789.-:'
+
+
+class FieldReader(object):
+    """
+    Reads text fields by template matching against a glyph set.
+    """
+
+    def __init__(self, field_box, glyph_file=None, min_confidence=0.9, min_margin=0.05, ink_threshold=0.5):
+        """
+        @param field_box: Region of a field relative to its position as (left, top, right, bottom) in pixels.
+        @type field_box: tuple
+
+        @param glyph_file: Path of the glyph set. It is loaded if it exists and updated by L{learn}.
+        @type glyph_file: str
+
+        @param min_confidence: Minimal correlation of every character with its template for a confident read.
+        @type min_confidence: float
+
+        @param min_margin: Minimal difference between the correlation with the best and the second best template of
+            every character for a confident read.
+        @type min_margin: float
+
+        @param ink_threshold: Minimal relative contrast of a pixel to the background to count as part of a character.
+        @type ink_threshold: float
+        """
+        self._field_box = field_box
+        self._glyph_file = glyph_file
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self._ink_threshold = ink_threshold
+
+        self._lock = threading.Lock()
+
+        # Character -> sum of all learned glyphs and their number, glyphs are (height, width) arrays
+        self._glyph_sums = dict()
+        self._glyph_counts = dict()
+        self._shape = None
+        self._templates = None
+
+        if glyph_file is not None and os.path.exists(glyph_file):
+            self.load(glyph_file)
+
+    def load(self, path):
+        """
+        Load a glyph set saved with L{save}.
+        """
+        with np.load(path) as data:
+            characters = [str(c) for c in data['characters']]
+            with self._lock:
+                self._glyph_sums = dict(zip(characters, data['sums'].astype(np.float64)))
+                self._glyph_counts = dict(zip(characters, data['counts'].tolist()))
+                self._shape = tuple(data['sums'].shape[1:])
+                self._templates = None
+
+    def save(self, path=None):
+        """
+        Save the glyph set.
+
+        @param path: Path of the file, defaults to the glyph file given to the constructor. Missing directories are
+            created.
+        @type path: str
+        """
+        path = path if path is not None else self._glyph_file
+        with self._lock:
+            characters = sorted(self._glyph_sums)
+            if len(characters) == 0:
+                return
+            sums = np.array([self._glyph_sums[c] for c in characters])
+            counts = np.array([self._glyph_counts[c] for c in characters])
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            np.savez(f, characters=np.array(characters), sums=sums, counts=counts)
+
+    def get_characters(self):
+        """
+        @return: The characters of the glyph set.
+        @rtype: str
+        """
+        with self._lock:
+            return ''.join(sorted(self._glyph_sums))
+
+    def knows(self, characters):
+        """
+        @param characters: The characters which can occur in a field.
+        @type characters: str
+
+        @return: True if all @p characters have been learned, only then fields can be read confidently.
+        @rtype: bool
+        """
+        with self._lock:
+            return all(c in self._glyph_sums for c in characters)
+
+    def is_confident(self, confidence, margin):
+        """
+        @return: True if a field read by L{read_fields} with @p confidence and @p margin can be trusted.
+        @rtype: bool
+        """
+        return confidence >= self.min_confidence and margin >= self.min_margin
+
+    @staticmethod
+    def to_gray(image):
+        """
+        Convert a PIL image into a gray scale array, as used by L{read_fields} and L{learn}.
+
+        @rtype: numpy.ndarray
+        """
+        return np.asarray(image.convert('L'), dtype=np.float32)
+
+    def _cut_field(self, gray, position):
+        left, top, right, bottom = self._field_box
+        x, y = position
+        return gray[max(0, y + top):y + bottom, max(0, x + left):x + right]
+
+    def _segment(self, field):
+        """
+        Cut the characters out of a field.
+
+        @return: List of (height, width) arrays with the ink of each character between 0 and 1.
+        @rtype: list
+        """
+        if field.size == 0:
+            return []
+
+        # The background is the most common brightness, text might be darker or brighter
+        background = np.median(field)
+        ink = np.abs(field - background)
+        contrast = ink.max()
+        if contrast == 0:
+            return []
+        ink /= contrast
+
+        mask = ink >= self._ink_threshold
+        rows = np.flatnonzero(mask.any(axis=1))
+        ink = ink[rows[0]:rows[-1] + 1]
+
+        # Characters are separated by empty columns
+        columns = np.concatenate(([0], mask.any(axis=0).astype(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(columns))
+        return [ink[:, start:stop] for start, stop in zip(edges[::2], edges[1::2])]
+
+    def _fit(self, glyph, shape):
+        canvas = np.zeros(shape, dtype=np.float64)
+        height, width = min(glyph.shape[0], shape[0]), min(glyph.shape[1], shape[1])
+        canvas[:height, :width] = glyph[:height, :width]
+        return canvas
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = vectors - vectors.mean(axis=1)[:, np.newaxis]
+        norms = np.sqrt((vectors ** 2).sum(axis=1))
+        return vectors / np.maximum(norms, 1e-9)[:, np.newaxis]
+
+    def _get_templates(self):
+        with self._lock:
+            if self._templates is None and len(self._glyph_sums) > 0:
+                characters = sorted(self._glyph_sums)
+                means = np.array([self._glyph_sums[c] / self._glyph_counts[c] for c in characters])
+                self._templates = characters, self._shape, self._normalize(means.reshape(len(characters), -1))
+            return self._templates
+
+    def read_fields(self, gray, positions):
+        """
+        Read several fields of a screenshot at once.
+
+        @param gray: Gray scale screenshot, see L{to_gray}.
+        @type gray: numpy.ndarray
+
+        @param positions: Dictionary of field names and their positions.
+        @type positions: dict
+
+        @return: Dictionary of field names and tuples of the read text, the confidence and the margin. The confidence
+            is the lowest correlation of a character with its template, the margin the lowest difference to the
+            correlation with the second best template. Both are 0 if the field could not be read. See
+            L{is_confident}.
+        @rtype: dict
+        """
+        results = {name: ('', 0.0, 0.0) for name in positions}
+        templates = self._get_templates()
+        if templates is None:
+            return results
+        characters, shape, template_vectors = templates
+
+        names = list()
+        glyphs = list()
+        for name, position in positions.items():
+            for glyph in self._segment(self._cut_field(gray, position)):
+                names.append(name)
+                glyphs.append(self._fit(glyph, shape))
+        if len(glyphs) == 0:
+            return results
+
+        # Correlate all characters of all fields with all templates in a single product
+        scores = np.dot(self._normalize(np.array(glyphs).reshape(len(glyphs), -1)), template_vectors.T)
+        best = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(glyphs)), best]
+        if len(characters) > 1:
+            margins = confidences - np.partition(scores, -2, axis=1)[:, -2]
+        else:
+            margins = np.zeros(len(glyphs))
+
+        texts = dict()
+        field_confidences = dict()
+        field_margins = dict()
+        for name, index, confidence, margin in zip(names, best, confidences, margins):
+            texts[name] = texts.get(name, '') + characters[index]
+            field_confidences[name] = min(field_confidences.get(name, 1.0), float(confidence))
+            field_margins[name] = min(field_margins.get(name, 2.0), float(margin))
+
+        for name in texts:
+            results[name] = texts[name], field_confidences[name], field_margins[name]
+        return results
+
+    def learn(self, gray, position, text):
+        """
+        Add the characters of a field with known text to the glyph set.
+
+        @param gray: Gray scale screenshot, see L{to_gray}.
+        @type gray: numpy.ndarray
+
+        @param position: Position of the field.
+        @type position: tuple
+
+        @param text: The text of the field.
+        @type text: str
+
+        @return: True if the field could be split into the characters of @p text.
+        @rtype: bool
+        """
+        text = text.strip()
+        glyphs = self._segment(self._cut_field(gray, position))
+        if len(glyphs) != len(text) or any(c not in CHARACTERS for c in text):
+            return False
+
+        with self._lock:
+            if self._shape is None:
+                self._shape = (max(glyph.shape[0] for glyph in glyphs), max(glyph.shape[1] for glyph in glyphs) + 2)
+            for character, glyph in zip(text, glyphs):
+                glyph = self._fit(glyph, self._shape)
+                if character in self._glyph_sums:
+                    self._glyph_sums[character] += glyph
+                    self._glyph_counts[character] += 1
+                else:
+                    self._glyph_sums[character] = glyph
+                    self._glyph_counts[character] = 1
+            self._templates = None
+        return True
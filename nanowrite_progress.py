@@ -0,0 +1,226 @@
+"""
+Background sampler for the progress of the current NanoWrite job.
+
+Reading the progress fields in the user interface steals the focus, switches tabs and uses the clipboard. The sampler
+therefore takes the elapsed time from the log and the estimate from the write time estimator whenever possible and
+only falls back to the user interface at a low rate. Queries return the latest sample immediately without touching
+the user interface.
+"""
+
+import collections
+import datetime
+import re
+import threading
+import time
+
+import nanowrite_gwl
+
+
+ProgressSample = collections.namedtuple('ProgressSample', ['timestamp', 'elapsed', 'estimate', 'source'])
+
+_ESTIMATE_RE = re.compile(r'estimat.*?(\d+):(\d+):(\d+)', re.IGNORECASE)
+
+
+class ProgressSampler(threading.Thread):
+    """
+    Thread which periodically samples the progress of a NanoWrite instance.
+    """
+
+    def __init__(self, nanowrite, interval=5.0, ui_interval=60.0, history=720, smoothing=0.3):
+        """
+        @param nanowrite: The NanoWrite instance to sample.
+
+        @param interval: Sampling interval in seconds. Samples from the log are cheap.
+        @type interval: float
+
+        @param ui_interval: Minimal interval in seconds between reads from the user interface.
+        @type ui_interval: float
+
+        @param history: Number of samples kept in the time series.
+        @type history: int
+
+        @param smoothing: Weight of a new sample in the exponential smoothing of the remaining time.
+        @type smoothing: float
+        """
+        threading.Thread.__init__(self, name='NanoWriteProgressSampler')
+        self.daemon = True
+
+        self._nanowrite = nanowrite
+        self._interval = interval
+        self._ui_interval = ui_interval
+        self._smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self._samples = collections.deque(maxlen=history)
+        self._running = False
+        self._job_start = None
+        self._estimate = None
+        self._last_ui_read = 0
+        self._smoothed_remaining = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print('Progress sampling failed: %s' % e)
+            self._stop_event.wait(self._interval)
+
+    def _read_log(self):
+        """
+        Get the start time and, if reported, the estimate of the current job from the log.
+
+        @return: Tuple of the start datetime and the estimate in seconds, both might be None.
+        @rtype: tuple
+        """
+        cmd_log = list(self._nanowrite.get_command_log())
+        if len(cmd_log) == 0 or nanowrite_gwl.SEPARATOR not in cmd_log[0][1]:
+            return None, None
+
+        estimate = None
+        for _, msg in cmd_log:
+            match = _ESTIMATE_RE.search(msg)
+            if match:
+                hours, minutes, seconds = [float(x) for x in match.groups()]
+                estimate = hours * 60 * 60 + minutes * 60 + seconds
+
+        return cmd_log[0][0], estimate
+
+    def _read_ui(self, need_elapsed):
+        """
+        Read the progress fields in the user interface, if it is not in use by anybody else.
+
+        @return: Tuple of the elapsed time and the estimate in seconds, both might be None.
+        @rtype: tuple
+        """
+        ui_lock = self._nanowrite._ui_lock
+        if not ui_lock.acquire(False):
+            return None, None
+
+        try:
+            elapsed = self._nanowrite.get_progress_time() if need_elapsed else None
+            estimate = self._nanowrite.get_progress_estimate()
+            # Go back to the camera view, which start_dlw has chosen for the job
+            self._nanowrite.show_camera()
+        finally:
+            ui_lock.release()
+
+        self._last_ui_read = time.time()
+        return elapsed, estimate
+
+    def sample(self):
+        """
+        Take a single sample and append it to the time series.
+
+        @rtype: ProgressSample
+        """
+        now = time.time()
+
+        if not self._nanowrite.is_job_running():
+            with self._lock:
+                self._running = False
+                self._job_start = None
+                self._estimate = None
+                self._smoothed_remaining = None
+            return None
+
+        source = 'log'
+        job_start, estimate = self._read_log()
+
+        if job_start != self._job_start:
+            # A new job has started, forget everything about the last one
+            with self._lock:
+                self._job_start = job_start
+                self._estimate = None
+                self._smoothed_remaining = None
+
+        elapsed = None
+        if job_start is not None:
+            elapsed = (datetime.datetime.now() - job_start).total_seconds()
+
+        if estimate is None:
+            estimate = self._estimate
+
+        if estimate is None:
+            estimate = self._nanowrite.get_job_estimate()
+
+        if elapsed is None and self._running and len(self._samples) > 0:
+            # Extrapolate the elapsed time of the last sample, the job is still running
+            last_sample = self._samples[-1]
+            if last_sample.elapsed is not None:
+                elapsed = last_sample.elapsed + now - last_sample.timestamp
+                source = last_sample.source
+
+        if (elapsed is None or estimate is None) and now - self._last_ui_read >= self._ui_interval:
+            ui_elapsed, ui_estimate = self._read_ui(need_elapsed=(elapsed is None))
+            if ui_elapsed is not None or ui_estimate is not None:
+                source = 'ui'
+                elapsed = ui_elapsed if elapsed is None else elapsed
+                estimate = ui_estimate if ui_estimate is not None else estimate
+
+        sample = ProgressSample(now, elapsed, estimate, source)
+
+        with self._lock:
+            self._running = True
+            self._estimate = estimate
+            if elapsed is not None and estimate is not None:
+                remaining = max(0.0, estimate - elapsed)
+                if self._smoothed_remaining is None:
+                    self._smoothed_remaining = remaining
+                else:
+                    self._smoothed_remaining = (self._smoothing * remaining +
+                                                (1 - self._smoothing) * self._smoothed_remaining)
+            self._samples.append(sample)
+
+        return sample
+
+    def get_samples(self):
+        """
+        Get the recorded time series.
+
+        @return: List of ProgressSample tuples, the latest sample is the last element.
+        @rtype: list
+        """
+        with self._lock:
+            return list(self._samples)
+
+    def get_progress(self):
+        """
+        Get the latest sample, the smoothed ETA and the completion fraction.
+
+        The ETA and the elapsed time are extrapolated to the time of the call.
+
+        @return: Dictionary with the keys 'running', 'timestamp', 'elapsed', 'estimate', 'eta', 'fraction' and
+            'source'. Unknown values are None.
+        @rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            running = self._running
+            sample = self._samples[-1] if len(self._samples) > 0 else None
+            smoothed_remaining = self._smoothed_remaining
+
+        progress = {'running': running, 'timestamp': None, 'elapsed': None, 'estimate': None,
+                    'eta': None, 'fraction': None, 'source': None}
+
+        if sample is None or not running:
+            return progress
+
+        age = now - sample.timestamp
+        progress.update(timestamp=sample.timestamp, estimate=sample.estimate, source=sample.source)
+
+        if sample.elapsed is not None:
+            progress['elapsed'] = sample.elapsed + age
+
+        if smoothed_remaining is not None:
+            progress['eta'] = max(0.0, smoothed_remaining - age)
+
+        if progress['elapsed'] is not None and sample.estimate:
+            progress['fraction'] = min(1.0, progress['elapsed'] / sample.estimate)
+
+        return progress
@@ -18,9 +18,11 @@ class VerifyingDocXMLRPCServer(DocXMLRPCServer):
     """
     This class implements a documented XML-RPC server which requires authentication.
 
-    Additionally, this class allows graceful shutdown on signals
+    Additionally, this class allows graceful shutdown on signals.
+
+    Responses larger than @p encode_threshold bytes are gzip compressed, if the client accepts it.
     """
-    def __init__(self, users_auth, addr, timeout=0.5, *args, **kargs):
+    def __init__(self, users_auth, addr, timeout=0.5, encode_threshold=1400, *args, **kargs):
         # we use an inner class so that we can call out to the
         # authenticate method
         class VerifyingRequestHandler(DocXMLRPCRequestHandler):
@@ -35,6 +37,7 @@ class VerifyingDocXMLRPCServer(DocXMLRPCServer):
                         # if authentication fails, tell the client
                         myself.send_error(401, 'Authentication failed')
                 return False
+        VerifyingRequestHandler.encode_threshold = encode_threshold
         self._users_auth = users_auth
         self._finished = False
         self.timeout = timeout
@@ -73,7 +76,7 @@ class VerifyingDocXMLRPCServer(DocXMLRPCServer):
     def serve_forever(self):
         self._finished = False
         while not self._finished:
-            server.handle_request()
+            self.handle_request()
 
 
 class NanoWriteRPC(NanoWrite):
@@ -95,7 +98,34 @@ class NanoWriteRPC(NanoWrite):
         meta, pic = NanoWrite.get_camera_picture(self)
         return meta, xmlrpclib.Binary(pic)
 
-    def execute_complex_gwl_files(self, start_name, gwl_files, readback_files=None):
+    def submit_gwl(self, gwl, start_name='job.gwl', readback_files=None, *args, **nargs):
+        """
+        Submit GWL commands the fastest way depending on their size.
+
+        @param gwl: Either the GWL script or a dictionary of several GWL files, either as string or as BASE64
+         encoded binary.
+        @type gwl: str, dict
+
+        @param start_name: Name of the executed file, if @p gwl is a dictionary.
+        @type start_name: str
+
+        @param readback_files: List of generated files to read back. In most cases these will be pictures.
+        @type readback_files: list, tuple
+
+        @return: Dictionary with the chosen 'path', the 'size' of the script in bytes, the 'duration' of the call in
+            seconds and the read back 'results' encoded into BASE64 strings.
+        @rtype: dict
+        """
+        if isinstance(gwl, dict):
+            gwl = {key: value.data if isinstance(value, xmlrpclib.Binary) else value for key, value in gwl.items()}
+        elif isinstance(gwl, xmlrpclib.Binary):
+            gwl = gwl.data
+        submission = NanoWrite.submit_gwl(self, gwl, start_name, readback_files, *args, **nargs)
+        submission['results'] = {key: xmlrpclib.Binary(value) for key, value in submission['results'].items()}
+        return submission
+
+    def execute_complex_gwl_files(self, start_name, gwl_files, readback_files=None, invalidate_piezo=True,
+                                  abort_calculating_time=False, validate=True):
         """
         Execute a set of possibly several GLW files and read back generated output files.
 
@@ -106,7 +136,7 @@ class NanoWriteRPC(NanoWrite):
         @type start_name: str
 
         @param gwl_files: Dictionary containing the GLW files. Where the key is the filename and the value is the
-         content of the file.
+         content of the file, either as string or as BASE64 encoded binary.
         @type gwl_files: dict
 
         @param readback_files: List of generated files to read back. In most cases these will be pictures.
@@ -115,15 +145,70 @@ class NanoWriteRPC(NanoWrite):
         @return: Dictionary containing the files to read back in @p readback_files encoded into BASE64 strings.
         @rtype: dict
         """
-        results = NanoWrite.execute_complex_gwl_files(self, start_name, gwl_files, readback_files)
+        gwl_files = {key: value.data if isinstance(value, xmlrpclib.Binary) else value
+                     for key, value in gwl_files.items()}
+        results = NanoWrite.execute_complex_gwl_files(self, start_name, gwl_files, readback_files, invalidate_piezo,
+                                                      abort_calculating_time, validate)
+
+        return {key: xmlrpclib.Binary(value) for key, value in results.items()}
+
+    def stage_gwl_files(self, start_name, gwl_files, validate=True):
+        """
+        Write a set of GWL files into a new job folder and validate them, while the current job keeps running.
+
+        @param start_name: Name of the executed GLW file.
+        @type start_name: str
+
+        @param gwl_files: Dictionary containing the GLW files. Where the key is the filename and the value is the
+         content of the file, either as string or as BASE64 encoded binary.
+        @type gwl_files: dict
+
+        @return: Name of the staged job for execute_staged_job or queue_staged_job.
+        @rtype: str
+        """
+        gwl_files = {key: value.data if isinstance(value, xmlrpclib.Binary) else value
+                     for key, value in gwl_files.items()}
+        return NanoWrite.stage_gwl_files(self, start_name, gwl_files, validate)
+
+    def execute_staged_job(self, stage_id, readback_files=None, invalidate_piezo=True, abort_calculating_time=False):
+        """
+        Load and start a staged job and read back generated output files.
+
+        @param stage_id: Name of the staged job as returned by stage_gwl_files.
+        @type stage_id: str
+
+        @param readback_files: List of generated files to read back. In most cases these will be pictures.
+        @type readback_files: list, tuple
 
+        @return: Dictionary containing the files to read back in @p readback_files encoded into BASE64 strings.
+        @rtype: dict
+        """
+        results = NanoWrite.execute_staged_job(self, stage_id, readback_files, invalidate_piezo,
+                                               abort_calculating_time)
         return {key: xmlrpclib.Binary(value) for key, value in results.items()}
 
+    def get_artifact(self, job_name, filename):
+        """
+        Read a file from the working directory of a recent job without re-running it.
+
+        @param job_name: Name of the job as returned by list_artifacts.
+        @type job_name: str
+
+        @param filename: Name of the file.
+        @type filename: str
+
+        @return: The BASE64 encoded content of the file.
+        @rtype: str
+        """
+        return xmlrpclib.Binary(NanoWrite.get_artifact(self, job_name, filename))
+
 if __name__ == '__main__':
     user_auth = {'user': 'password'}
     server = VerifyingDocXMLRPCServer(user_auth, ('', 60000), logRequests=1, allow_none=True)
     server.register_introspection_functions()
-    server.register_instance(NanoWriteRPC())
+    nanowrite = NanoWriteRPC(job_history='nanowrite_jobs.sqlite')
+    nanowrite.start_progress_sampler()
+    server.register_instance(nanowrite)
     server.register_shutdown_signal(signal.SIGINT)
 
     print time.asctime(), 'Server starting'
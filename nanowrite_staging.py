@@ -0,0 +1,180 @@
+"""
+Pipeline which starts staged jobs as soon as the current job has finished.
+
+Writing, hashing and validating the GWL files of a job does not need the user interface. With
+NanoWrite.stage_gwl_files this is done while the previous job is still writing. The pipeline then only has to wait for
+the previous job to finish and to load and start the next one, so the instrument idles for little more than the time
+the clicks take.
+
+If a job fails, the pipeline halts and keeps the remaining jobs queued until it is resumed, since they usually build
+on the failed one.
+"""
+
+import collections
+import threading
+import time
+
+
+class StagingPipeline(threading.Thread):
+    """
+    Thread which loads and starts queued staged jobs one after the other.
+    """
+
+    def __init__(self, nanowrite, poll_interval=0.1, history=100):
+        """
+        @param nanowrite: The NanoWrite instance to start the jobs on.
+
+        @param poll_interval: Interval in seconds to check if the current job has finished.
+        @type poll_interval: float
+
+        @param history: Number of started jobs and errors which are kept for L{get_status}.
+        @type history: int
+        """
+        threading.Thread.__init__(self, name='NanoWriteStagingPipeline')
+        self.daemon = True
+
+        self._nanowrite = nanowrite
+        self._poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+        self._queue = collections.deque()
+        self._started_jobs = collections.deque(maxlen=history)
+        self._errors = collections.deque(maxlen=history)
+
+        # Failed jobs are counted by the NanoWrite instance, every new one halts the pipeline
+        self._seen_failures = self._get_failure_count()
+        self._halted = None
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def resume(self):
+        """
+        Continue starting queued jobs after a failed job.
+        """
+        with self._lock:
+            self._seen_failures = self._get_failure_count()
+            self._halted = None
+        self._wakeup.set()
+
+    def _get_failure_count(self):
+        error = self._nanowrite.get_last_job_error()
+        return error['count'] if error is not None else 0
+
+    def _check_failures(self):
+        """
+        Halt if a job has failed since the last check, no matter who has noticed it first.
+
+        @return: True if the pipeline is halted.
+        @rtype: bool
+        """
+        error = self._nanowrite.get_last_job_error()
+        with self._lock:
+            if error is not None and error['count'] > self._seen_failures:
+                self._seen_failures = error['count']
+                self._halt(None, error['message'])
+            return self._halted is not None
+
+    def _halt(self, stage_id, message):
+        # Called with the lock held
+        print('Staging pipeline halted: %s' % message)
+        error = {'stage_id': stage_id, 'timestamp': time.time(), 'message': message}
+        self._errors.append(error)
+        self._halted = error
+
+    def enqueue(self, stage_id, invalidate_piezo=True):
+        """
+        Queue a staged job for execution.
+
+        @param stage_id: Name of the staged job.
+        @type stage_id: str
+
+        @return: The number of queued jobs.
+        @rtype: int
+        """
+        with self._lock:
+            self._queue.append((stage_id, invalidate_piezo))
+            length = len(self._queue)
+        self._wakeup.set()
+        return length
+
+    def remove(self, stage_id):
+        """
+        Remove a job from the queue.
+
+        @return: True if the job was queued.
+        @rtype: bool
+        """
+        with self._lock:
+            for item in self._queue:
+                if item[0] == stage_id:
+                    self._queue.remove(item)
+                    return True
+        return False
+
+    def run(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                item = self._queue[0] if len(self._queue) > 0 else None
+
+            if item is None or self._check_failures():
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            try:
+                finished = self._nanowrite.has_finished()
+            except self._nanowrite.ExecutionError:
+                # The previous job failed, which halts the pipeline with the next check
+                continue
+
+            if not finished:
+                self._stop_event.wait(self._poll_interval)
+                continue
+
+            with self._lock:
+                if len(self._queue) == 0 or self._queue[0] != item:
+                    continue
+                self._queue.popleft()
+
+            stage_id, invalidate_piezo = item
+            ready = time.time()
+            try:
+                self._nanowrite.execute_staged_job(stage_id, invalidate_piezo=invalidate_piezo)
+            except self._nanowrite.NotReady:
+                # Someone else has started a job in the meantime, the job stays staged and first in the queue
+                with self._lock:
+                    self._queue.appendleft(item)
+                self._stop_event.wait(self._poll_interval)
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._halt(stage_id, 'Starting staged job %s failed: %s' % (stage_id, e))
+                try:
+                    self._nanowrite.discard_staged_job(stage_id)
+                except Exception:
+                    pass
+                continue
+
+            with self._lock:
+                self._started_jobs.append({'stage_id': stage_id, 'timestamp': ready, 'latency': time.time() - ready})
+
+    def get_status(self):
+        """
+        @return: Dictionary with the keys 'queued' (list of the queued job names), 'started', 'errors' and 'halted'.
+            Started jobs are dictionaries with 'stage_id', 'timestamp' (when the previous job was found finished) and
+            'latency' (time until the job was started). Errors are dictionaries with 'stage_id' (None for a failed
+            job, which was found by has_finished), 'timestamp' and 'message'. 'halted' is the error, which halted
+            the pipeline, None while it is running.
+        @rtype: dict
+        """
+        self._check_failures()
+        with self._lock:
+            return {'queued': [stage_id for stage_id, _ in self._queue],
+                    'started': list(self._started_jobs),
+                    'errors': list(self._errors),
+                    'halted': self._halted}
@@ -0,0 +1,437 @@
+"""
+Recording and replay of the interaction with the NanoWrite user interface.
+
+A trace contains every call of the backend with its timestamp, duration and result, all data read from the messages
+log and the actions of the wrapper which caused them. It is written as gzip compressed JSON lines, identical
+screenshots are only stored once.
+
+Replaying a trace does not need NanoWrite. The L{ReplayBackend} and the L{ReplayLogReader} stand in for the user
+interface and the log, so the wrapper can be profiled with realistic workloads on any machine. L{replay} runs the
+recorded actions with a wrapper on top of them, either at the original speed or as fast as possible.
+"""
+
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+import nanowrite_log
+
+
+TRACE_FORMAT = 1
+
+# Backend methods which are recorded, all others are passed through
+RECORDED_METHODS = ('window_text', 'set_foreground', 'click', 'double_click', 'type_keys', 'set_clipboard_text',
+                    'get_clipboard_text', 'get_pixel', 'capture_image', 'enter_file_in_open_dialog')
+
+TraceCall = collections.namedtuple('TraceCall', ['timestamp', 'duration', 'method', 'args', 'result', 'error'])
+TraceLogRead = collections.namedtuple('TraceLogRead', ['timestamp', 'log_id', 'offset', 'data'])
+TraceAction = collections.namedtuple('TraceAction', ['timestamp', 'duration', 'method', 'args', 'kwargs', 'error'])
+
+
+def _encode_args(args):
+    return [list(arg) if isinstance(arg, tuple) else arg for arg in args]
+
+
+def _decode_value(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class TraceWriter(object):
+    """
+    Writes a trace file. All methods are thread safe.
+    """
+
+    def __init__(self, path, **header):
+        """
+        @param path: Path of the trace file, usually ending with .jsonl.gz
+        @type path: str
+
+        @param header: Additional information stored in the header of the trace, e.g. the NanoWrite version.
+        """
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wb')
+        self._start = time.time()
+        self._blobs = set()
+
+        header.update(format=TRACE_FORMAT, start=self._start)
+        self._write(['h', header])
+
+    def _write(self, event, default=None):
+        self._file.write(json.dumps(event, separators=(',', ':'), default=default) + '\n')
+
+    def _encode_result(self, result):
+        if hasattr(result, 'tobytes') and hasattr(result, 'mode'):
+            # A PIL image, stored once per content hash, so repeated frames are only written once
+            data = result.tobytes()
+            blob_id = hashlib.sha1(('%s %d %d\0' % ((result.mode,) + tuple(result.size))).encode('ascii') +
+                                   data).hexdigest()
+            if blob_id not in self._blobs:
+                self._blobs.add(blob_id)
+                self._write(['b', blob_id, result.mode, list(result.size),
+                             base64.b64encode(zlib.compress(data)).decode('ascii')])
+            return {'image': blob_id}
+        if isinstance(result, tuple):
+            return list(result)
+        return result
+
+    def record_call(self, start, duration, method, args, result=None, error=None):
+        """
+        Record a call of the backend.
+
+        @param start: Time of the call as returned by time.time().
+        @param duration: Duration of the call in seconds.
+        @param error: Message of the raised exception, None if the call succeeded.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(['c', round(start - self._start, 4), round(duration, 4), method, _encode_args(args),
+                         self._encode_result(result), error])
+
+    def record_action(self, start, duration, method, args, kwargs, error=None):
+        """
+        Record an action of the wrapper, i.e. a call of one of its methods which interact with the user interface.
+
+        @param start: Time of the call as returned by time.time().
+        @param duration: Duration of the call in seconds.
+        @param method: Name of the method.
+        @param args: Positional arguments of the call.
+        @param kwargs: Keyword arguments of the call.
+        @param error: Message of the raised exception, None if the call succeeded.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            # Arguments which can not be stored, e.g. functions, are stored by their representation
+            self._write(['a', round(start - self._start, 4), round(duration, 4), method, _encode_args(args),
+                         dict(zip(kwargs.keys(), _encode_args(kwargs.values()))), error], default=repr)
+
+    def record_log(self, log_id, offset, data):
+        """
+        Record data read from the messages log.
+
+        @param log_id: Base name of the log file.
+        @param offset: Byte offset of the data in the log file.
+        @param data: The raw data.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._write(['l', round(time.time() - self._start, 4), log_id, offset, data.decode('latin-1')])
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingBackend(object):
+    """
+    Wraps a backend and records all calls of the methods in L{RECORDED_METHODS}.
+    """
+
+    def __init__(self, backend, trace):
+        """
+        @param backend: The backend to record.
+
+        @param trace: Writer of the trace.
+        @type trace: TraceWriter
+        """
+        self.backend = backend
+        self._trace = trace
+
+    def __getattr__(self, item):
+        attr = getattr(self.backend, item)
+        if item not in RECORDED_METHODS:
+            return attr
+
+        def method(*args):
+            start = time.time()
+            try:
+                result = attr(*args)
+            except Exception as e:
+                self._trace.record_call(start, time.time() - start, item, args, error='%s: %s' % (type(e).__name__, e))
+                raise
+            self._trace.record_call(start, time.time() - start, item, args, result)
+            return result
+        method.__name__ = item
+        return method
+
+
+class Trace(object):
+    """
+    A trace file loaded into memory.
+    """
+
+    def __init__(self, path):
+        """
+        @param path: Path of the trace file.
+        @type path: str
+        """
+        self.header = dict()
+        self.calls = list()
+        self.log_reads = list()
+        self.actions = list()
+        self._blobs = dict()
+
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                event = json.loads(line)
+                if event[0] == 'h':
+                    self.header = event[1]
+                elif event[0] == 'b':
+                    self._blobs[event[1]] = (event[2], tuple(event[3]), event[4])
+                elif event[0] == 'c':
+                    timestamp, duration, method, args, result, error = event[1:]
+                    self.calls.append(TraceCall(timestamp, duration, method, tuple(_decode_value(arg) for arg in args),
+                                                result, error))
+                elif event[0] == 'l':
+                    timestamp, log_id, offset, data = event[1:]
+                    self.log_reads.append(TraceLogRead(timestamp, log_id, offset, data.encode('latin-1')))
+                elif event[0] == 'a':
+                    timestamp, duration, method, args, kwargs, error = event[1:]
+                    self.actions.append(TraceAction(timestamp, duration, method,
+                                                    tuple(_decode_value(arg) for arg in args),
+                                                    dict((str(key), _decode_value(value))
+                                                         for key, value in kwargs.items()), error))
+
+    def get_duration(self):
+        """
+        @return: Time in seconds from the start of the recording until the end of its last event.
+        @rtype: float
+        """
+        ends = [call.timestamp + call.duration for call in self.calls] + [read.timestamp for read in self.log_reads]
+        return max(ends) if ends else 0.0
+
+    def decode_result(self, call):
+        """
+        Get the result of a recorded call as the backend returned it.
+        """
+        if isinstance(call.result, dict) and 'image' in call.result:
+            from PIL import Image
+            mode, size, data = self._blobs[call.result['image']]
+            return Image.frombytes(mode, size, zlib.decompress(base64.b64decode(data)))
+        return _decode_value(call.result)
+
+
+class ReplayBackend(object):
+    """
+    Stand-in for the backend of a real NanoWrite instance, which answers with the recorded results.
+
+    Recorded results are matched by method and arguments in the recorded order. If the wrapper asks more often than
+    during the recording, e.g. because it polls faster, the last result is repeated. Calls which do not occur in the
+    trace at all return the last result of the same method.
+    """
+
+    class RecordedError(Exception):
+        """
+        Raised by a replayed call, which raised an exception during the recording.
+        """
+        pass
+
+    class UnknownCall(Exception):
+        pass
+
+    def __init__(self, trace, realtime=True, speed=1.0):
+        """
+        @param trace: The trace or the path of a trace file.
+        @type trace: Trace, str
+
+        @param realtime: Take as long as the recorded calls. If False, all calls return immediately.
+        @type realtime: bool
+
+        @param speed: Speed up factor of the replay in realtime.
+        @type speed: float
+        """
+        self.trace = trace if isinstance(trace, Trace) else Trace(trace)
+        self.realtime = realtime
+        self.speed = speed
+
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._trace_time = 0.0
+
+        self._pending = collections.defaultdict(collections.deque)
+        self._last = dict()
+        for call in self.trace.calls:
+            self._pending[self._key(call.method, call.args)].append(call)
+
+        self.calls = collections.Counter()
+        self.unmatched = collections.Counter()
+
+    @staticmethod
+    def _key(method, args):
+        return method, json.dumps(_encode_args(args))
+
+    def now(self):
+        """
+        @return: The current position in the trace in seconds.
+        @rtype: float
+        """
+        with self._lock:
+            if self.realtime:
+                return max(self._trace_time, (time.time() - self._start) * self.speed)
+            return self._trace_time
+
+    def advance(self, timestamp):
+        """
+        Move the current position in the trace forward.
+        """
+        with self._lock:
+            self._trace_time = max(self._trace_time, timestamp)
+
+    def close(self):
+        pass
+
+    def _find_call(self, method, args):
+        key = self._key(method, args)
+        with self._lock:
+            self.calls[method] += 1
+            pending = self._pending.get(key)
+            if pending:
+                call = pending.popleft()
+                self._last[key] = self._last[method] = call
+                return call
+            self.unmatched[method] += 1
+            call = self._last.get(key, self._last.get(method))
+            if call is None:
+                # Fall back to the first recorded call of the method
+                call = next((call for call in self.trace.calls if call.method == method), None)
+            if call is None:
+                raise ReplayBackend.UnknownCall('%s was never called in the trace' % method)
+            return call
+
+    def __getattr__(self, item):
+        if item not in RECORDED_METHODS:
+            raise AttributeError(item)
+
+        def method(*args):
+            call = self._find_call(item, args)
+            if self.realtime:
+                time.sleep(call.duration / self.speed)
+            self.advance(call.timestamp + call.duration)
+            if call.error is not None:
+                raise ReplayBackend.RecordedError(call.error)
+            return self.trace.decode_result(call)
+        method.__name__ = item
+        return method
+
+
+class ReplayLogReader(nanowrite_log.LogReader):
+    """
+    Log reader which reads the recorded log data instead of the log files.
+
+    In realtime, the log grows as it did during the recording. Otherwise every update, which finds no new data up to
+    the current position in the trace, jumps forward to the next recorded read.
+    """
+
+    def __init__(self, backend):
+        """
+        @param backend: The replay backend, whose position in the trace is followed.
+        @type backend: ReplayBackend
+        """
+        nanowrite_log.LogReader.__init__(self)
+        self._backend = backend
+        self._log_reads = collections.deque(backend.trace.log_reads)
+        self._files = dict()
+        self._current_log_id = self._log_reads[0].log_id if self._log_reads else ''
+
+    def _apply(self, log_read):
+        data = self._files.get(log_read.log_id, '')
+        self._files[log_read.log_id] = data[:log_read.offset] + log_read.data
+        self._current_log_id = log_read.log_id
+        self._backend.advance(log_read.timestamp)
+
+    def _latest_log_path(self):
+        now = self._backend.now()
+        applied = False
+        while self._log_reads and self._log_reads[0].timestamp <= now:
+            self._apply(self._log_reads.popleft())
+            applied = True
+        if not applied and not self._backend.realtime and self._log_reads:
+            self._apply(self._log_reads.popleft())
+        return self._current_log_id
+
+    def _read(self, log_path, offset):
+        return self._files.get(log_path, '')[offset:]
+
+
+def replay(trace, realtime=True, speed=1.0, record=None, **nanowrite_args):
+    """
+    Run the recorded actions of a trace with a wrapper, whose user interface and log are replayed from the trace.
+
+    The wrapper is a L{nanowrite.NanoWrite} instance on top of a L{ReplayBackend} and a L{ReplayLogReader}, so the
+    replay runs the same code as the recording. A replayed action mismatches if it fails while the recorded one
+    succeeded or vice versa. A backend call mismatches if the trace contains no such call, e.g. because the wrapper
+    now interacts differently with the user interface.
+
+    @note: Text fields read from the screen depend on the learned glyph set. Pass the data_dir of the recording to
+        get the same backend calls.
+
+    @param trace: The trace or the path of a trace file.
+    @type trace: Trace, str
+
+    @param realtime: Keep the recorded time between the actions and of the backend calls. If False, everything
+        follows each other immediately.
+    @type realtime: bool
+
+    @param speed: Speed up factor of the replay in realtime.
+    @type speed: float
+
+    @param record: Path of a trace file to record the replay in again, see L{nanowrite.NanoWrite.start_trace}.
+    @type record: str
+
+    @param nanowrite_args: Additional arguments of the wrapper, e.g. its data_dir.
+
+    @return: Dictionary with the keys 'duration' (of the replay), 'recorded_duration', 'actions' (dictionary of
+        method names to dictionaries with 'count', 'time' and 'recorded_time'), 'backend_calls' (dictionary of
+        backend method names to the number of calls), 'mismatches' (number of mismatched actions) and
+        'unmatched_calls' (number of mismatched backend calls).
+    @rtype: dict
+    """
+    import nanowrite
+
+    trace = trace if isinstance(trace, Trace) else Trace(trace)
+    backend = ReplayBackend(trace, realtime=realtime, speed=speed)
+    wrapper = nanowrite.NanoWrite(backend=backend, log_reader=ReplayLogReader(backend), trace=record,
+                                  **nanowrite_args)
+
+    actions = dict()
+    mismatches = 0
+    start = time.time()
+
+    try:
+        for action in trace.actions:
+            if realtime:
+                delay = start + action.timestamp / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            backend.advance(action.timestamp)
+
+            action_start = time.time()
+            error = None
+            try:
+                getattr(wrapper, action.method)(*action.args, **action.kwargs)
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+            duration = time.time() - action_start
+
+            stats = actions.setdefault(action.method, {'count': 0, 'time': 0.0, 'recorded_time': 0.0})
+            stats['count'] += 1
+            stats['time'] += duration
+            stats['recorded_time'] += action.duration
+
+            if (error is None) != (action.error is None):
+                mismatches += 1
+    finally:
+        wrapper.stop_trace()
+
+    return {'duration': time.time() - start, 'recorded_duration': trace.get_duration(), 'actions': actions,
+            'backend_calls': dict(backend.calls), 'mismatches': mismatches,
+            'unmatched_calls': sum(backend.unmatched.values())}
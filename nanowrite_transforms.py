@@ -0,0 +1,217 @@
+"""
+Affine transforms between the coordinate frames of the instrument.
+
+The frames are:
+
+    - 'piezo': Piezo coordinates as used in GWL commands.
+    - 'inverted_piezo': Piezo coordinates as displayed by NanoWrite. With the z-axis inversion enabled, x and z are
+      mirrored within the piezo range.
+    - 'stage': Absolute coordinates of the instrument, i.e. the stage position plus the piezo position. Stage
+      positions are given in the frame of the stage commands, in which z is not inverted.
+    - 'sample': Coordinates on the sample, related to the stage frame by an arbitrary affine transform, e.g. from an
+      alignment to markers.
+
+Single points are converted in pure Python, e.g. the positions read from the user interface. Arrays of points of shape
+(..., 3) are converted with numpy, so millions of points are converted at once.
+
+@note: Converting arrays requires numpy, which is only imported when needed.
+"""
+
+
+FRAMES = ('sample', 'stage', 'piezo', 'inverted_piezo')
+
+
+def _identity():
+    return [[1.0 if row == column else 0.0 for column in range(4)] for row in range(4)]
+
+
+class AffineTransform(object):
+    """
+    Affine transform of 3D points, stored as 4x4 matrix in homogeneous coordinates.
+    """
+
+    def __init__(self, matrix=None):
+        """
+        @param matrix: The 4x4 matrix as nested lists or array, the identity if None. The last row must be (0, 0, 0, 1).
+        @type matrix: list
+        """
+        self.matrix = _identity() if matrix is None else [[float(value) for value in row] for row in matrix]
+        assert len(self.matrix) == 4 and all(len(row) == 4 for row in self.matrix), \
+            'Affine transforms need a 4x4 matrix'
+
+    @classmethod
+    def translation(cls, offset):
+        matrix = _identity()
+        for row in range(3):
+            matrix[row][3] = offset[row]
+        return cls(matrix)
+
+    @classmethod
+    def scaling(cls, factors):
+        matrix = _identity()
+        for row in range(3):
+            matrix[row][row] = factors[row]
+        return cls(matrix)
+
+    def then(self, other):
+        """
+        Compose two transforms.
+
+        @param other: The transform applied after this one.
+        @type other: AffineTransform
+
+        @rtype: AffineTransform
+        """
+        return AffineTransform([[sum(other.matrix[row][k] * self.matrix[k][column] for k in range(4))
+                                 for column in range(4)] for row in range(4)])
+
+    def inverse(self):
+        """
+        @rtype: AffineTransform
+
+        @raise ZeroDivisionError: Raised if the transform is not invertible.
+        """
+        (a, b, c), (d, e, f), (g, h, i) = [row[:3] for row in self.matrix[:3]]
+        determinant = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+        linear = [[(e * i - f * h) / determinant, (c * h - b * i) / determinant, (b * f - c * e) / determinant],
+                  [(f * g - d * i) / determinant, (a * i - c * g) / determinant, (c * d - a * f) / determinant],
+                  [(d * h - e * g) / determinant, (b * g - a * h) / determinant, (a * e - b * d) / determinant]]
+        offset = [-sum(linear[row][k] * self.matrix[k][3] for k in range(3)) for row in range(3)]
+        return AffineTransform([linear[row] + [offset[row]] for row in range(3)] + [[0.0, 0.0, 0.0, 1.0]])
+
+    def apply_point(self, point):
+        """
+        Transform a single point without numpy.
+
+        @param point: The x, y and z coordinates.
+        @type point: tuple
+
+        @rtype: tuple
+        """
+        return tuple(sum(self.matrix[row][k] * point[k] for k in range(3)) + self.matrix[row][3] for row in range(3))
+
+    def apply_vector(self, vector):
+        """
+        Transform a single displacement without numpy. Displacements are not affected by translations.
+
+        @param vector: The x, y and z components.
+        @type vector: tuple
+
+        @rtype: tuple
+        """
+        return tuple(sum(self.matrix[row][k] * vector[k] for k in range(3)) for row in range(3))
+
+    def apply(self, points):
+        """
+        Transform points.
+
+        @param points: Array like of shape (..., 3).
+
+        @return: Array of the same shape.
+        @rtype: numpy.ndarray
+        """
+        import numpy as np
+        matrix = np.array(self.matrix)
+        return np.dot(np.asarray(points, dtype=np.float64), matrix[:3, :3].T) + matrix[:3, 3]
+
+    def apply_vectors(self, vectors):
+        """
+        Transform displacements, which are not affected by translations.
+
+        @param vectors: Array like of shape (..., 3).
+
+        @return: Array of the same shape.
+        @rtype: numpy.ndarray
+        """
+        import numpy as np
+        return np.dot(np.asarray(vectors, dtype=np.float64), np.array(self.matrix)[:3, :3].T)
+
+
+def piezo_inversion(piezo_range, z_inverted):
+    """
+    Get the transform between the 'piezo' and the 'inverted_piezo' frame. It is its own inverse.
+
+    @param piezo_range: The travel range of the piezo in x, y and z.
+    @type piezo_range: tuple
+
+    @param z_inverted: True if the z-axis inversion is enabled.
+    @type z_inverted: bool
+
+    @rtype: AffineTransform
+    """
+    if not z_inverted:
+        return AffineTransform()
+    return AffineTransform.scaling((-1, 1, -1)).then(AffineTransform.translation((piezo_range[0], 0, piezo_range[2])))
+
+
+def stage_inversion(z_inverted):
+    """
+    Get the transform between the stage position as displayed by NanoWrite and the frame of the stage commands. It is
+    its own inverse.
+
+    @param z_inverted: True if the z-axis inversion is enabled.
+    @type z_inverted: bool
+
+    @rtype: AffineTransform
+    """
+    return AffineTransform.scaling((1, 1, -1)) if z_inverted else AffineTransform()
+
+
+class Frames(object):
+    """
+    The coordinate frames for a given state of the instrument.
+    """
+
+    def __init__(self, piezo_range, z_inverted, stage_position=(0, 0, 0), sample_to_stage=None):
+        """
+        @param piezo_range: The travel range of the piezo in x, y and z.
+        @type piezo_range: tuple
+
+        @param z_inverted: True if the z-axis inversion is enabled.
+        @type z_inverted: bool
+
+        @param stage_position: The stage position in the frame of the stage commands.
+        @type stage_position: tuple
+
+        @param sample_to_stage: Transform from the 'sample' to the 'stage' frame, the identity if None.
+        @type sample_to_stage: AffineTransform
+        """
+        piezo_to_stage = AffineTransform.translation(stage_position)
+        self._to_stage = {'sample': sample_to_stage if sample_to_stage is not None else AffineTransform(),
+                          'stage': AffineTransform(),
+                          'piezo': piezo_to_stage,
+                          'inverted_piezo': piezo_inversion(piezo_range, z_inverted).then(piezo_to_stage)}
+
+    def get(self, source, target):
+        """
+        Get the transform from one frame into another.
+
+        @param source: Name of the frame of the given points, see L{FRAMES}.
+        @type source: str
+
+        @param target: Name of the frame to transform the points into.
+        @type target: str
+
+        @rtype: AffineTransform
+        """
+        assert source in self._to_stage and target in self._to_stage, 'Unknown frame'
+        return self._to_stage[source].then(self._to_stage[target].inverse())
+
+    def convert_point(self, point, source, target):
+        """
+        Transform a single point from one frame into another without numpy.
+
+        @rtype: tuple
+        """
+        return self.get(source, target).apply_point(point)
+
+    def convert(self, points, source, target):
+        """
+        Transform points from one frame into another.
+
+        @param points: Array like of shape (..., 3).
+
+        @return: Array of the same shape.
+        @rtype: numpy.ndarray
+        """
+        return self.get(source, target).apply(points)
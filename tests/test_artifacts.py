@@ -0,0 +1,87 @@
+"""
+Tests of the per-job working directories.
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_artifacts
+
+
+class ArtifactStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _create_job(self, store, size):
+        name, path = store.create_job()
+        with open(os.path.join(path, 'data.bin'), 'wb') as f:
+            f.write(b'x' * size)
+        return name
+
+    def _names(self, store):
+        return [job['name'] for job in store.list_jobs()]
+
+    def test_least_recently_used_jobs_are_evicted_first(self):
+        store = nanowrite_artifacts.ArtifactStore(self.folder, quota=250)
+        first, second, third = [self._create_job(store, 100) for _ in range(3)]
+        store.release(first)
+        store.release(second)
+        store.get_path(first)
+        store.release(third)
+
+        self.assertEqual(self._names(store), [third, first])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, second)))
+        stats = store.get_stats()
+        self.assertEqual((stats['jobs'], stats['bytes'], stats['evicted_jobs'], stats['evicted_bytes']),
+                         (2, 200.0, 1, 100.0))
+
+    def test_active_jobs_are_never_evicted(self):
+        store = nanowrite_artifacts.ArtifactStore(self.folder, quota=0)
+        active = self._create_job(store, 100)
+        released = self._create_job(store, 100)
+        store.release(released)
+
+        self.assertEqual(self._names(store), [active])
+        self.assertEqual(store.get_stats()['active_jobs'], 1)
+        self.assertEqual(store.read(active, 'data.bin'), b'x' * 100)
+
+    def test_retention(self):
+        store = nanowrite_artifacts.ArtifactStore(self.folder, retention=0.05)
+        name = self._create_job(store, 10)
+        store.release(name)
+        self.assertEqual(self._names(store), [name])
+        time.sleep(0.1)
+        store.evict()
+        self.assertEqual(self._names(store), [])
+        with self.assertRaises(nanowrite_artifacts.ArtifactStore.UnknownArtifact):
+            store.get_path(name)
+
+    def test_paths_stay_in_the_job_directory(self):
+        store = nanowrite_artifacts.ArtifactStore(self.folder)
+        name, path = store.create_job('capture')
+        self.assertTrue(name.startswith('capture-'))
+        self.assertEqual(store.get_path(name, '../../secret.txt'), os.path.join(path, 'secret.txt'))
+        with self.assertRaises(nanowrite_artifacts.ArtifactStore.UnknownArtifact):
+            store.read(name, 'missing.txt')
+
+    def test_temporary_root_is_removed_on_close(self):
+        store = nanowrite_artifacts.ArtifactStore()
+        root = store.get_stats()['root']
+        store.create_job()
+        store.close()
+        self.assertFalse(os.path.exists(root))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests of the GWL write time estimator.
+"""
+
+import os
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_estimator
+import nanowrite_gwl
+
+
+def _features(content):
+    return nanowrite_estimator.extract_features(
+        nanowrite_gwl.iter_statements('job.gwl', nanowrite_gwl.dict_resolver({'job.gwl': content})))
+
+
+class FeatureTest(unittest.TestCase):
+
+    def test_features(self):
+        features = _features('ScanSpeed 100\nPiezoSettlingTime 20\n0 0 0\n3 4 0\n3 4 12\nWrite\n'
+                             'MoveStageX 10\nwait 2\n')
+        self.assertEqual(features['points'], 3)
+        self.assertAlmostEqual(features['line_time'], 17 / 100.0)
+        self.assertAlmostEqual(features['settling_time'], 0.02)
+        self.assertEqual(features['stage_moves'], 1)
+        self.assertEqual(features['wait_time'], 2)
+        self.assertEqual(features['constant'], 1)
+
+    def test_default_scan_speed(self):
+        features = _features('0 0 0\n%s 0 0\nWrite\n' % nanowrite_estimator.DEFAULT_SCAN_SPEED)
+        self.assertAlmostEqual(features['line_time'], 1.0)
+
+    def test_non_positive_scan_speed_keeps_the_previous_one(self):
+        features = _features('ScanSpeed 10\nScanSpeed 0\nScanSpeed -5\n0 0 0\n1 0 0\nWrite\n')
+        self.assertAlmostEqual(features['line_time'], 0.1)
+
+    def test_variables_are_ignored(self):
+        features = _features('ScanSpeed $speed\nwait\n0 0 0\n1 0 0\nWrite\n')
+        self.assertAlmostEqual(features['line_time'], 1 / nanowrite_estimator.DEFAULT_SCAN_SPEED)
+        self.assertEqual(features['wait_time'], 0)
+
+
+class WriteTimeEstimatorTest(unittest.TestCase):
+
+    def test_estimate_with_default_coefficients(self):
+        estimator = nanowrite_estimator.WriteTimeEstimator()
+        resolver = nanowrite_gwl.dict_resolver({'job.gwl': 'ScanSpeed 1\n0 0 0\n2 0 0\nWrite\nwait 3\n'})
+        self.assertAlmostEqual(estimator.estimate('job.gwl', resolver),
+                               2 + nanowrite_estimator.DEFAULT_PIEZO_SETTLING_TIME / 1000.0 + 3)
+
+    def test_estimate_is_never_negative(self):
+        estimator = nanowrite_estimator.WriteTimeEstimator({'constant': -10.0})
+        self.assertEqual(estimator.estimate_features({'constant': 1.0}), 0.0)
+
+    def test_calibration_fits_the_durations(self):
+        samples = [({'line_time': line_time, 'constant': 1.0}, 2 * line_time + 5) for line_time in range(1, 20)]
+        estimator = nanowrite_estimator.WriteTimeEstimator(regularization=1e-6)
+        self.assertEqual(estimator.calibrate(samples), len(samples))
+        coefficients = estimator.get_coefficients()
+        self.assertAlmostEqual(coefficients['line_time'], 2.0, places=3)
+        self.assertAlmostEqual(coefficients['constant'], 5.0, places=3)
+
+    def test_calibration_without_samples_keeps_the_defaults(self):
+        estimator = nanowrite_estimator.WriteTimeEstimator()
+        self.assertEqual(estimator.calibrate([]), 0)
+        self.assertEqual(estimator.get_coefficients(), dict(nanowrite_estimator.FEATURES))
+
+
+if __name__ == '__main__':
+    unittest.main()
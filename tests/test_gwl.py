@@ -0,0 +1,129 @@
+"""
+Tests of the streaming, parsing and validation of GWL files.
+"""
+
+import hashlib
+import io
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_gwl
+
+
+class ChunkTest(unittest.TestCase):
+
+    def test_string_is_split_into_chunks(self):
+        self.assertEqual(list(nanowrite_gwl.iter_chunks('abcdefg', chunk_size=3)), ['abc', 'def', 'g'])
+
+    def test_lines_get_a_newline(self):
+        self.assertEqual(list(nanowrite_gwl.iter_chunks(['a', 'b\n', u'c'])), ['a\n', 'b\n', u'c\n'])
+        self.assertEqual(list(nanowrite_gwl.iter_chunks([b'a'])), [b'a\n'])
+
+    def test_file_like_objects_are_read_in_chunks(self):
+        self.assertEqual(list(nanowrite_gwl.iter_chunks(io.BytesIO(b'abcde'), chunk_size=2)), [b'ab', b'cd', b'e'])
+
+    def test_join_chunks_keeps_the_type(self):
+        self.assertEqual(nanowrite_gwl.join_chunks(io.BytesIO(b'x\ny')), b'x\ny')
+        self.assertEqual(nanowrite_gwl.join_chunks([u'a', u'b']), u'a\nb\n')
+        self.assertEqual(nanowrite_gwl.join_chunks([]), '')
+
+    def test_safeguard(self):
+        content = ''.join(nanowrite_gwl.iter_with_safeguard('GotoX 1'))
+        self.assertEqual(content, nanowrite_gwl.add_safeguard('GotoX 1'))
+        self.assertTrue(content.startswith(nanowrite_gwl.SAFEGUARD_PREFIX))
+        self.assertTrue(content.endswith(nanowrite_gwl.SAFEGUARD_SUFFIX))
+
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_all_content_types_write_the_same_file(self):
+        path = os.path.join(self.folder, 'job.gwl')
+        digests = set()
+        for content in ('GotoX 1\n', u'GotoX 1\n', b'GotoX 1\n', ['GotoX 1'], io.BytesIO(b'GotoX 1\n')):
+            hasher = hashlib.sha1()
+            size = nanowrite_gwl.write_gwl_file(path, content, safeguard=True, hasher=hasher, chunk_size=3)
+            self.assertEqual(size, os.path.getsize(path))
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.assertEqual(hasher.hexdigest(), hashlib.sha1(data).hexdigest())
+            digests.add(hasher.hexdigest())
+        self.assertEqual(len(digests), 1)
+
+    def test_bundle_stays_in_the_folder(self):
+        start_path = nanowrite_gwl.write_gwl_bundle(self.folder, 'job.gwl', {'job.gwl': 'include ../part.gwl',
+                                                                             '../part.gwl': 'Write'})
+        self.assertEqual(start_path, os.path.join(self.folder, 'job.gwl'))
+        self.assertEqual(sorted(os.listdir(self.folder)), ['job.gwl', 'part.gwl'])
+        with open(os.path.join(self.folder, 'part.gwl')) as f:
+            self.assertEqual(f.read(), 'Write')
+
+
+class StatementTest(unittest.TestCase):
+
+    def test_includes_are_followed(self):
+        resolver = nanowrite_gwl.dict_resolver({'job.gwl': 'ScanSpeed 10 % comment\n\ninclude part.gwl\nWrite',
+                                                'part.gwl': '% only points\n1 2 3'})
+        self.assertEqual(list(nanowrite_gwl.iter_statements('job.gwl', resolver)),
+                         [('job.gwl', 1, 'ScanSpeed', ['10']), ('part.gwl', 2, None, (1.0, 2.0, 3.0)),
+                          ('job.gwl', 4, 'Write', [])])
+
+    def test_syntax_errors(self):
+        for files, message in (({'job.gwl': 'include part.gwl'}, 'job.gwl:1: File part.gwl not found'),
+                               ({'job.gwl': 'include job.gwl'}, 'job.gwl:1: Recursive include of job.gwl'),
+                               ({'job.gwl': '\n1 2 x'}, 'job.gwl:2: Malformed point: 1 2 x')):
+            with self.assertRaises(nanowrite_gwl.GWLSyntaxError) as context:
+                list(nanowrite_gwl.iter_statements('job.gwl', nanowrite_gwl.dict_resolver(files)))
+            self.assertEqual(str(context.exception), message)
+
+
+class ValidatorTest(unittest.TestCase):
+
+    def _validate(self, **gwl_files):
+        return nanowrite_gwl.validate('job.gwl', nanowrite_gwl.dict_resolver(gwl_files))
+
+    def test_bounds_include_offsets(self):
+        validator = self._validate(**{'job.gwl': '0 0 0\n1 2 3\nXOffset 10\n0 -1 0\nWrite'})
+        self.assertEqual(validator.errors, [])
+        self.assertEqual(validator.warnings, [])
+        self.assertEqual(validator.bounds, ((0.0, -1.0, 0.0), (10.0, 2.0, 3.0)))
+
+    def test_errors(self):
+        validator = self._validate(**{'job.gwl': 'ScanSpeed\nLaserPower high\n1 2\nWrite now'})
+        self.assertEqual(validator.errors, ['job.gwl:1: ScanSpeed expects 1 argument(s), got 0',
+                                            'job.gwl:2: LaserPower expects numeric arguments',
+                                            'job.gwl:3: Point needs 3 or 4 values, got 2',
+                                            'job.gwl:4: Write expects 0 argument(s), got 1'])
+        self.assertIsNone(validator.bounds)
+
+    def test_warnings(self):
+        validator = self._validate(**{'job.gwl': 'var $x = 1\nScanSpeed $x\n0 0 0'})
+        self.assertEqual(validator.errors, [])
+        self.assertTrue(validator.dynamic)
+        self.assertEqual(len(validator.warnings), 2)
+        self.assertTrue(validator.warnings[0].startswith('job.gwl:3: Points are never written'))
+
+    def test_syntax_errors_are_reported(self):
+        self.assertEqual(self._validate(**{'job.gwl': 'include missing.gwl'}).errors,
+                         ['job.gwl:1: File missing.gwl not found'])
+
+    def test_check_passes_the_statements_through(self):
+        statements = [('job.gwl', 1, None, (0.0, 0.0, 0.0)), ('job.gwl', 2, 'Write', [])]
+        validator = nanowrite_gwl.GWLValidator()
+        self.assertEqual(list(validator.check(iter(statements))), statements)
+        self.assertEqual(validator.bounds, ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
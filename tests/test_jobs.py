@@ -0,0 +1,66 @@
+"""
+Tests of the SQLite job history.
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_jobs
+
+
+class JobHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.history = nanowrite_jobs.JobHistory(os.path.join(self.folder, 'jobs.sqlite'))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.folder)
+
+    def test_job_lifecycle(self):
+        job_id = self.history.begin('file', digest='abc', name='job.gwl', submitted=10.0)
+        self.assertIsNone(self.history.get(job_id)['result'])
+
+        self.history.mark_started(job_id, started=12.0)
+        self.history.add_artifacts(job_id, ['a.png'])
+        self.history.add_artifacts(job_id, ['b.png'])
+        self.history.finish(job_id, 'done', finished=20.0)
+
+        job = self.history.get(job_id)
+        self.assertEqual((job['kind'], job['digest'], job['name'], job['result']), ('file', 'abc', 'job.gwl', 'done'))
+        self.assertEqual(job['duration'], 8.0)
+        self.assertEqual(job['artifacts'], ['a.png', 'b.png'])
+        self.assertIsNone(self.history.get(job_id + 1))
+
+    def test_query_filters_and_order(self):
+        for submitted, kind, result in ((1.0, 'mini', 'done'), (2.0, 'file', 'error'), (3.0, 'file', 'done')):
+            job_id = self.history.begin(kind, submitted=submitted)
+            self.history.finish(job_id, result, started=submitted, finished=submitted + 1)
+
+        self.assertEqual([job['submitted'] for job in self.history.query()], [3.0, 2.0, 1.0])
+        self.assertEqual([job['submitted'] for job in self.history.query(kind='file', result='done')], [3.0])
+        self.assertEqual([job['submitted'] for job in self.history.query(since=2.0, until=3.0)], [2.0])
+        self.assertEqual(len(self.history.query(limit=2)), 2)
+
+    def test_durations_and_calibration_samples(self):
+        self.history.set_features('abc', {'points': 3.0})
+        for started, finished, result in ((0.0, 5.0, 'done'), (10.0, 17.0, 'done'), (20.0, 21.0, 'aborted')):
+            job_id = self.history.begin('file', digest='abc', submitted=started)
+            self.history.finish(job_id, result, started=started, finished=finished)
+        self.history.begin('file', digest='abc')
+
+        self.assertEqual(self.history.durations('abc'), [7.0, 5.0])
+        self.assertEqual(self.history.get_features('abc'), {'points': 3.0})
+        self.assertIsNone(self.history.get_features('def'))
+        self.assertEqual(self.history.calibration_samples(), [({'points': 3.0}, 7.0), ({'points': 3.0}, 5.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
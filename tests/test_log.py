@@ -0,0 +1,78 @@
+"""
+Tests of the incremental reader of the NanoWrite messages log.
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if sys.version_info[0] == 2:
+    import nanowrite_log
+
+
+def _line(second, message):
+    return '2013-07-08T16:17:%02d.000+0200 %s\r\n' % (second, message)
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'The log reader requires Python 2')
+class LogReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.reader = nanowrite_log.LogReader(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _append(self, data, name='2013-07-08_16-17-00_Messages.log'):
+        with open(os.path.join(self.folder, name), 'ab') as f:
+            f.write(data)
+
+    def test_lines_are_read_incrementally(self):
+        self._append(_line(0, 'Started') + _line(1, 'Line 1'))
+        self.assertEqual(self.reader.update(), 2)
+
+        # Incomplete lines are only parsed once they are complete
+        self._append(' ' * 29 + 'continued\r\n' + _line(2, 'Job')[:20])
+        self.assertEqual(self.reader.update(), 2)
+        self._append(_line(2, 'Job')[20:])
+
+        entries = self.reader.get_entries()
+        self.assertEqual([message for _, message in entries], ['Started\n', 'Line 1\ncontinued\n', 'Job\n'])
+        self.assertEqual(entries[2][0].second, 2)
+        self.assertEqual(self.reader.get_last_entry()[1], 'Job\n')
+        self.assertEqual([message for _, message in self.reader.get_entries_from_last('Line')],
+                         ['Line 1\ncontinued\n', 'Job\n'])
+
+    def test_cursor(self):
+        self._append(_line(0, 'a') + _line(1, 'b') + _line(2, 'c'))
+        page = self.reader.get_since(max_entries=2)
+        self.assertEqual((page['start'], page['total'], page['reset']), (0, 3, True))
+        self.assertEqual([message for _, message in page['entries']], ['a\n', 'b\n'])
+
+        # The last entry is returned again, since it might still grow
+        page = self.reader.get_since(page['cursor'])
+        self.assertEqual((page['start'], page['reset']), (2, False))
+        self.assertEqual([message for _, message in page['entries']], ['c\n'])
+        page = self.reader.get_since(page['cursor'])
+        self.assertEqual((page['start'], page['reset']), (2, False))
+
+    def test_new_log_file_resets_the_cursor(self):
+        self._append(_line(0, 'a'))
+        cursor = self.reader.get_since()['cursor']
+        os.remove(os.path.join(self.folder, '2013-07-08_16-17-00_Messages.log'))
+        self._append(_line(0, 'b'), name='2013-07-09_16-17-00_Messages.log')
+
+        page = self.reader.get_since(cursor)
+        self.assertTrue(page['reset'])
+        self.assertEqual(page['log_id'], '2013-07-09_16-17-00_Messages.log')
+        self.assertEqual([message for _, message in page['entries']], ['b\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
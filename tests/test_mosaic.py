@@ -0,0 +1,130 @@
+"""
+Tests of stitching camera frames into an overview.
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    import nanowrite_mosaic
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Size of the frames, whose overlaps must contain enough structure for the correlation
+HEIGHT, WIDTH = 240, 320
+
+
+def _make_sample(height=700, width=900):
+    """
+    Smooth random texture, which correlates well but not periodically.
+    """
+    random = np.random.RandomState(1)
+    frequencies = np.hypot(*np.meshgrid(np.fft.fftfreq(width), np.fft.fftfreq(height)))
+    sample = np.abs(np.fft.ifft2(np.fft.fft2(random.rand(height, width)) * (frequencies < 0.05)))
+    return (sample - sample.min()) / (sample.max() - sample.min()) * 255
+
+
+@unittest.skipIf(np is None, 'numpy is not available')
+class MosaicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sample = _make_sample()
+
+    def _add_frame(self, mosaic, true_corner, nominal_corner):
+        """
+        Add the frame at a true upper left corner, whose stage position claims another corner.
+        """
+        x, y = true_corner
+        center = ((nominal_corner[0] + WIDTH / 2.0) * mosaic.pixel_size,
+                  (nominal_corner[1] + HEIGHT / 2.0) * mosaic.pixel_size)
+        return mosaic.add_frame(self.sample[y:y + HEIGHT, x:x + WIDTH], center)
+
+    def test_offsets_are_second_minus_first(self):
+        for residual in ((-5, 3), (5, -3), (0, 0)):
+            mosaic = nanowrite_mosaic.Mosaic(pixel_size=0.5)
+            self._add_frame(mosaic, (20, 30), (20, 30))
+            self._add_frame(mosaic, (220 + residual[0], 30 + residual[1]), (220, 30))
+
+            offsets, peaks = mosaic.measure_offsets([(0, 1)])
+            # Negative residuals are not confused with shifts by almost a whole frame
+            self.assertEqual(tuple(offsets[0]), (200.0 + residual[0], residual[1]))
+            self.assertGreater(peaks[0], 0.05)
+
+            offsets, peaks = mosaic.measure_offsets([(1, 0)])
+            self.assertEqual(tuple(offsets[0]), (-200.0 - residual[0], -residual[1]))
+
+    def test_offsets_beyond_max_error_have_no_peak(self):
+        mosaic = nanowrite_mosaic.Mosaic(pixel_size=1.0)
+        self._add_frame(mosaic, (20, 30), (20, 30))
+        self._add_frame(mosaic, (212, 38), (220, 30))
+        self.assertEqual(mosaic.measure_offsets([(0, 1)], max_error=5.0)[1][0], 0.0)
+        self.assertGreater(mosaic.measure_offsets([(0, 1)], max_error=10.0)[1][0], 0.05)
+
+    def _grid(self):
+        random = np.random.RandomState(2)
+        mosaic = nanowrite_mosaic.Mosaic(pixel_size=1.0)
+        truth = list()
+        for row in range(2):
+            for column in range(3):
+                nominal = (10 + column * 250, 10 + row * 190)
+                true = (nominal[0] + random.randint(-6, 7), nominal[1] + random.randint(-6, 7))
+                self._add_frame(mosaic, true, nominal)
+                truth.append(true)
+        return mosaic, np.array(truth, dtype=np.float64)
+
+    def test_chunk_size_does_not_change_the_offsets(self):
+        mosaic, _ = self._grid()
+        pairs = mosaic.find_pairs()
+        self.assertEqual(len(pairs), 11)
+        offsets, peaks = mosaic.measure_offsets(pairs, chunk_size=3)
+        all_offsets, all_peaks = mosaic.measure_offsets(pairs, chunk_size=len(pairs))
+        self.assertTrue(np.array_equal(offsets, all_offsets))
+        self.assertTrue(np.allclose(peaks, all_peaks, atol=1e-4))
+
+    def test_refine_recovers_the_true_positions(self):
+        mosaic, truth = self._grid()
+        self.assertGreater(mosaic.refine(), 0)
+        nominal_error = (np.array(mosaic._nominal) - mosaic._nominal[0]) - (truth - truth[0])
+        error = (mosaic.positions - mosaic.positions[0]) - (truth - truth[0])
+        self.assertGreater(np.abs(nominal_error).max(), 5.0)
+        self.assertLess(np.abs(error).max(), 1.5)
+
+    def test_empty_mosaic(self):
+        with self.assertRaises(ValueError):
+            nanowrite_mosaic.Mosaic(1.0).find_pairs()
+
+    @unittest.skipIf(Image is None, 'PIL is not available')
+    def test_pyramid_matches_the_overview(self):
+        mosaic, _ = self._grid()
+        mosaic.refine()
+        overview, origin = mosaic.blend()
+
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'pyramid')
+            mosaic.save_pyramid(path, tile_size=64)
+            pyramid = nanowrite_mosaic.TilePyramid(path)
+            region = pyramid.read_region(50, 40, 150, 100).astype(np.float64)
+            expected = np.clip(np.round(overview[40:140, 50:200]), 0, 255)
+            self.assertLessEqual(np.abs(region - expected).max(), 1.0)
+            self.assertEqual(pyramid.read_region(0, 0, 32, 16, level=1).shape, (16, 32))
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests of reading text fields from a screenshot.
+"""
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    import nanowrite_ocr
+
+
+FIELD_BOX = (-45, -8, 45, 8)
+POSITIONS = {'x': (720, 390), 'y': (720, 410), 'time': (820, 435)}
+
+
+def _make_font():
+    """
+    Random glyphs of 9x5 pixels, each with ink in every column, so characters are only split between each other.
+    """
+    random = np.random.RandomState(0)
+    font = dict()
+    for character in nanowrite_ocr.CHARACTERS:
+        glyph = random.rand(9, 5) > 0.5
+        glyph[0, :] = True
+        glyph[8, 0] = True
+        font[character] = glyph
+    font['.'] = np.zeros((9, 2), bool)
+    font['.'][7:9, :] = True
+    font['-'] = np.zeros((9, 5), bool)
+    font['-'][4, :] = True
+    return font
+
+
+def _draw(image, font, position, text):
+    x, y = position[0] - 40, position[1] - 5
+    for character in text:
+        glyph = font[character]
+        image[y:y + 9, x:x + glyph.shape[1]][glyph] = 20
+        x += glyph.shape[1] + 1
+
+
+def _screenshot(font, texts):
+    image = np.full((500, 1000), 230.0, np.float32)
+    for name, text in texts.items():
+        _draw(image, font, POSITIONS[name], text)
+    return image
+
+
+@unittest.skipIf(np is None, 'numpy is not available')
+class FieldReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.font = _make_font()
+        self.learned = _screenshot(self.font, {'x': '0123.45', 'y': '-678.9', 'time': '12:34:56'})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _learn(self, reader):
+        for name, text in (('x', '0123.45'), ('y', '-678.9'), ('time', '12:34:56')):
+            self.assertTrue(reader.learn(self.learned, POSITIONS[name], text))
+
+    def test_nothing_is_read_without_glyphs(self):
+        reader = nanowrite_ocr.FieldReader(FIELD_BOX)
+        self.assertEqual(reader.read_fields(self.learned, POSITIONS)['x'], ('', 0.0, 0.0))
+        self.assertFalse(reader.knows('0'))
+
+    def test_learned_glyphs_read_new_fields(self):
+        reader = nanowrite_ocr.FieldReader(FIELD_BOX)
+        self._learn(reader)
+        self.assertEqual(reader.get_characters(), ''.join(sorted(nanowrite_ocr.CHARACTERS)))
+        self.assertTrue(reader.knows('0123456789.-'))
+
+        screenshot = _screenshot(self.font, {'x': '98.765', 'y': '-0.5', 'time': '3:21:09'})
+        fields = reader.read_fields(screenshot, POSITIONS)
+        self.assertEqual(dict((name, text) for name, (text, _, _) in fields.items()),
+                         {'x': '98.765', 'y': '-0.5', 'time': '3:21:09'})
+        for _, confidence, margin in fields.values():
+            self.assertTrue(reader.is_confident(confidence, margin))
+
+    def test_text_which_does_not_match_the_field_is_not_learned(self):
+        reader = nanowrite_ocr.FieldReader(FIELD_BOX)
+        self.assertFalse(reader.learn(self.learned, POSITIONS['x'], '0123.4'))
+        self.assertFalse(reader.learn(self.learned, POSITIONS['x'], '0123,45'))
+        self.assertEqual(reader.get_characters(), '')
+
+    def test_glyph_set_is_saved_and_loaded(self):
+        glyph_file = os.path.join(self.folder, 'data', 'glyphs.npz')
+        reader = nanowrite_ocr.FieldReader(FIELD_BOX, glyph_file)
+        self._learn(reader)
+        reader.save()
+
+        loaded = nanowrite_ocr.FieldReader(FIELD_BOX, glyph_file)
+        self.assertEqual(loaded.get_characters(), reader.get_characters())
+        screenshot = _screenshot(self.font, {'x': '1.5'})
+        self.assertEqual(loaded.read_fields(screenshot, {'x': POSITIONS['x']})['x'][0], '1.5')
+
+
+if __name__ == '__main__':
+    unittest.main()
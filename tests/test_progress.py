@@ -0,0 +1,106 @@
+"""
+Tests of the background progress sampler.
+"""
+
+import datetime
+import os
+import os.path
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_gwl
+import nanowrite_progress
+
+
+class FakeNanoWrite(object):
+    """
+    Stand-in for a NanoWrite instance with a given command log and progress fields.
+    """
+
+    def __init__(self):
+        self._ui_lock = threading.RLock()
+        self.running = True
+        self.command_log = list()
+        self.job_estimate = None
+        self.progress_time = 30.0
+        self.progress_estimate = 120.0
+        self.ui_reads = 0
+
+    def is_job_running(self):
+        return self.running
+
+    def get_command_log(self):
+        return self.command_log
+
+    def get_job_estimate(self):
+        return self.job_estimate
+
+    def get_progress_time(self):
+        self.ui_reads += 1
+        return self.progress_time
+
+    def get_progress_estimate(self):
+        return self.progress_estimate
+
+    def show_camera(self):
+        pass
+
+
+class ProgressSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nanowrite = FakeNanoWrite()
+        self.sampler = nanowrite_progress.ProgressSampler(self.nanowrite, ui_interval=1000.0)
+
+    def _start_job(self, seconds_ago, *messages):
+        start = datetime.datetime.now() - datetime.timedelta(seconds=seconds_ago)
+        self.nanowrite.command_log = [(start, 'MessageOut %s' % nanowrite_gwl.SEPARATOR)]
+        self.nanowrite.command_log.extend((start, message) for message in messages)
+
+    def test_log_is_preferred_over_the_user_interface(self):
+        self._start_job(10, 'Estimated time: 0:01:40')
+        sample = self.sampler.sample()
+        self.assertEqual((sample.source, sample.estimate), ('log', 100.0))
+        self.assertAlmostEqual(sample.elapsed, 10.0, places=0)
+        self.assertEqual(self.nanowrite.ui_reads, 0)
+
+        progress = self.sampler.get_progress()
+        self.assertTrue(progress['running'])
+        self.assertAlmostEqual(progress['eta'], 90.0, places=0)
+        self.assertAlmostEqual(progress['fraction'], 0.1, places=2)
+
+    def test_write_time_estimate_is_used_without_log_estimate(self):
+        self.nanowrite.job_estimate = 50.0
+        self._start_job(10)
+        self.assertEqual(self.sampler.sample().estimate, 50.0)
+
+    def test_user_interface_is_read_at_a_low_rate(self):
+        self.sampler = nanowrite_progress.ProgressSampler(self.nanowrite, ui_interval=0.0)
+        sample = self.sampler.sample()
+        self.assertEqual((sample.source, sample.elapsed, sample.estimate), ('ui', 30.0, 120.0))
+
+        # The user interface is busy, the elapsed time is extrapolated from the last sample
+        with self.nanowrite._ui_lock:
+            thread = threading.Thread(target=self.sampler.sample)
+            thread.start()
+            thread.join()
+        samples = self.sampler.get_samples()
+        self.assertEqual(len(samples), 2)
+        self.assertGreaterEqual(samples[1].elapsed, 30.0)
+        self.assertEqual(self.nanowrite.ui_reads, 1)
+
+    def test_finished_job_resets_the_progress(self):
+        self._start_job(10, 'Estimated time: 0:01:40')
+        self.sampler.sample()
+        self.nanowrite.running = False
+        self.assertIsNone(self.sampler.sample())
+        self.assertEqual(self.sampler.get_progress(), {'running': False, 'timestamp': None, 'elapsed': None,
+                                                       'estimate': None, 'eta': None, 'fraction': None,
+                                                       'source': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
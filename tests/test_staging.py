@@ -0,0 +1,142 @@
+"""
+Tests of the pipeline which starts staged jobs.
+"""
+
+import os
+import os.path
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_staging
+
+
+class FakeNanoWrite(object):
+    """
+    Stand-in for a NanoWrite instance, whose jobs finish when the test says so.
+    """
+
+    class ExecutionError(Exception):
+        pass
+
+    class NotReady(Exception):
+        pass
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.finished = True
+        self.started = list()
+        self.discarded = list()
+        self.failing = set()
+        self.not_ready = 0
+        self.last_error = None
+
+    def get_last_job_error(self):
+        with self.lock:
+            return self.last_error
+
+    def fail_job(self, message):
+        with self.lock:
+            self.last_error = {'count': self.last_error['count'] + 1 if self.last_error else 1, 'message': message}
+
+    def has_finished(self):
+        with self.lock:
+            return self.finished
+
+    def execute_staged_job(self, stage_id, invalidate_piezo=True):
+        with self.lock:
+            if self.not_ready > 0:
+                self.not_ready -= 1
+                raise FakeNanoWrite.NotReady()
+            if stage_id in self.failing:
+                raise IOError('Loading %s failed' % stage_id)
+            self.started.append(stage_id)
+            self.finished = False
+
+    def discard_staged_job(self, stage_id):
+        with self.lock:
+            self.discarded.append(stage_id)
+
+    def finish_job(self):
+        with self.lock:
+            self.finished = True
+
+
+class StagingPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nanowrite = FakeNanoWrite()
+        self.pipeline = nanowrite_staging.StagingPipeline(self.nanowrite, poll_interval=0.005)
+        self.pipeline.start()
+
+    def tearDown(self):
+        self.pipeline.stop()
+        self.pipeline.join(1.0)
+
+    def _wait_for(self, condition, timeout=2.0):
+        end = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), end, 'Timeout')
+            time.sleep(0.005)
+
+    def test_jobs_start_when_the_previous_one_has_finished(self):
+        self.nanowrite.not_ready = 2
+        self.assertEqual(self.pipeline.enqueue('a'), 1)
+        self.assertEqual(self.pipeline.enqueue('b'), 2)
+        self._wait_for(lambda: self.nanowrite.started == ['a'])
+
+        time.sleep(0.05)
+        self.assertEqual(self.pipeline.get_status()['queued'], ['b'])
+        self.nanowrite.finish_job()
+        self._wait_for(lambda: self.nanowrite.started == ['a', 'b'])
+
+        status = self.pipeline.get_status()
+        self.assertEqual([job['stage_id'] for job in status['started']], ['a', 'b'])
+        self.assertEqual((status['queued'], status['errors'], status['halted']), ([], [], None))
+
+    def test_removed_jobs_are_not_started(self):
+        self.nanowrite.finished = False
+        self.pipeline.enqueue('a')
+        self.pipeline.enqueue('b')
+        self.assertTrue(self.pipeline.remove('a'))
+        self.assertFalse(self.pipeline.remove('a'))
+        self.nanowrite.finish_job()
+        self._wait_for(lambda: self.nanowrite.started == ['b'])
+
+    def test_failed_start_halts_until_resumed(self):
+        self.nanowrite.failing.add('a')
+        self.pipeline.enqueue('a')
+        self.pipeline.enqueue('b')
+        self._wait_for(lambda: self.pipeline.get_status()['halted'] is not None)
+
+        status = self.pipeline.get_status()
+        self.assertEqual(status['halted']['stage_id'], 'a')
+        self.assertEqual(status['queued'], ['b'])
+        self.assertEqual(self.nanowrite.discarded, ['a'])
+        self.assertEqual(self.nanowrite.started, [])
+
+        self.pipeline.resume()
+        self._wait_for(lambda: self.nanowrite.started == ['b'])
+
+    def test_failed_job_halts_until_resumed(self):
+        self.pipeline.enqueue('a')
+        self._wait_for(lambda: self.nanowrite.started == ['a'])
+        self.nanowrite.fail_job('!!! Error')
+        self.nanowrite.finish_job()
+        self.pipeline.enqueue('b')
+        self._wait_for(lambda: self.pipeline.get_status()['halted'] is not None)
+
+        status = self.pipeline.get_status()
+        self.assertEqual((status['halted']['stage_id'], status['halted']['message']), (None, '!!! Error'))
+        time.sleep(0.05)
+        self.assertEqual(self.nanowrite.started, ['a'])
+
+        self.pipeline.resume()
+        self._wait_for(lambda: self.nanowrite.started == ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
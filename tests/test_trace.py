@@ -0,0 +1,170 @@
+"""
+Tests of recording and replaying traces, including the replay of the wrapper itself.
+"""
+
+import gzip
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if sys.version_info[0] == 2:
+    import nanowrite
+    import nanowrite_log
+    import nanowrite_trace
+
+
+class FakeImage(object):
+    mode = 'L'
+    size = (2, 1)
+
+    def tobytes(self):
+        return b'\x00\xff'
+
+
+class FakeBackend(object):
+    """
+    Backend of a NanoWrite instance, which shows the same values in all text fields.
+    """
+
+    def __init__(self, clipboard='12.5'):
+        self.clipboard = clipboard
+
+    def window_text(self):
+        return 'NanoWrite 1.7.5'
+
+    def set_foreground(self):
+        pass
+
+    def click(self, coords):
+        pass
+
+    def double_click(self, coords):
+        pass
+
+    def type_keys(self, keys):
+        pass
+
+    def set_clipboard_text(self, text):
+        pass
+
+    def get_clipboard_text(self):
+        return self.clipboard
+
+    def get_pixel(self, coords):
+        return coords[0] % 256, 0, 0
+
+    def capture_image(self):
+        return FakeImage()
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'Tracing requires Python 2')
+class TraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'trace.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        writer = nanowrite_trace.TraceWriter(self.path, version='1.7.5')
+        backend = nanowrite_trace.RecordingBackend(FakeBackend(), writer)
+        backend.get_pixel((1, 2))
+        backend.capture_image()
+        backend.capture_image()
+        writer.record_log('messages.log', 0, b'data\r\n')
+        writer.record_action(writer._start, 0.5, 'get_stage_position', (), {'timeout': (1, 2)}, 'IOError: nope')
+        writer.close()
+
+        with gzip.open(self.path, 'rb') as f:
+            events = [json.loads(line) for line in f]
+        # Identical screenshots are stored once
+        self.assertEqual([event[0] for event in events], ['h', 'c', 'b', 'c', 'c', 'l', 'a'])
+
+        trace = nanowrite_trace.Trace(self.path)
+        self.assertEqual(trace.header['version'], '1.7.5')
+        self.assertEqual([(call.method, call.args) for call in trace.calls],
+                         [('get_pixel', ((1, 2),)), ('capture_image', ()), ('capture_image', ())])
+        self.assertEqual(trace.decode_result(trace.calls[0]), (1, 0, 0))
+        self.assertEqual(trace.log_reads[0][1:], ('messages.log', 0, b'data\r\n'))
+        self.assertEqual(trace.actions[0][1:], (0.5, 'get_stage_position', (), {'timeout': (1, 2)}, 'IOError: nope'))
+
+    def test_replay_backend(self):
+        writer = nanowrite_trace.TraceWriter(self.path)
+        backend = nanowrite_trace.RecordingBackend(FakeBackend(), writer)
+        for clipboard in ('1', '2'):
+            backend.backend.clipboard = clipboard
+            backend.get_clipboard_text()
+        writer.record_call(writer._start, 0.0, 'click', ((1, 1),), error='IOError: nope')
+        writer.close()
+
+        replay_backend = nanowrite_trace.ReplayBackend(self.path, realtime=False)
+        self.assertEqual([replay_backend.get_clipboard_text() for _ in range(3)], ['1', '2', '2'])
+        self.assertEqual(replay_backend.unmatched['get_clipboard_text'], 1)
+        with self.assertRaises(nanowrite_trace.ReplayBackend.RecordedError):
+            replay_backend.click((1, 1))
+        with self.assertRaises(nanowrite_trace.ReplayBackend.UnknownCall):
+            replay_backend.get_pixel((1, 1))
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'The wrapper requires Python 2')
+class WrapperReplayTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.folder, 'trace.jsonl.gz')
+
+        wrapper = nanowrite.NanoWrite(backend=FakeBackend('0:01:02'), log_reader=nanowrite_log.LogReader(cls.folder),
+                                      trace=cls.path, read_fields_from_screen=False, data_dir=cls.folder)
+        assert wrapper.get_progress_time() == 62
+        wrapper.show_camera()
+        wrapper._backend.backend.clipboard = 'invalid'
+        try:
+            wrapper.get_progress_time()
+        except ValueError:
+            pass
+        wrapper.stop_trace()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def _replay(self, trace):
+        return nanowrite_trace.replay(trace, realtime=False, read_fields_from_screen=False, data_dir=self.folder)
+
+    def test_outermost_actions_are_recorded(self):
+        trace = nanowrite_trace.Trace(self.path)
+        self.assertEqual([(action.method, action.error is None) for action in trace.actions],
+                         [('get_progress_time', True), ('show_camera', True), ('get_progress_time', False)])
+        self.assertEqual(trace.calls[0].method, 'window_text')
+
+    def test_replay_matches_the_recording(self):
+        # The replay is recorded again, which must not add any calls of the backend
+        record = os.path.join(self.folder, 'replay.jsonl.gz')
+        report = nanowrite_trace.replay(self.path, realtime=False, record=record, read_fields_from_screen=False,
+                                        data_dir=self.folder)
+        self.assertEqual((report['mismatches'], report['unmatched_calls']), (0, 0))
+        self.assertEqual(report['actions']['get_progress_time']['count'], 2)
+        self.assertEqual(len(nanowrite_trace.Trace(record).actions), 3)
+
+    def test_mismatches_are_reported(self):
+        trace = nanowrite_trace.Trace(self.path)
+        trace.actions[1] = trace.actions[1]._replace(error='IOError: nope')
+        self.assertEqual(self._replay(trace)['mismatches'], 1)
+
+        trace = nanowrite_trace.Trace(self.path)
+        trace.calls.remove(next(call for call in trace.calls if call.method == 'double_click'))
+        report = self._replay(trace)
+        self.assertEqual((report['mismatches'], report['unmatched_calls']), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
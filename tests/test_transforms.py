@@ -0,0 +1,96 @@
+"""
+Tests of the transforms between the coordinate frames.
+"""
+
+import os
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nanowrite_transforms
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+PIEZO_RANGE = (300, 300, 300)
+
+SAMPLE_TO_STAGE = nanowrite_transforms.AffineTransform([[0.0, -2.0, 0.0, 10.0],
+                                                         [1.0, 0.0, 0.5, -4.0],
+                                                         [0.0, 0.0, 3.0, 1.5],
+                                                         [0.0, 0.0, 0.0, 1.0]])
+
+
+class AffineTransformTest(unittest.TestCase):
+
+    def assertPointEqual(self, first, second):
+        self.assertEqual(len(first), len(second))
+        for a, b in zip(first, second):
+            self.assertAlmostEqual(a, b)
+
+    def test_inverse_round_trip(self):
+        point = (1.0, -2.0, 3.5)
+        self.assertPointEqual(SAMPLE_TO_STAGE.inverse().apply_point(SAMPLE_TO_STAGE.apply_point(point)), point)
+        identity = SAMPLE_TO_STAGE.then(SAMPLE_TO_STAGE.inverse())
+        for row, expected in zip(identity.matrix, nanowrite_transforms.AffineTransform().matrix):
+            self.assertPointEqual(row, expected)
+
+    def test_then_applies_in_order(self):
+        transform = nanowrite_transforms.AffineTransform.translation((1, 2, 3)).then(
+            nanowrite_transforms.AffineTransform.scaling((2, 2, 2)))
+        self.assertPointEqual(transform.apply_point((0, 0, 0)), (2, 4, 6))
+
+    def test_vectors_ignore_translations(self):
+        transform = nanowrite_transforms.AffineTransform.translation((1, 2, 3))
+        self.assertPointEqual(transform.apply_vector((1, 1, 1)), (1, 1, 1))
+
+    def test_singular_transform_has_no_inverse(self):
+        with self.assertRaises(ZeroDivisionError):
+            nanowrite_transforms.AffineTransform.scaling((1, 0, 1)).inverse()
+
+    def test_inversions_are_their_own_inverse(self):
+        for transform in (nanowrite_transforms.piezo_inversion(PIEZO_RANGE, True),
+                          nanowrite_transforms.stage_inversion(True)):
+            self.assertPointEqual(transform.apply_point(transform.apply_point((10, 20, 30))), (10, 20, 30))
+        self.assertPointEqual(nanowrite_transforms.piezo_inversion(PIEZO_RANGE, True).apply_point((10, 20, 30)),
+                              (290, 20, 270))
+        self.assertPointEqual(nanowrite_transforms.stage_inversion(True).apply_vector((1, 2, 3)), (1, 2, -3))
+        self.assertPointEqual(nanowrite_transforms.piezo_inversion(PIEZO_RANGE, False).apply_point((1, 2, 3)),
+                              (1, 2, 3))
+
+
+class FramesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = nanowrite_transforms.Frames(PIEZO_RANGE, True, stage_position=(1000, 2000, 50),
+                                                  sample_to_stage=SAMPLE_TO_STAGE)
+
+    def test_conversions(self):
+        self.assertEqual(self.frames.convert_point((10, 20, 30), 'piezo', 'stage'), (1010, 2020, 80))
+        self.assertEqual(self.frames.convert_point((10, 20, 30), 'inverted_piezo', 'piezo'), (290, 20, 270))
+
+    def test_round_trips_through_all_frames(self):
+        point = (12.0, -3.0, 7.5)
+        for source in nanowrite_transforms.FRAMES:
+            for target in nanowrite_transforms.FRAMES:
+                converted = self.frames.convert_point(point, source, target)
+                for a, b in zip(self.frames.convert_point(converted, target, source), point):
+                    self.assertAlmostEqual(a, b)
+
+    @unittest.skipIf(np is None, 'numpy is not available')
+    def test_arrays_match_single_points(self):
+        points = np.random.RandomState(0).uniform(-100, 100, (4, 5, 3))
+        converted = self.frames.convert(points, 'sample', 'inverted_piezo')
+        self.assertEqual(converted.shape, points.shape)
+        self.assertTrue(np.allclose(converted[2, 3], self.frames.convert_point(points[2, 3], 'sample',
+                                                                               'inverted_piezo')))
+        vectors = self.frames.get('sample', 'stage').apply_vectors(points)
+        self.assertTrue(np.allclose(vectors[1, 1], SAMPLE_TO_STAGE.apply_vector(points[1, 1])))
+
+
+if __name__ == '__main__':
+    unittest.main()